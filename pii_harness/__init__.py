@@ -0,0 +1,37 @@
+"""各检测器共用的数据集扫描框架: 流式读取, 分批, 断点续跑, 进程池, 预筛与去重。
+
+每个后端只需实现一个 Detector 子类, 然后调用 main(DetectorClass)。
+"""
+from .common import (
+    batched,
+    build_resume_list,
+    data_file_path,
+    ensure_dir,
+    iter_batches,
+    iter_dataset,
+    result_dir,
+    result_path_for,
+    update_result,
+    write_result,
+)
+from .detector import Detector
+from .engine import main, process_batches_for_file
+from .token_classification import TokenClassificationDetector, split_inputs_if_long
+
+__all__ = [
+    "Detector",
+    "TokenClassificationDetector",
+    "batched",
+    "build_resume_list",
+    "data_file_path",
+    "ensure_dir",
+    "iter_batches",
+    "iter_dataset",
+    "main",
+    "process_batches_for_file",
+    "result_dir",
+    "result_path_for",
+    "split_inputs_if_long",
+    "update_result",
+    "write_result",
+]
@@ -0,0 +1,192 @@
+import gzip
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from itertools import islice
+
+from .manifest import get_manifest, read_progress, record_progress
+
+
+def text_chars(item: Optional[str]) -> int:
+    return len(item or "")
+
+
+def batched(
+    iterable: Iterable,
+    n: int,
+    max_chars: int = 0,
+    size: Callable[[Any], int] = text_chars,
+) -> Iterable[List]:
+    """等价于流式 chunks(iterable, n)。
+    max_chars > 0 时累计字符数超过 max_chars 也会结束当前批次, 单个超长文档独占一批。
+    size 给出每个元素的字符数, 元素不是文本时 (如 (行号, 文本)) 需要指定。"""
+    it = iter(iterable)
+    if max_chars <= 0:
+        while True:
+            chunk = list(islice(it, n))
+            if not chunk:
+                return
+            yield chunk
+    chunk = []
+    chars = 0
+    for item in it:
+        item_chars = size(item)
+        if chunk and chars + item_chars > max_chars:
+            yield chunk
+            chunk, chars = [], 0
+        chunk.append(item)
+        chars += item_chars
+        if len(chunk) >= n:
+            yield chunk
+            chunk, chars = [], 0
+    if chunk:
+        yield chunk
+
+
+def iter_batches(
+    iterable: Iterable, n: int, max_chars: int = 0, skip: int = 0
+) -> Iterable[List]:
+    """跳过前 skip 个批次后分批。分批只取决于 (n, max_chars) 和数据, 续跑时重放前 skip 个批次即可定位,
+    所以续跑时 batch_size 和 max_chars 都要与之前一致。"""
+    it = iter(iterable)
+    if max_chars <= 0:
+        # 只按文档数分批时直接跳过 skip * n 个文档
+        return batched(islice(it, skip * n, None), n)
+    batches = batched(it, n, max_chars)
+    for _ in islice(batches, skip):
+        pass
+    return batches
+
+
+# 确保 path 存在
+def ensure_dir(path: str) -> None:
+    os.makedirs(path, exist_ok=True)
+
+
+def write_result(result_file_path: str, result_data: Dict) -> None:
+    """先写临时文件再替换, 中断时不会留下写了一半的结果; 随后更新进度清单"""
+    tmp_path = result_file_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as wf:
+        json.dump(result_data, wf, indent=4)
+    os.replace(tmp_path, result_file_path)
+    record_progress(
+        result_file_path, result_data["batch_cnt"], result_data["completed"]
+    )
+
+
+def update_result(
+    result_file_path: str,
+    batch_cnt: int,
+    cur_batch_result: Dict[str, int],
+    completed: bool = False,
+    audit: Optional[Dict] = None,
+) -> None:
+    """每个文件仅由一个进程负责，避免并发写入冲突。
+    audit 为预筛抽检批次的 {"full": ..., "cascade": ...} 计数。"""
+    if not os.path.exists(result_file_path):
+        result_data = {"batches": {}, "batch_cnt": 0, "completed": False}
+    else:
+        with open(result_file_path, "r", encoding="utf-8") as rf:
+            try:
+                result_data = json.load(rf)
+            # 有时候出错中断后, 会出现json为空的情况
+            except json.JSONDecodeError:
+                result_data = {"batches": {}, "batch_cnt": 0, "completed": False}
+
+    if completed == True:
+        result_data["completed"] = True
+        write_result(result_file_path, result_data)
+        return
+
+    result_data["batch_cnt"] = batch_cnt
+    result_data["completed"] = completed
+    result_data["batches"][f"batch_{batch_cnt}"] = cur_batch_result
+    if audit is not None:
+        result_data.setdefault("prefilter_audit", {})[f"batch_{batch_cnt}"] = audit
+    write_result(result_file_path, result_data)
+
+
+# root 为检测器目录, 独立运行时即当前目录
+def result_dir(dataset_name: str, debug: bool, root: str = ".") -> str:
+    return os.path.join(root, "debug_results" if debug else "results", dataset_name)
+
+
+def result_path_for(
+    dataset_name: str, filename: str, debug: bool, root: str = "."
+) -> str:
+    ensure_dir(result_dir(dataset_name, debug, root))
+    return os.path.join(result_dir(dataset_name, debug, root), f"{filename}.json")
+
+
+# TODO 添加新的数据集时这里需要修改
+# 数据文件的后缀和存放文本的字段, 数据集名只要包含 key 即可 (如 dolma_2)
+DATASET_FORMATS = {
+    "c4": (".json.gz", "text"),
+    "dolma": (".json.gz", "text"),
+    "googlenq": (".jsonl.gz", "question_text"),
+}
+
+
+def dataset_format(dataset_name: str) -> Tuple[str, str]:
+    for key, fmt in DATASET_FORMATS.items():
+        if key in dataset_name:
+            return fmt
+    raise ValueError(f"unknown dataset: {dataset_name}")
+
+
+def data_file_path(data_path: str, dataset_name: str, filename: str) -> str:
+    suffix, _ = dataset_format(dataset_name)
+    return os.path.join(data_path, filename + suffix)
+
+
+# 流式读取数据集
+def iter_dataset(file_path: str, dataset_name: str, start_line: int = 0) -> Iterable[str]:
+    for _, text in iter_dataset_lines(file_path, dataset_name, start_line):
+        yield text
+
+
+def iter_dataset_lines(
+    file_path: str, dataset_name: str, start_line: int = 0
+) -> Iterable[Tuple[int, str]]:
+    """流式读取 (行号, 文本), 行号从 0 开始。前 start_line 行只解压不解析 json, 用于直接定位到 chunk 的起点"""
+    _, field = dataset_format(dataset_name)
+    try:
+        with gzip.open(file_path, "rt", encoding="utf-8") as f_in:
+            for line_no, line in enumerate(islice(f_in, start_line, None), start_line):
+                try:
+                    item = json.loads(line)
+                    yield line_no, item[field]
+                except Exception:
+                    continue
+    except Exception as e:
+        print(f"Error reading file: {file_path} in iter_dataset function. Error: {e}")
+
+
+def build_resume_list(
+    dataset_name: str, data_path: str, debug: bool, root: str = "."
+) -> List[Tuple[str, int]]:
+    """读取结果目录的进度清单，生成 (filename, resume_batch_cnt) 列表"""
+    rdir = result_dir(dataset_name, debug, root)
+    ensure_dir(rdir)
+
+    filename2batchcnt = read_progress(rdir)
+
+    # 被拆成 chunk 的文件 (<filename>.chunk<start>-<end>) 只能由 schedule.plan_tasks 续跑
+    chunked = set(get_manifest(rdir).read_chunks())
+    chunked.update(name.split(".chunk")[0] for name in filename2batchcnt if ".chunk" in name)
+
+    # 遍历数据目录
+    suffix, _ = dataset_format(dataset_name)
+    resume_list: List[Tuple[str, int]] = []
+    for file in os.listdir(data_path):
+        if not file.endswith(suffix):
+            continue
+        filename = file[: -len(suffix)]
+        if filename in chunked:
+            print(f"Skip {filename}: it was split into chunks.")
+            continue
+        resume_batch_cnt = filename2batchcnt.get(filename, 0)
+        if resume_batch_cnt != -1:
+            resume_list.append((filename, resume_batch_cnt))
+
+    return resume_list
@@ -0,0 +1,146 @@
+"""
+汇总各 worker 发布的运行指标 (见 pii_harness.telemetry): 显示整体吞吐,
+并标出 RSS 持续上涨 (疑似泄漏) 的 worker。
+
+在仓库根目录运行：
+
+python -m pii_harness.dashboard \
+  --metrics_dir presidio/results/c4/metrics \
+  --watch 30 \
+  --prometheus /var/lib/node_exporter/textfile/pii_harness.prom
+
+--prometheus 会额外写出 node_exporter textfile collector 格式的指标文件。
+"""
+from __future__ import annotations
+import argparse, json, os, time
+from typing import Dict, List, Optional, Tuple
+
+from .telemetry import PUBLISH_INTERVAL
+
+# worker 退出时发布 exited 快照; 被杀掉或崩溃的 worker 没有最终快照,
+# 超过 STALE_INTERVALS 个发布间隔没有心跳就视为已退出
+STALE_INTERVALS = 3
+# RSS 斜率超过该值 (MB/小时) 且采样跨度足够长时视为疑似泄漏
+LEAK_MB_PER_HOUR = 200.0
+LEAK_MIN_SPAN = 600
+
+
+def rss_slope(samples: List[Tuple[float, int]]) -> Optional[float]:
+    """RSS 采样的最小二乘斜率 (MB/小时), 采样跨度不足 LEAK_MIN_SPAN 秒时返回 None"""
+    if len(samples) < 3 or samples[-1][0] - samples[0][0] < LEAK_MIN_SPAN:
+        return None
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_r = sum(r for _, r in samples) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in samples)
+    cov = sum((t - mean_t) * (r - mean_r) for t, r in samples)
+    return cov / var_t * 3600 / 2**20
+
+
+def load_workers(metrics_dir: str) -> List[Dict]:
+    workers = []
+    for file in os.listdir(metrics_dir):
+        if not (file.startswith("worker_") and file.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(metrics_dir, file), "r", encoding="utf-8") as rf:
+                workers.append(json.load(rf))
+        except (OSError, json.JSONDecodeError):
+            continue
+    now = time.time()
+    for w in workers:
+        w["live"] = (
+            not w.get("exited", False)
+            and now - w["updated_at"] < STALE_INTERVALS * PUBLISH_INTERVAL
+        )
+        w["rss_slope"] = rss_slope(w["rss_samples"])
+        w["leak"] = w["rss_slope"] is not None and w["rss_slope"] > LEAK_MB_PER_HOUR
+        elapsed = max(w["updated_at"] - w["started_at"], 1e-9)
+        w["docs_per_s"] = w["docs"] / elapsed
+        w["chars_per_s"] = w["chars"] / elapsed
+    return sorted(workers, key=lambda w: w["pid"])
+
+
+def render(workers: List[Dict]) -> str:
+    live = [w for w in workers if w["live"]]
+    lines = [
+        f"workers: {len(live)} live / {len(workers)} total, "
+        f"docs: {sum(w['docs'] for w in workers)}, "
+        f"entities: {sum(w['entities'] for w in workers)}, "
+        f"errors: {sum(w['errors'] for w in workers)}",
+        f"throughput (live): {sum(w['docs_per_s'] for w in live):.1f} docs/s, "
+        f"{sum(w['chars_per_s'] for w in live) / 1e6:.2f} M chars/s",
+        f"{'pid':>8} {'docs':>10} {'docs/s':>8} {'RSS MB':>8} {'MB/h':>8} "
+        f"{'p50 s':>7} {'p90 s':>7} {'p99 s':>7}",
+    ]
+    for w in workers:
+        slope = "-" if w["rss_slope"] is None else f"{w['rss_slope']:.0f}"
+        flags = ("" if w["live"] else " exited") + (" LEAK?" if w["leak"] else "")
+        lines.append(
+            f"{w['pid']:>8} {w['docs']:>10} {w['docs_per_s']:>8.1f} "
+            f"{w['rss'] / 2**20:>8.0f} {slope:>8} "
+            f"{w['latency']['p50']:>7.2f} {w['latency']['p90']:>7.2f} "
+            f"{w['latency']['p99']:>7.2f}{flags}"
+        )
+    return "\n".join(lines)
+
+
+def write_prometheus(path: str, workers: List[Dict]) -> None:
+    """node_exporter textfile collector 格式, 先写临时文件再替换"""
+    lines = []
+    for metric, key in [
+        ("docs_total", "docs"),
+        ("chars_total", "chars"),
+        ("entities_total", "entities"),
+        ("batch_errors_total", "errors"),
+        ("rss_bytes", "rss"),
+        ("leak_suspected", "leak"),
+    ]:
+        kind = "counter" if metric.endswith("_total") else "gauge"
+        lines.append(f"# TYPE pii_harness_{metric} {kind}")
+        for w in workers:
+            if w["live"]:
+                lines.append(f'pii_harness_{metric}{{pid="{w["pid"]}"}} {int(w[key])}')
+    lines.append("# TYPE pii_harness_batch_latency_seconds gauge")
+    for w in workers:
+        if w["live"]:
+            for q in ("p50", "p90", "p99"):
+                lines.append(
+                    f'pii_harness_batch_latency_seconds{{pid="{w["pid"]}",quantile="0.{q[1:]}"}} '
+                    f"{w['latency'][q]}"
+                )
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as wf:
+        wf.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--metrics_dir",
+        type=str,
+        required=True,
+        help="某个检测器某个数据集的指标目录, 如 presidio/results/c4/metrics",
+    )
+    parser.add_argument(
+        "--watch", type=int, default=0, help="每隔多少秒刷新一次, 0 表示只显示一次"
+    )
+    parser.add_argument(
+        "--prometheus", type=str, default="", help="同时写出 Prometheus textfile"
+    )
+    args = parser.parse_args()
+
+    while True:
+        workers = load_workers(args.metrics_dir)
+        print(render(workers), flush=True)
+        if args.prometheus:
+            write_prometheus(args.prometheus, workers)
+        if args.watch <= 0:
+            return
+        time.sleep(args.watch)
+        print()
+
+
+if __name__ == "__main__":
+    main()
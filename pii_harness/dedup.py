@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import sqlite3
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .common import ensure_dir, result_dir
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+# 去重缓存里每次 IN 查询的哈希个数, 需小于 sqlite 的变量上限
+DEDUP_QUERY_CHUNK = 500
+
+
+def text_hash(text: str) -> bytes:
+    """合并空白后文本的 128 位哈希, 没装 xxhash 时退回 blake2b"""
+    data = " ".join(text.split()).encode("utf-8")
+    if xxhash is not None:
+        return xxhash.xxh3_128_digest(data)
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def dedup_path(dataset_name: str, debug: bool) -> str:
+    ensure_dir(result_dir(dataset_name, debug))
+    return os.path.join(result_dir(dataset_name, debug), "dedup.sqlite")
+
+
+class DedupCache:
+    """文档去重缓存: 文本哈希 -> 该文档的 entity2cnt, 存在 sqlite 中供所有 worker 共享。
+    put_many 只写入内存, 批次结果落盘后再 flush, 避免中断重跑时把未落盘的批次当成重复。"""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, timeout=60)
+        # 不用 WAL: 结果目录可能在 NFS 上, 用回滚日志并靠 busy timeout 等锁
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs (hash BLOB PRIMARY KEY, counts TEXT)"
+        )
+        self.conn.commit()
+        self.pending: Dict[bytes, Optional[Dict[str, int]]] = {}
+        self.hits = 0
+
+    def get_many(self, hashes: List[bytes]) -> Dict[bytes, Optional[Dict[str, int]]]:
+        found: Dict[bytes, Optional[Dict[str, int]]] = {}
+        for i in range(0, len(hashes), DEDUP_QUERY_CHUNK):
+            chunk = hashes[i : i + DEDUP_QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT hash, counts FROM docs WHERE hash IN ({placeholders})", chunk
+            )
+            for h, counts in rows:
+                found[h] = json.loads(counts) if counts is not None else None
+        return found
+
+    def put_many(self, items: Iterable[Tuple[bytes, Optional[Dict[str, int]]]]) -> None:
+        self.pending.update(items)
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO docs VALUES (?, ?)",
+                [
+                    (h, json.dumps(counts) if counts is not None else None)
+                    for h, counts in self.pending.items()
+                ],
+            )
+        self.pending = {}
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+
+def split_duplicates(
+    texts: List[str], cache: DedupCache, mode: str
+) -> Tuple[List[str], List[bytes], Counter, List[bytes]]:
+    """把一批文本分成未见过的文本和重复文本。
+    返回 (新文本, 新文本的哈希, 命中缓存的重复文档计数之和, 批内重复文档的哈希)"""
+    hashes = [text_hash(text) for text in texts]
+    cached = cache.get_many(list(set(hashes)))
+    new_texts: List[str] = []
+    new_hashes: List[bytes] = []
+    dup_counts: Counter = Counter()
+    batch_dups: List[bytes] = []
+    seen = set()
+    for text, h in zip(texts, hashes):
+        # count 模式下没有计数的缓存项 (只记录过见过) 不算命中
+        if h in cached and (mode == "skip" or cached[h] is not None):
+            cache.hits += 1
+            if mode == "count":
+                dup_counts.update(cached[h])
+        elif h in seen:
+            cache.hits += 1
+            batch_dups.append(h)
+        else:
+            seen.add(h)
+            new_texts.append(text)
+            new_hashes.append(h)
+    return new_texts, new_hashes, dup_counts, batch_dups
+
+
+def count_with_dedup(
+    count_documents, texts: List[str], cache: DedupCache, mode: str
+) -> Counter:
+    """count_documents 返回每篇文档的计数 (失败为 None)。
+    count 模式下重复文档沿用缓存的计数, skip 模式下重复文档不计数"""
+    new_texts, new_hashes, dup_counts, batch_dups = split_duplicates(
+        texts, cache, mode
+    )
+    entity2cnt: Counter = Counter()
+    fresh: Dict[bytes, Counter] = {}
+    for h, cnt in zip(new_hashes, count_documents(new_texts) if new_texts else []):
+        # 失败的文档不写入缓存
+        if cnt is not None:
+            fresh[h] = cnt
+            entity2cnt.update(cnt)
+    if mode == "count":
+        entity2cnt.update(dup_counts)
+        for h in batch_dups:
+            entity2cnt.update(fresh.get(h, {}))
+    cache.put_many(fresh.items())
+    return entity2cnt
+
+
+def count_skipping_duplicates(count_batch, texts: List[str], cache: DedupCache) -> Counter:
+    """只能给出整批计数的检测器: 去掉重复文档后整批计数, 见过的文档只记录哈希"""
+    new_texts, new_hashes, _, _ = split_duplicates(texts, cache, "skip")
+    entity2cnt = count_batch(new_texts) if new_texts else Counter()
+    cache.put_many((h, None) for h in new_hashes)
+    return entity2cnt
@@ -0,0 +1,37 @@
+from collections import Counter
+from typing import List, Optional
+
+
+class Detector:
+    """检测器插件, 每个后端 (presidio, scrubadub, ...) 实现一个子类。
+
+    load() 在处理数据的进程里调用一次, 用来加载模型等重资源;
+    count_batch(texts) 返回整批文本的实体计数。
+    能按文档计数的检测器实现 count_documents 并把 per_document 设为 True,
+    去重缓存才能复用重复文档的计数。
+    use_pool 为 False 的检测器 (GPU 模型) 在主进程里按文件顺序处理, 并接受 --device。
+    """
+
+    name = ""
+    per_document = False
+    use_pool = True
+    # debug 模式下的批大小
+    debug_batch_size = 10
+
+    def __init__(self, device: int = 0, debug: bool = False):
+        self.device = device
+        self.debug = debug
+
+    def load(self) -> None:
+        pass
+
+    def count_batch(self, texts: List[str]) -> Counter:
+        entity2cnt: Counter = Counter()
+        for cnt in self.count_documents(texts):
+            if cnt is not None:
+                entity2cnt.update(cnt)
+        return entity2cnt
+
+    def count_documents(self, texts: List[str]) -> List[Optional[Counter]]:
+        """逐篇计数, 出错的文档为 None"""
+        raise NotImplementedError
@@ -0,0 +1,323 @@
+from __future__ import annotations
+import argparse
+import time
+from collections import Counter
+from multiprocessing import Pool, cpu_count
+from typing import Dict, List, Optional, Type
+
+from .common import (
+    data_file_path,
+    iter_batches,
+    iter_dataset,
+    result_path_for,
+    update_result,
+)
+from .dedup import DedupCache, count_skipping_duplicates, count_with_dedup, dedup_path
+from .detector import Detector
+from .prefilter import (
+    PREFILTER_FAMILIES,
+    build_prefilter,
+    count_with_prefilter,
+    is_audit_batch,
+    new_prefilter_stats,
+    report_prefilter,
+)
+from .schedule import plan_tasks
+from .telemetry import metrics_dir_for, worker_metrics
+
+
+def count_entities(
+    detector: Detector, texts: List[str], dedup_cache: Optional[DedupCache], dedup: str
+) -> Counter:
+    texts = [text for text in texts if text]
+    if dedup_cache is None:
+        return detector.count_batch(texts)
+    if detector.per_document:
+        return count_with_dedup(detector.count_documents, texts, dedup_cache, dedup)
+    # 只有整批结果的检测器无法按文档缓存计数, 只能跳过重复文档
+    return count_skipping_duplicates(detector.count_batch, texts, dedup_cache)
+
+
+def process_batches_for_file(
+    detector: Detector,
+    dataset_name: str,
+    data_path: str,
+    filename: str,
+    batch_size: int,
+    resume_batch_cnt: int,
+    debug: bool,
+    prefilter_families: Optional[List[str]] = None,
+    prefilter_audit_every: int = 0,
+    dedup: str = "off",
+    end_batch: Optional[int] = None,
+    result_name: Optional[str] = None,
+    max_chars: int = 0,
+    start_batch: int = 0,
+    start_line: int = 0,
+) -> Dict:
+    """顺序处理一个文件的所有 batch, 并按批次落盘。
+    end_batch 不为 None 时只处理到该批次 (chunk 任务), 结果写到 result_name.json。
+    chunk 任务从第 start_line 行 (第 start_batch + 1 个批次的起点) 开始读, 不重放之前的批次。
+    max_chars > 0 时批次在 batch_size 个文档或累计 max_chars 个字符时结束, 先到者为准。"""
+    file_path = data_file_path(data_path, dataset_name, filename)
+    result_name = result_name or filename
+    rpath = result_path_for(dataset_name, result_name, debug)
+    prefilter = build_prefilter(prefilter_families)
+    prefilter_stats = new_prefilter_stats()
+    dedup_cache = (
+        DedupCache(dedup_path(dataset_name, debug)) if dedup != "off" else None
+    )
+
+    metrics = worker_metrics(metrics_dir_for(dataset_name, debug))
+
+    def count(texts: List[str]) -> Counter:
+        return count_entities(detector, texts, dedup_cache, dedup)
+
+    # 跳过已完成的批次
+    batches = iter_batches(
+        iter_dataset(file_path, dataset_name, start_line),
+        batch_size,
+        max_chars=max_chars,
+        skip=resume_batch_cnt - start_batch,
+    )
+
+    total_processed_batches = 0
+    batch_index = resume_batch_cnt
+
+    for i, batch_items in enumerate(batches):
+        if end_batch is not None and resume_batch_cnt + i + 1 > end_batch:
+            break
+        batch_index = resume_batch_cnt + i + 1
+        audit = None
+        started = time.perf_counter()
+        try:
+            if prefilter is None:
+                entity2cnt = count(batch_items)
+            else:
+                # 抽检批次同时做全量扫描, 用于估计预筛的召回率
+                entity2cnt, audit = count_with_prefilter(
+                    count,
+                    batch_items,
+                    prefilter,
+                    prefilter_stats,
+                    audit=is_audit_batch(batch_index, prefilter_audit_every, debug),
+                )
+        except Exception as e:
+            metrics.record(batch_items, None, time.perf_counter() - started)
+            print(
+                f"Error processing batch {batch_index} in file {filename}, skip it. the reason is: {e}"
+            )
+            continue
+        metrics.record(batch_items, entity2cnt, time.perf_counter() - started)
+        # 写出批次结果
+        update_result(
+            result_file_path=rpath,
+            batch_cnt=batch_index,
+            cur_batch_result=entity2cnt,
+            completed=False,
+            audit=audit,
+        )
+        # 批次落盘后再把新文档写入去重缓存
+        if dedup_cache is not None:
+            dedup_cache.flush()
+        total_processed_batches += 1
+        if debug:
+            print(
+                f"[DEBUG] {filename}: processed batch {batch_index}, entities={dict(entity2cnt)}"
+            )
+            break  # debug 下只处理 1 个 batch
+
+    # 标记文件完成（若 debug 则不标完成）
+    if not debug:
+        # 标记完成
+        update_result(
+            rpath,
+            None,
+            None,
+            completed=True,
+        )
+
+    metrics.publish()
+    dedup_hits = 0
+    if dedup_cache is not None:
+        dedup_hits = dedup_cache.hits
+        dedup_cache.close()
+
+    return {
+        "filename": filename,
+        "result_name": result_name,
+        "last_batch_cnt": batch_index,
+        "batches_processed": total_processed_batches,
+        "completed": (not debug),
+        "prefilter": prefilter_stats if prefilter is not None else None,
+        "dedup_hits": dedup_hits,
+    }
+
+
+# 子进程内的检测器, 由 Pool 的 initializer 创建并加载一次, 之后处理的所有文件复用
+_worker_detector: Optional[Detector] = None
+
+
+def _init_worker(detector_cls: Type[Detector], debug: bool) -> None:
+    global _worker_detector
+    _worker_detector = detector_cls(debug=debug)
+    _worker_detector.load()
+
+
+# 顶层函数：子进程的入口（可被pickle）
+def _run_one(args):
+    return process_batches_for_file(_worker_detector, *args)
+
+
+def main(detector_cls: Type[Detector]) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset_name", type=str, required=True)
+    parser.add_argument("--data_path", type=str, required=True)
+    parser.add_argument("--batch_size", type=int, default=1000)
+    parser.add_argument(
+        "--max_chars",
+        type=int,
+        default=0,
+        help="每个批次的字符数上限, 与 --batch_size 先到者为准, 0 表示只按文档数分批; 续跑时需保持不变",
+    )
+    if detector_cls.use_pool:
+        parser.add_argument("--workers", type=int, default=max(cpu_count() - 1, 1))
+        parser.add_argument(
+            "--max_tasks_per_child",
+            type=int,
+            default=0,
+            help="每个子进程处理的任务数量上限，>0 可降低内存碎片",
+        )
+    else:
+        parser.add_argument("--device", type=int, default=0)
+    parser.add_argument("--debug", action="store_true")
+    parser.add_argument(
+        "--chunk_batches",
+        type=int,
+        default=0,
+        help="尚未开始的大文件按每 chunk_batches 个批次拆成独立任务, 0 表示不拆分",
+    )
+    parser.add_argument(
+        "--prefilter",
+        type=str,
+        default="",
+        help="逗号分隔的预筛实体族 (contact,number,name), 为空则不预筛",
+    )
+    parser.add_argument(
+        "--prefilter_audit_every",
+        type=int,
+        default=20,
+        help="每隔多少个批次做一次全量扫描抽检预筛召回率, 0 表示不抽检",
+    )
+    parser.add_argument(
+        "--dedup",
+        type=str,
+        default="off",
+        choices=["off", "count", "skip"],
+        help="按规范化文本哈希去重: count 重复文档沿用缓存的计数, skip 重复文档不计数",
+    )
+    args = parser.parse_args()
+
+    prefilter_families = [f for f in args.prefilter.split(",") if f]
+    for family in prefilter_families:
+        if family not in PREFILTER_FAMILIES:
+            parser.error(f"unknown prefilter family: {family}")
+    if args.dedup == "count" and not detector_cls.per_document:
+        parser.error(f"{detector_cls.name} only supports --dedup skip")
+
+    batch_size = args.batch_size if not args.debug else detector_cls.debug_batch_size
+    tasks = plan_tasks(
+        args.dataset_name,
+        args.data_path,
+        args.debug,
+        batch_size,
+        max_chars=args.max_chars,
+        chunk_batches=args.chunk_batches,
+        workers=getattr(args, "workers", 1),
+    )
+
+    if args.debug:
+        # debug：只跑前 1 个任务
+        tasks = tasks[:1]
+
+    if not tasks:
+        print("No files to process. All completed or no input found.")
+        return
+
+    from tqdm import tqdm
+
+    # 进度按压缩后的字节数显示
+    total_files = len(tasks)
+    processed = 0
+    prefilter_stats = []
+    dedup_hits = 0
+    task_weights = {task.result_name: task.weight for task in tasks}
+    task_args = [
+        (
+            args.dataset_name,
+            args.data_path,
+            task.filename,
+            batch_size,
+            task.resume_batch_cnt,
+            args.debug,
+            prefilter_families,
+            args.prefilter_audit_every,
+            args.dedup,
+            task.end_batch,
+            task.result_name,
+            args.max_chars,
+            task.start_batch,
+            task.start_line,
+        )
+        for task in tasks
+    ]
+    progress = tqdm(
+        total=sum(task_weights.values()),
+        unit="B",
+        unit_scale=True,
+        desc=f"{detector_cls.name} processing {args.dataset_name}",
+        disable=args.debug and not detector_cls.use_pool,
+    )
+
+    if detector_cls.use_pool:
+        pool_kwargs = {
+            "processes": args.workers,
+            "initializer": _init_worker,
+            "initargs": (detector_cls, args.debug),
+        }
+        if args.max_tasks_per_child and args.max_tasks_per_child > 0:
+            pool_kwargs["maxtasksperchild"] = args.max_tasks_per_child
+        with Pool(**pool_kwargs) as pool:
+            for summary in pool.imap_unordered(_run_one, task_args):
+                progress.update(task_weights[summary["result_name"]])
+                processed += 1
+                dedup_hits += summary["dedup_hits"]
+                if summary["prefilter"] is not None:
+                    prefilter_stats.append(summary["prefilter"])
+                if args.debug:
+                    print("[DEBUG] summary:", summary)
+            # 正常关闭而不是 terminate, worker 退出前会发布最终的指标快照
+            pool.close()
+            pool.join()
+    else:
+        # GPU 模型只在主进程加载一次, 按文件顺序处理
+        detector = detector_cls(device=args.device, debug=args.debug)
+        detector.load()
+        for task in task_args:
+            summary = process_batches_for_file(detector, *task)
+            progress.update(task_weights[summary["result_name"]])
+            processed += 1
+            dedup_hits += summary["dedup_hits"]
+            if summary["prefilter"] is not None:
+                prefilter_stats.append(summary["prefilter"])
+
+    progress.close()
+    print(f"Done. Tasks processed: {processed}/{total_files}.")
+    if prefilter_families:
+        report_prefilter(prefilter_stats)
+    if args.dedup != "off":
+        print(f"Duplicate documents ({args.dedup}): {dedup_hits}")
+    print(
+        f"Worker metrics: {metrics_dir_for(args.dataset_name, args.debug)} "
+        "(view with python -m pii_harness.dashboard)"
+    )
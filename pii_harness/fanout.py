@@ -0,0 +1,280 @@
+"""
+单遍多检测器模式: 每个数据文件只解压/解析一次, 每个批次分发给多个后端。
+
+在仓库根目录运行：
+
+python -m pii_harness.fanout \
+  --dataset_name c4 \
+  --data_path ../data/c4/en \
+  --batch_size 1000 \
+  --backends presidio=40,scrubadub=8,piiranha \
+  --device 0
+
+--backends 中 CPU 后端写成 name=进程数, 每个 CPU 后端有自己的进程池, 子进程在该后端的目录下运行
+(与单独运行 run.py 时的相对路径一致); GPU 后端在主进程中加载一次。
+每个后端照常把结果写到自己目录下的 results/<dataset>, 断点续跑互不影响。
+所有后端使用同一个 batch_size / max_chars, 续跑时请与之前单独运行时保持一致。
+单遍模式暂不支持 --prefilter / --dedup。
+"""
+from __future__ import annotations
+import argparse, importlib.util, os, sys, time
+from collections import deque
+from multiprocessing import Pool
+from typing import Deque, Dict, List, Optional, Tuple, Type
+
+from .common import (
+    build_resume_list,
+    data_file_path,
+    iter_batches,
+    iter_dataset,
+    result_path_for,
+    update_result,
+)
+from .detector import Detector
+from .telemetry import metrics_dir_for, worker_metrics
+from . import engine
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 后端名 -> (目录, 脚本, Detector 类名), 目录相对仓库根目录
+BACKENDS = {
+    "presidio": ("presidio", "presidio.py", "PresidioDetector"),
+    "scrubadub": ("scrubadub", "run.py", "ScrubadubDetector"),
+    "piianalyzer": ("piianalyzer", "run.py", "PiiAnalyzerDetector"),
+    "piiranha": ("piiranha", "run.py", "PiiranhaDetector"),
+    "starpii": ("starpii", "run.py", "StarpiiDetector"),
+}
+
+# 每个 CPU 进程在途的批次数, 超过后等待最早的批次完成
+IN_FLIGHT_PER_WORKER = 2
+
+
+def load_detector_cls(name: str) -> Type[Detector]:
+    directory, script, cls_name = BACKENDS[name]
+    backend_dir = os.path.join(REPO_ROOT, directory)
+    # 后端脚本会 import 自己目录下的模块 (如 piianalyzer 的 utils)
+    if backend_dir not in sys.path:
+        sys.path.append(backend_dir)
+    spec = importlib.util.spec_from_file_location(
+        f"{name}_backend", os.path.join(backend_dir, script)
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, cls_name)
+
+
+def _init_backend_worker(detector_cls: Type[Detector], debug: bool, cwd: str) -> None:
+    os.chdir(cwd)
+    engine._init_worker(detector_cls, debug)
+
+
+def _count_batch(texts: List[str], metrics_dir: str):
+    return _timed_count(engine._worker_detector, texts, metrics_dir)
+
+
+def _timed_count(detector: Detector, texts: List[str], metrics_dir: str):
+    metrics = worker_metrics(metrics_dir)
+    started = time.perf_counter()
+    try:
+        entity2cnt = engine.count_entities(detector, texts, None, "off")
+    except Exception:
+        metrics.record(texts, None, time.perf_counter() - started)
+        raise
+    metrics.record(texts, entity2cnt, time.perf_counter() - started)
+    return entity2cnt
+
+
+class Backend:
+    """一个后端: 进程池 (CPU) 或主进程内的检测器 (GPU), 以及按批次顺序写结果"""
+
+    def __init__(self, name: str, dataset_name: str, data_path: str, debug: bool):
+        self.name = name
+        self.root = os.path.join(REPO_ROOT, BACKENDS[name][0])
+        self.dataset_name = dataset_name
+        self.debug = debug
+        self.metrics_dir = metrics_dir_for(dataset_name, debug, self.root)
+        self.detector_cls = load_detector_cls(name)
+        self.pool = None
+        self.detector: Optional[Detector] = None
+        self.max_in_flight = 1
+        # (文件名, 批次号, AsyncResult 或已算好的计数)
+        self.pending: Deque[Tuple[str, int, object]] = deque()
+        # 该后端未完成的文件 -> 已完成的批次数
+        self.resume: Dict[str, int] = dict(
+            build_resume_list(dataset_name, data_path, debug, self.root)
+        )
+
+    def start(self, workers: int, device: int) -> None:
+        if self.detector_cls.use_pool:
+            self.pool = Pool(
+                processes=workers,
+                initializer=_init_backend_worker,
+                initargs=(self.detector_cls, self.debug, self.root),
+            )
+            self.max_in_flight = workers * IN_FLIGHT_PER_WORKER
+        else:
+            self.detector = self.detector_cls(device=device, debug=self.debug)
+            self.detector.load()
+
+    def wants(self, filename: str, batch_index: int) -> bool:
+        return filename in self.resume and batch_index > self.resume[filename]
+
+    def submit(self, filename: str, batch_index: int, texts: List[str]) -> None:
+        if self.pool is not None:
+            result = self.pool.apply_async(_count_batch, (texts, self.metrics_dir))
+        else:
+            try:
+                result = _timed_count(self.detector, texts, self.metrics_dir)
+            except Exception as e:
+                result = e
+        self.pending.append((filename, batch_index, result))
+        self.drain(block=len(self.pending) > self.max_in_flight)
+
+    def drain(self, block: bool = False, wait_all: bool = False) -> None:
+        """按提交顺序写出已完成的批次; block 时至少等最早的一个, wait_all 时等全部"""
+        while self.pending:
+            filename, batch_index, result = self.pending[0]
+            if self.pool is not None:
+                if not (block or wait_all or result.ready()):
+                    return
+                try:
+                    result = result.get()
+                except Exception as e:
+                    result = e
+            self.pending.popleft()
+            block = False
+            if isinstance(result, Exception):
+                print(
+                    f"[{self.name}] Error processing batch {batch_index} in file {filename}, skip it. the reason is: {result}"
+                )
+                continue
+            update_result(
+                result_file_path=result_path_for(
+                    self.dataset_name, filename, self.debug, self.root
+                ),
+                batch_cnt=batch_index,
+                cur_batch_result=result,
+                completed=False,
+            )
+            if self.debug:
+                print(
+                    f"[DEBUG] {self.name} {filename}: processed batch {batch_index}, entities={dict(result)}"
+                )
+
+    def finish_file(self, filename: str) -> None:
+        if filename not in self.resume:
+            return
+        self.drain(wait_all=True)
+        # 标记文件完成（若 debug 则不标完成）
+        if not self.debug:
+            update_result(
+                result_path_for(self.dataset_name, filename, self.debug, self.root),
+                None,
+                None,
+                completed=True,
+            )
+
+    def close(self) -> None:
+        self.drain(wait_all=True)
+        if self.pool is not None:
+            # close/join 让 worker 正常退出, 退出前各自发布最终的指标快照
+            self.pool.close()
+            self.pool.join()
+        else:
+            worker_metrics(self.metrics_dir).close()
+
+
+def parse_backends(spec: str) -> List[Tuple[str, int]]:
+    backends = []
+    for item in spec.split(","):
+        if not item:
+            continue
+        name, _, workers = item.partition("=")
+        if name not in BACKENDS:
+            raise ValueError(f"unknown backend: {name}")
+        backends.append((name, int(workers) if workers else 1))
+    return backends
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset_name", type=str, required=True)
+    parser.add_argument("--data_path", type=str, required=True)
+    parser.add_argument("--batch_size", type=int, default=1000)
+    parser.add_argument(
+        "--max_chars",
+        type=int,
+        default=0,
+        help="每个批次的字符数上限, 与 --batch_size 先到者为准, 0 表示只按文档数分批",
+    )
+    parser.add_argument(
+        "--backends",
+        type=str,
+        required=True,
+        help="逗号分隔的后端, CPU 后端写成 name=进程数, 如 presidio=40,scrubadub=8,piiranha",
+    )
+    parser.add_argument("--device", type=int, default=0)
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        backend_specs = parse_backends(args.backends)
+    except ValueError as e:
+        parser.error(str(e))
+    data_path = os.path.abspath(args.data_path)
+
+    backends = [
+        Backend(name, args.dataset_name, data_path, args.debug)
+        for name, _ in backend_specs
+    ]
+    # 先 fork 出 CPU 进程池, 再在主进程加载 GPU 模型
+    for backend, (_, workers) in sorted(
+        zip(backends, backend_specs), key=lambda bw: not bw[0].detector_cls.use_pool
+    ):
+        backend.start(workers, args.device)
+    batch_size = args.batch_size
+    if args.debug:
+        batch_size = min(b.detector_cls.debug_batch_size for b in backends)
+
+    # 至少有一个后端没完成的文件, 从所有后端中最早的断点开始读
+    filenames = sorted(set().union(*(b.resume for b in backends)))
+    if args.debug:
+        # debug：只跑前 1 个文件
+        filenames = filenames[:1]
+    if not filenames:
+        print("No files to process. All completed or no input found.")
+        return
+
+    from tqdm import tqdm
+
+    for filename in tqdm(
+        filenames, desc=f"Fan-out processing {args.dataset_name}", disable=args.debug
+    ):
+        start_batch = min(b.resume[filename] for b in backends if filename in b.resume)
+        # 跳过所有后端都已完成的批次
+        batches = iter_batches(
+            iter_dataset(
+                data_file_path(data_path, args.dataset_name, filename),
+                args.dataset_name,
+            ),
+            batch_size,
+            max_chars=args.max_chars,
+            skip=start_batch,
+        )
+        for i, batch_items in enumerate(batches):
+            batch_index = start_batch + i + 1
+            for backend in backends:
+                if backend.wants(filename, batch_index):
+                    backend.submit(filename, batch_index, batch_items)
+            if args.debug:
+                break  # debug 下只处理 1 个 batch
+        for backend in backends:
+            backend.finish_file(filename)
+
+    for backend in backends:
+        backend.close()
+    print(f"Done. Files processed: {len(filenames)}.")
+
+
+if __name__ == "__main__":
+    main()
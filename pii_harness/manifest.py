@@ -0,0 +1,151 @@
+"""
+进度清单: 结果目录下的 manifest.sqlite 记录每个结果文件的 (batch_cnt, completed)。
+
+update_result 每次落盘后同步更新清单, 启动时一次查询即可得到所有文件的进度,
+不必逐个 json.load 结果文件。清单里没有的结果文件 (旧的运行或手动拷贝的结果) 会回退到解析 json,
+并补写进清单; 清单里有但 json 已被删除的条目会被清除, 删掉结果文件即可重跑该文件。
+
+被拆成 chunk 的文件的布局 (每个 chunk 的批次区间和起始行号) 也记在清单里,
+删掉某个 chunk 的结果文件只会让该 chunk 从头重跑。建过批次索引的文件还会记下批次数,
+没有拆分的文件之后不必重新索引。
+
+结果目录可能在 NFS 上, WAL 依赖共享内存, 跨主机访问不可靠, 所以用默认的回滚日志,
+并发写入靠 busy timeout 等锁。每个进程对每个结果目录只保持一个连接 (get_manifest)。
+"""
+import json
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Tuple
+
+MANIFEST_FILE = "manifest.sqlite"
+
+
+class Manifest:
+    def __init__(self, rdir: str):
+        self.conn = sqlite3.connect(os.path.join(rdir, MANIFEST_FILE), timeout=60)
+        # 旧版本建的清单是 WAL 模式, 日志模式记录在文件里, 需要显式切回
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS progress "
+            "(name TEXT PRIMARY KEY, batch_cnt INTEGER, completed INTEGER)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (filename TEXT, start INTEGER, "
+            "end_batch INTEGER, start_line INTEGER, PRIMARY KEY (filename, start))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS batch_counts (filename TEXT, batch_size INTEGER, "
+            "max_chars INTEGER, n_batches INTEGER, "
+            "PRIMARY KEY (filename, batch_size, max_chars))"
+        )
+        self.conn.commit()
+
+    def set_many(self, rows: Iterable[Tuple[str, int, bool]]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO progress VALUES (?, ?, ?)",
+                [(name, batch_cnt, int(completed)) for name, batch_cnt, completed in rows],
+            )
+
+    def delete_many(self, names: Iterable[str]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM progress WHERE name = ?", [(name,) for name in names]
+            )
+
+    def read_all(self) -> Dict[str, Tuple[int, bool]]:
+        rows = self.conn.execute("SELECT name, batch_cnt, completed FROM progress")
+        return {name: (batch_cnt, bool(completed)) for name, batch_cnt, completed in rows}
+
+    def set_chunks(self, filename: str, chunks: Iterable[Tuple[int, int, int]]) -> None:
+        """chunks 为 (start, end, start_line), 覆盖批次 (start, end], 第 start + 1 个批次从 start_line 行开始"""
+        with self.conn:
+            self.conn.execute("DELETE FROM chunks WHERE filename = ?", (filename,))
+            self.conn.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                [(filename, start, end, line) for start, end, line in chunks],
+            )
+
+    def read_chunks(self) -> Dict[str, List[Tuple[int, int, int]]]:
+        rows = self.conn.execute(
+            "SELECT filename, start, end_batch, start_line FROM chunks "
+            "ORDER BY filename, start"
+        )
+        chunks: Dict[str, List[Tuple[int, int, int]]] = {}
+        for filename, start, end, line in rows:
+            chunks.setdefault(filename, []).append((start, end, line))
+        return chunks
+
+    def set_batch_counts(
+        self, batch_size: int, max_chars: int, counts: Dict[str, int]
+    ) -> None:
+        """记录按 (batch_size, max_chars) 分批时每个文件的批次数"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO batch_counts VALUES (?, ?, ?, ?)",
+                [(name, batch_size, max_chars, n) for name, n in counts.items()],
+            )
+
+    def read_batch_counts(self, batch_size: int, max_chars: int) -> Dict[str, int]:
+        rows = self.conn.execute(
+            "SELECT filename, n_batches FROM batch_counts "
+            "WHERE batch_size = ? AND max_chars = ?",
+            (batch_size, max_chars),
+        )
+        return dict(rows)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+_manifests: Dict[Tuple[int, str], Manifest] = {}
+
+
+def get_manifest(rdir: str) -> Manifest:
+    """当前进程在 rdir 的清单连接; fork 出的子进程各自新建"""
+    key = (os.getpid(), os.path.abspath(rdir))
+    if key not in _manifests:
+        _manifests[key] = Manifest(rdir)
+    return _manifests[key]
+
+
+def record_progress(result_file_path: str, batch_cnt: int, completed: bool) -> None:
+    """结果 json 落盘之后调用; 中断在两者之间时清单只会落后, 续跑时重算的批次会覆盖同名批次"""
+    rdir, file = os.path.split(result_file_path)
+    get_manifest(rdir).set_many([(file[: -len(".json")], batch_cnt, completed)])
+
+
+def _parse_progress(path: str) -> Tuple[int, bool]:
+    try:
+        with open(path, "r", encoding="utf-8") as rf:
+            result_data = json.load(rf)
+        return int(result_data.get("batch_cnt", 0)), bool(
+            result_data.get("completed", False)
+        )
+    except Exception:
+        return 0, False
+
+
+def read_progress(rdir: str) -> Dict[str, int]:
+    """结果名 -> 已完成的批次数, 已完成的文件为 -1"""
+    names = {file[: -len(".json")] for file in os.listdir(rdir) if file.endswith(".json")}
+    manifest = get_manifest(rdir)
+    known = manifest.read_all()
+    stale = [name for name in known if name not in names]
+    if stale:
+        manifest.delete_many(stale)
+    missing = [
+        (name, *_parse_progress(os.path.join(rdir, f"{name}.json")))
+        for name in names
+        if name not in known
+    ]
+    if missing:
+        manifest.set_many(missing)
+
+    progress: Dict[str, int] = {}
+    for name, (batch_cnt, completed) in known.items():
+        if name in names:
+            progress[name] = -1 if completed else batch_cnt
+    for name, batch_cnt, completed in missing:
+        progress[name] = -1 if completed else batch_cnt
+    return progress
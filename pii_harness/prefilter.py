@@ -0,0 +1,99 @@
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+
+# 廉价预筛: 每个实体族一条编译好的正则, 只有命中的段落才送入重型检测器
+# contact: email / url / 社交账号
+# number: 至少 4 位的数字串 (电话, 证件号, 卡号, 日期等)
+# name: 连续的首字母大写单词 (人名, 地名, 机构名)
+PREFILTER_FAMILIES = {
+    "contact": r"@|https?://|www\.",
+    "number": r"\d(?:[\s().\-/]?\d){3,}",
+    "name": r"\b[A-Z][a-z]+(?:[ \t]+[A-Z][a-z]+)+",
+}
+
+
+def build_prefilter(families: Optional[List[str]]):
+    """families 为空时返回 None, 即不开启预筛"""
+    if not families:
+        return None
+    return re.compile("|".join(f"(?:{PREFILTER_FAMILIES[f]})" for f in families))
+
+
+def prefilter_texts(texts: List[str], pattern) -> Tuple[List[str], int, int]:
+    """只保留命中预筛的段落, 整篇都未命中的文档直接丢弃。
+    返回 (候选文本, 原始字符数, 保留字符数)"""
+    kept_texts: List[str] = []
+    total_chars = 0
+    kept_chars = 0
+    for text in texts:
+        if not text:
+            continue
+        total_chars += len(text)
+        kept = "\n".join(p for p in text.split("\n") if pattern.search(p))
+        if kept:
+            kept_texts.append(kept)
+            kept_chars += len(kept)
+    return kept_texts, total_chars, kept_chars
+
+
+def new_prefilter_stats() -> Dict:
+    return {
+        "total_chars": 0,
+        "kept_chars": 0,
+        "audit_full": Counter(),
+        "audit_cascade": Counter(),
+    }
+
+
+def is_audit_batch(batch_index: int, audit_every: int, debug: bool) -> bool:
+    """debug 下每批都抽检, 否则每 audit_every 个批次抽检一次"""
+    return debug or (audit_every > 0 and batch_index % audit_every == 0)
+
+
+def count_with_prefilter(
+    count_fn, texts: List[str], pattern, stats: Dict, audit: bool
+) -> Tuple[Counter, Optional[Dict]]:
+    """预筛后再用 count_fn 计数; audit 为 True 时额外对原文做一次全量扫描。
+    返回 (entity2cnt, 抽检记录)"""
+    candidates, total_chars, kept_chars = prefilter_texts(texts, pattern)
+    stats["total_chars"] += total_chars
+    stats["kept_chars"] += kept_chars
+    entity2cnt = count_fn(candidates) if candidates else Counter()
+    if not audit:
+        return entity2cnt, None
+    full = count_fn(texts)
+    stats["audit_full"].update(full)
+    stats["audit_cascade"].update(entity2cnt)
+    return entity2cnt, {"full": full, "cascade": entity2cnt}
+
+
+def report_prefilter(stats_list: List[Dict]) -> None:
+    """汇总各文件的预筛统计, 召回率 = 抽检批次上预筛后的计数 / 全量扫描的计数"""
+    total = new_prefilter_stats()
+    for stats in stats_list:
+        total["total_chars"] += stats["total_chars"]
+        total["kept_chars"] += stats["kept_chars"]
+        total["audit_full"].update(stats["audit_full"])
+        total["audit_cascade"].update(stats["audit_cascade"])
+
+    if total["total_chars"]:
+        print(
+            f"Prefilter kept {total['kept_chars'] / total['total_chars']:.2%} "
+            f"of {total['total_chars']} chars."
+        )
+    full, cascade = total["audit_full"], total["audit_cascade"]
+    if not full:
+        print("Prefilter recall: no entities in audited batches.")
+        return
+    for entity_type in sorted(full):
+        hit = cascade[entity_type]
+        print(
+            f"  {entity_type}: recall {hit / full[entity_type]:.4f} "
+            f"({hit}/{full[entity_type]})"
+        )
+    print(
+        f"Prefilter recall: {sum(cascade.values()) / sum(full.values()):.4f} "
+        f"({sum(cascade.values())}/{sum(full.values())})"
+    )
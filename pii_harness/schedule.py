@@ -0,0 +1,237 @@
+"""
+按大小排序的任务规划: 大文件优先 (LPT), 大文件可拆成若干批次区间 (chunk) 作为独立任务。
+
+chunk 的结果写在 <filename>.chunk<start>-<end>.json, 批次号仍是文件内的全局批次号,
+覆盖批次 (start, end]。一个文件第一次被拆分时, chunk 布局和每个 chunk 的起始行号写进进度清单,
+之后的运行按清单里的布局续跑, 与当时的 --chunk_batches 无关; chunk 任务直接跳到起始行,
+不必从文件开头重放前面的批次。删掉某个 chunk 的结果文件只会让该 chunk 从头重跑。
+
+判断是否拆分要给文件建批次索引, 需要完整解压一遍, 所以只索引压缩后大小可能超过 chunk_batches
+个批次的文件 (每批次的字节数由已索引文件估计)。索引过的文件的批次数记在清单里, 不会重复索引。
+"""
+import gzip
+import os
+import re
+from multiprocessing import Pool
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .common import (
+    batched,
+    data_file_path,
+    dataset_format,
+    ensure_dir,
+    iter_dataset_lines,
+    result_dir,
+)
+from .manifest import Manifest, get_manifest, read_progress
+
+CHUNK_NAME = re.compile(r"^(?P<filename>.+)\.chunk(?P<start>\d+)-(?P<end>\d+)$")
+
+
+class Task(NamedTuple):
+    filename: str
+    resume_batch_cnt: int
+    # 处理到该批次为止 (含), None 表示处理到文件末尾
+    end_batch: Optional[int]
+    # 结果文件名 (不含 .json)
+    result_name: str
+    # 剩余工作量的估计, 按压缩后字节数计
+    weight: int
+    # chunk 的第一个批次之前的批次数, 以及该批次第一篇文档所在的行号
+    start_batch: int = 0
+    start_line: int = 0
+
+
+def chunk_name(filename: str, start: int, end: int) -> str:
+    return f"{filename}.chunk{start}-{end}"
+
+
+def batch_start_lines(
+    file_path: str, dataset_name: str, batch_size: int, max_chars: int = 0
+) -> List[int]:
+    """每个批次第一篇文档所在的行号, 长度即文件的批次数。
+    max_chars <= 0 时批次只取决于文档数, 直接数行而不解析 json; 这时每行都按一篇文档算,
+    文件里有 iter_dataset_lines 会跳过的坏行时, 之后的 chunk 起点会比实际批次早几篇文档,
+    相邻 chunk 边界上的少量文档会被处理两次。"""
+    if max_chars <= 0:
+        try:
+            with gzip.open(file_path, "rb") as f_in:
+                n_lines = sum(1 for _ in f_in)
+        except Exception as e:
+            print(f"Error reading file: {file_path} in batch_start_lines. Error: {e}")
+            n_lines = 0
+        return list(range(0, n_lines, batch_size))
+    return [
+        batch[0][0]
+        for batch in batched(
+            iter_dataset_lines(file_path, dataset_name),
+            batch_size,
+            max_chars,
+            size=lambda item: len(item[1] or ""),
+        )
+    ]
+
+
+def split_ranges(start: int, end: int, chunk_batches: int) -> List[Tuple[int, int]]:
+    """把批次区间 (start, end] 按每 chunk_batches 个批次切开, chunk_batches <= 0 时不切"""
+    step = chunk_batches if chunk_batches > 0 else max(end - start, 1)
+    return [(s, min(s + step, end)) for s in range(start, end, step)]
+
+
+def fill_gaps(
+    ranges: List[Tuple[int, int]], n_batches: int, chunk_batches: int
+) -> List[Tuple[int, int]]:
+    """旧版本的 chunk 布局只记在结果文件名里, 删掉的结果文件会留下空缺; 用新的 chunk 补上"""
+    filled: List[Tuple[int, int]] = []
+    covered = 0
+    for start, end in sorted(ranges) + [(n_batches, n_batches)]:
+        if start > covered:
+            filled.extend(split_ranges(covered, start, chunk_batches))
+        if end > start:
+            filled.append((start, end))
+        covered = max(covered, end)
+    return filled
+
+
+# 估计的每批次字节数取已索引文件里最小的, 各文件的压缩率仍有差别, 阈值再放宽这么多倍
+SPLIT_SIZE_MARGIN = 2
+
+
+def _index_files(
+    manifest: Manifest,
+    data_path: str,
+    dataset_name: str,
+    batch_size: int,
+    max_chars: int,
+    chunk_batches: int,
+    workers: int,
+    sizes: Dict[str, int],
+    required: List[str],
+    candidates: List[str],
+) -> Dict[str, List[int]]:
+    """给 required 的文件和 candidates 里可能超过 chunk_batches 个批次的文件建立批次的行号索引。
+    清单里记过批次数且不超过 chunk_batches 的文件不再索引; 其余文件压缩后的大小
+    不到 chunk_batches 个批次的估计字节数的 1 / SPLIT_SIZE_MARGIN 时也不索引。"""
+    max_chars = max(max_chars, 0)
+    counts = manifest.read_batch_counts(batch_size, max_chars)
+    candidates = [f for f in candidates if counts.get(f, chunk_batches + 1) > chunk_batches]
+
+    def index(filenames: List[str]) -> Dict[str, List[int]]:
+        if not filenames:
+            return {}
+        args = [
+            (data_file_path(data_path, dataset_name, f), dataset_name, batch_size, max_chars)
+            for f in filenames
+        ]
+        with Pool(processes=max(1, min(workers, len(args)))) as pool:
+            indexed = dict(zip(filenames, pool.starmap(batch_start_lines, args)))
+        manifest.set_batch_counts(
+            batch_size, max_chars, {f: len(lines) for f, lines in indexed.items()}
+        )
+        counts.update((f, len(lines)) for f, lines in indexed.items())
+        return indexed
+
+    start_lines = index(required)
+    # 还没有任何估计时, 先索引最大的候选文件
+    known = [(sizes[f], n) for f, n in counts.items() if f in sizes and n > 0]
+    if candidates and not known:
+        largest = max(candidates, key=lambda f: sizes[f])
+        start_lines.update(index([largest]))
+        candidates.remove(largest)
+        known = [(sizes[largest], counts[largest])] if counts[largest] > 0 else []
+    if known:
+        bytes_per_batch = min(size / n for size, n in known)
+        threshold = chunk_batches * bytes_per_batch / SPLIT_SIZE_MARGIN
+        candidates = [f for f in candidates if sizes[f] > threshold]
+    start_lines.update(index(candidates))
+    return start_lines
+
+
+def plan_tasks(
+    dataset_name: str,
+    data_path: str,
+    debug: bool,
+    batch_size: int,
+    max_chars: int = 0,
+    chunk_batches: int = 0,
+    workers: int = 1,
+    root: str = ".",
+) -> List[Task]:
+    """生成按剩余工作量从大到小排序的任务列表。
+    chunk_batches > 0 时, 尚未开始且超过 chunk_batches 个批次的文件会被拆成多个 chunk。"""
+    rdir = result_dir(dataset_name, debug, root)
+    ensure_dir(rdir)
+    progress = read_progress(rdir)
+    manifest = get_manifest(rdir)
+    layouts = manifest.read_chunks()
+
+    # 清单里还没有布局的旧 chunk 结果, 只能从结果文件名恢复
+    legacy: Dict[str, List[Tuple[int, int]]] = {}
+    for name in progress:
+        m = CHUNK_NAME.match(name)
+        if m and m.group("filename") not in layouts:
+            legacy.setdefault(m.group("filename"), []).append(
+                (int(m.group("start")), int(m.group("end")))
+            )
+
+    suffix, _ = dataset_format(dataset_name)
+    sizes: Dict[str, int] = {}
+    for file in os.listdir(data_path):
+        if file.endswith(suffix):
+            sizes[file[: -len(suffix)]] = os.path.getsize(os.path.join(data_path, file))
+
+    # 需要拆分的新文件和旧 chunk 布局的文件先建立批次的行号索引
+    start_lines = _index_files(
+        manifest,
+        data_path,
+        dataset_name,
+        batch_size,
+        max_chars,
+        chunk_batches,
+        workers,
+        sizes,
+        [f for f in sizes if f in legacy and f not in layouts],
+        [
+            f
+            for f in sizes
+            if chunk_batches > 0
+            and f not in layouts
+            and f not in legacy
+            and f not in progress
+        ],
+    )
+
+    for filename, lines in start_lines.items():
+        n_batches = len(lines)
+        if filename in legacy:
+            ranges = fill_gaps(legacy[filename], n_batches, chunk_batches)
+        elif n_batches > chunk_batches:
+            ranges = split_ranges(0, n_batches, chunk_batches)
+        else:
+            continue
+        layouts[filename] = [
+            (start, end, lines[start]) for start, end in ranges if start < n_batches
+        ]
+        manifest.set_chunks(filename, layouts[filename])
+
+    tasks: List[Task] = []
+    for filename, size in sizes.items():
+        if filename in layouts:
+            n_batches = max(end for _, end, _ in layouts[filename])
+            for start, end, line in layouts[filename]:
+                name = chunk_name(filename, start, end)
+                # 结果文件不存在 (还没开始或被删掉) 时从 chunk 起点开始
+                done = progress.get(name, start)
+                if done == -1:
+                    continue
+                resume = max(done, start)
+                weight = size * (end - resume) // max(n_batches, 1)
+                tasks.append(Task(filename, resume, end, name, weight, start, line))
+        else:
+            resume = progress.get(filename, 0)
+            if resume != -1:
+                tasks.append(Task(filename, resume, None, filename, size))
+
+    # LPT: 剩余工作量大的任务先派发, 避免大文件最后才开始拖长尾
+    tasks.sort(key=lambda task: task.weight, reverse=True)
+    return tasks
@@ -0,0 +1,140 @@
+"""
+每个进程的运行指标: 文档数, 字符数, 实体数, RSS, 批次耗时分位数。
+
+worker 的后台线程每隔 PUBLISH_INTERVAL 秒把自己的指标写到 <结果目录>/metrics/worker_<pid>.json,
+与批次耗时无关; 进程正常退出时再发布一次标记为 exited 的最终快照。由 pii_harness.dashboard 汇总显示。
+"""
+from __future__ import annotations
+import json, os, resource, sys, threading, time
+from collections import deque
+from multiprocessing import util as mp_util
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .common import ensure_dir, result_dir
+
+# worker 发布指标的间隔 (秒)
+PUBLISH_INTERVAL = 10
+# 用于计算分位数的最近批次耗时个数
+LATENCY_WINDOW = 1000
+# 保留的 RSS 采样个数, 每次发布采样一次
+RSS_SAMPLES = 360
+
+
+def metrics_dir_for(dataset_name: str, debug: bool, root: str = ".") -> str:
+    return os.path.join(result_dir(dataset_name, debug, root), "metrics")
+
+
+def current_rss() -> int:
+    """当前进程的常驻内存 (字节); 没有 /proc 时退回峰值 RSS"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 上单位是字节, Linux 上是 KB
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class WorkerMetrics:
+    """一个进程的累计指标, record 每个批次调用一次; 由心跳线程定时发布, close 时发布最终快照"""
+
+    def __init__(self, metrics_dir: str):
+        ensure_dir(metrics_dir)
+        self.pid = os.getpid()
+        self.path = os.path.join(metrics_dir, f"worker_{self.pid}.json")
+        self.started_at = time.time()
+        self.published_at = 0.0
+        self.docs = 0
+        self.chars = 0
+        self.entities = 0
+        self.batches = 0
+        self.errors = 0
+        self.exited = False
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.rss_samples: Deque[Tuple[float, int]] = deque(maxlen=RSS_SAMPLES)
+        # record 在主线程, publish 在心跳线程
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.publish()
+        threading.Thread(
+            target=self._heartbeat, name="worker-metrics", daemon=True
+        ).start()
+
+    def _heartbeat(self) -> None:
+        # 单个批次再长, 指标文件也按时更新, dashboard 不会把忙碌的 worker 当成已退出
+        while not self._stopped.wait(PUBLISH_INTERVAL):
+            try:
+                self.publish()
+            except OSError as e:
+                print(f"Error publishing worker metrics to {self.path}: {e}")
+
+    def record(
+        self, texts: List[str], entity2cnt: Optional[Dict[str, int]], seconds: float
+    ) -> None:
+        """entity2cnt 为 None 表示该批次出错"""
+        with self._lock:
+            self.batches += 1
+            self.docs += len(texts)
+            self.chars += sum(len(text or "") for text in texts)
+            self.latencies.append(seconds)
+            if entity2cnt is None:
+                self.errors += 1
+            else:
+                self.entities += sum(entity2cnt.values())
+
+    def publish(self) -> None:
+        with self._lock:
+            now = time.time()
+            self.rss_samples.append((now, current_rss()))
+            latencies = sorted(self.latencies)
+            data = {
+                "pid": self.pid,
+                "started_at": self.started_at,
+                "updated_at": now,
+                "exited": self.exited,
+                "docs": self.docs,
+                "chars": self.chars,
+                "entities": self.entities,
+                "batches": self.batches,
+                "errors": self.errors,
+                "rss": self.rss_samples[-1][1],
+                "rss_samples": list(self.rss_samples),
+                "latency": {
+                    "p50": percentile(latencies, 0.5),
+                    "p90": percentile(latencies, 0.9),
+                    "p99": percentile(latencies, 0.99),
+                },
+            }
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as wf:
+                json.dump(data, wf)
+            os.replace(tmp_path, self.path)
+            self.published_at = now
+
+    def close(self) -> None:
+        """停止心跳并发布最终快照; 进程正常退出时自动调用 (包括进程池 close/join 后的 worker)"""
+        if self.exited:
+            return
+        self._stopped.set()
+        self.exited = True
+        self.publish()
+
+
+_metrics: Dict[Tuple[int, str], WorkerMetrics] = {}
+
+
+def worker_metrics(metrics_dir: str) -> WorkerMetrics:
+    """当前进程在 metrics_dir 下的指标对象; fork 出的子进程各自新建"""
+    key = (os.getpid(), os.path.abspath(metrics_dir))
+    if key not in _metrics:
+        metrics = WorkerMetrics(metrics_dir)
+        # atexit 不会在进程池的 worker 里运行, multiprocessing 的 finalizer 会
+        mp_util.Finalize(metrics, metrics.close, exitpriority=10)
+        _metrics[key] = metrics
+    return _metrics[key]
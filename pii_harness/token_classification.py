@@ -0,0 +1,120 @@
+import re
+from collections import Counter
+from typing import List, Optional
+
+from .detector import Detector
+
+
+def split_by_newline(text: str) -> List[str]:
+    # 按一个或多个连续换行符分割，通常用于分离段落
+    paragraphs = re.split(r"\n+", text)
+
+    # 过滤掉空字符串，并进行清理
+    cleaned_paragraphs = []
+    for p in paragraphs:
+        p_strip = p.strip()
+        if p_strip:
+            cleaned_paragraphs.append(p_strip)
+
+    return cleaned_paragraphs
+
+
+def split_inputs_if_long(
+    text: List[str], tokenizer, max_len: int = 256, is_debug: bool = False
+) -> List[str]:
+    inputs = []
+
+    for s in text:
+        s_stripped = s.strip()
+        # 1. 检查原始文本（或段落）长度
+        token_count = len(tokenizer(s_stripped)["input_ids"])
+
+        if token_count <= max_len:
+            inputs.append(s_stripped)
+        else:
+            # 2. 尝试按换行符（段落）分割
+            segments = split_by_newline(s_stripped)
+
+            # 用于收集最终满足长度要求的句子或段落
+            valid_parts = []
+
+            for segment in segments:
+                segment_token_count = len(tokenizer(segment)["input_ids"])
+
+                if segment_token_count <= max_len:
+                    # 段落/行分割后满足长度要求
+                    valid_parts.append(segment)
+                else:
+                    # 3. 如果段落/行仍太长，则按句末标点符号继续分割
+                    sentences = re.split(r"(?<=[。！？.!?])\s*", segment)
+
+                    # 4. 再次检查分割后的句子是否满足长度
+                    sentences = [
+                        sen.strip()
+                        for sen in sentences
+                        if sen.strip() and len(tokenizer(sen)["input_ids"]) <= max_len
+                    ]
+                    valid_parts.extend(sentences)
+                    if is_debug and sentences:
+                        print(
+                            "splited inputs example (Sentence Split):\n", sentences[0]
+                        )
+            # 5. 将处理后的所有部分加入到最终输出
+            if valid_parts:
+                inputs.extend(valid_parts)
+            elif is_debug and not valid_parts:
+                print(
+                    f"Warning: Segment too long ({token_count} tokens) and could not be broken down into valid parts."
+                )
+
+    return inputs
+
+
+class TokenClassificationDetector(Detector):
+    """HuggingFace token-classification 模型, 子类只需给出 model_name 和 max_len"""
+
+    per_document = True
+    use_pool = False
+    debug_batch_size = 1
+    model_name = ""
+    # 超过该 token 数的输入按段落/句子拆分
+    max_len = 256
+
+    def load(self) -> None:
+        from transformers import (
+            AutoTokenizer,
+            AutoModelForTokenClassification,
+            pipeline,
+        )
+
+        # 需要tokenizer计算token数目
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModelForTokenClassification.from_pretrained(self.model_name)
+        self.pipe = pipeline(
+            "token-classification",
+            model=model,
+            tokenizer=self.tokenizer,
+            device=self.device,
+        )
+
+    def count_documents(self, texts: List[str]) -> List[Optional[Counter]]:
+        inputs: List[str] = []
+        owners: List[int] = []
+        # 逐篇拆分超过最长窗口的输入, 记录每个片段属于哪篇文档
+        for idx, text in enumerate(texts):
+            segments = split_inputs_if_long(
+                [text], self.tokenizer, max_len=self.max_len, is_debug=self.debug
+            )
+            inputs.extend(segments)
+            owners.extend([idx] * len(segments))
+        try:
+            results = self.pipe(inputs)
+        except Exception:
+            if self.debug:
+                print("Inputs:\n", "".join(inputs))
+            raise
+        doc_counts: List[Optional[Counter]] = [Counter() for _ in texts]
+        for idx, sentence_results in zip(owners, results):
+            for entity_info in sentence_results:
+                doc_counts[idx][entity_info["entity"]] += 1
+        return doc_counts
@@ -0,0 +1,120 @@
+"""Record usage analytics without blocking the caller"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Optional, Tuple
+
+from piicatcher import __google_analytics_tid__
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_QUEUED_EVENTS = 32
+SEND_DEADLINE = 2.0
+
+
+class AnalyticsQueue:
+    """Send analytics events from a daemon thread.
+
+    ``record_event`` only puts the event in a bounded queue. Events are dropped
+    when the queue is full. The first time the transport fails, every pending
+    and future event is dropped so that an air-gapped host pays for at most
+    one connection attempt of ``deadline`` seconds, off the scan thread.
+    """
+
+    def __init__(
+        self,
+        tid: str = __google_analytics_tid__,
+        max_size: int = MAX_QUEUED_EVENTS,
+        deadline: float = SEND_DEADLINE,
+    ) -> None:
+        self._tid = tid
+        self._deadline = deadline
+        self._queue: "queue.Queue[Tuple[str, str]]" = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = None
+        self.disabled = False
+
+    def record_event(self, category: str, particulars: str) -> None:
+        if self.disabled:
+            return
+
+        self._start()
+        try:
+            self._queue.put_nowait((category, particulars))
+        except queue.Full:
+            LOGGER.debug("Analytics queue is full. Dropped event: %s", particulars)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Wait at most timeout (default: deadline) seconds for pending events"""
+        end = time.monotonic() + (timeout if timeout is not None else self._deadline)
+        while (
+            not self.disabled
+            and self._queue.unfinished_tasks > 0
+            and time.monotonic() < end
+        ):
+            time.sleep(0.01)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="piicatcher-analytics", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            category, particulars = self._queue.get()
+            try:
+                if not self.disabled:
+                    self._send(category, particulars)
+            except Exception as e:
+                LOGGER.debug("Disabled analytics. Failed to send event: %s", e)
+                self._disable()
+            finally:
+                self._queue.task_done()
+
+    def _disable(self) -> None:
+        self.disabled = True
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._queue.task_done()
+
+    def _send(self, category: str, particulars: str) -> None:
+        import requests
+        from goog_stats import Stats, consts
+
+        if self._stats is None:
+            self._stats = Stats(self._tid)
+        if not self._stats.is_enabled():
+            return
+
+        conf = self._stats.collection_conf
+        requests.post(
+            conf[consts.API_URL],
+            params={
+                "v": conf[consts.API_VERSION],
+                "tid": conf[consts.TARGET_ID],
+                "cid": conf[consts.CLIENT_ID],
+                "t": conf[consts.TARGET],
+                "dp": category,
+                "ul": conf[consts.USER_LANG],
+                "dt": particulars,
+            },
+            headers={"User-Agent": "pypip"},
+            timeout=self._deadline,
+        )
+
+
+_analytics = AnalyticsQueue()
+atexit.register(_analytics.flush)
+
+
+def record_event(category: str, particulars: str) -> None:
+    _analytics.record_event(category, particulars)
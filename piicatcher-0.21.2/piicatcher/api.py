@@ -1,29 +1,116 @@
 import datetime
 import logging
-from enum import Enum
-from typing import Any, Dict, List, Optional, Union
+import sys
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, TextIO, Union
 
-from dbcat.api import scan_sources
 from dbcat.catalog import Catalog, CatSource
-from goog_stats import Stats
+from sqlalchemy.orm.exc import NoResultFound
 
-from piicatcher import detectors
+from piicatcher import detectors, metrics
+from piicatcher.analytics import record_event
+from piicatcher.cache import DetectionCache
+from piicatcher.dbinfo import SampleMethod, supports_regex_pushdown
 from piicatcher.detectors import DatumDetector, MetadataDetector, detector_registry
-from piicatcher.generators import SMALL_TABLE_MAX, column_generator, data_generator
-from piicatcher.output import output_dict, output_tabular
-from piicatcher.scanner import data_scan, metadata_scan
+from piicatcher.generators import (
+    column_generator,
+    data_generator,
+    regex_count_generator,
+)
+from piicatcher.options import (
+    ADAPTIVE_SAMPLE_MAX,
+    SMALL_TABLE_MAX,
+    OutputFormat,
+    ScanTypeEnum,
+)
+from piicatcher.output import (
+    output_csv,
+    output_dict,
+    output_json_stream,
+    output_ndjson,
+    output_tabular,
+)
+from piicatcher.scanner import data_scan, metadata_scan, pushdown_scan, scan_logger
 
 LOGGER = logging.getLogger(__name__)
 
 
-class ScanTypeEnum(str, Enum):
-    metadata = "metadata"
-    data = "data"
+# Formats that are written to a stream while the catalog is read instead of
+# being returned by scan_database.
+STREAMING_OUTPUT_FORMATS = {
+    OutputFormat.ndjson: output_ndjson,
+    OutputFormat.csv: output_csv,
+    OutputFormat.json_stream: output_json_stream,
+}
 
 
-class OutputFormat(str, Enum):
-    tabular = "tabular"
-    json = "json"
+def _refresh_job_name(source: CatSource) -> str:
+    return "piicatcher.metadata_refresh.{}".format(source.name)
+
+
+def _is_metadata_fresh(
+    catalog: Catalog,
+    source: CatSource,
+    metadata_freshness: Optional[int],
+    filters: Dict[str, Optional[List[str]]],
+) -> bool:
+    """Check if scan_sources last ran recently enough and with the same filters"""
+    if metadata_freshness is None:
+        return False
+
+    try:
+        job = catalog.get_job(_refresh_job_name(source))
+    except NoResultFound:
+        return False
+
+    context = job.context or {}
+    if context.get("filters") != filters or "refreshed_at" not in context:
+        return False
+
+    refreshed_at = datetime.datetime.fromisoformat(context["refreshed_at"])
+    return datetime.datetime.utcnow() - refreshed_at < datetime.timedelta(
+        seconds=metadata_freshness
+    )
+
+
+def _save_metadata_refresh(
+    catalog: Catalog, source: CatSource, filters: Dict[str, Optional[List[str]]]
+) -> None:
+    """Record a run of scan_sources. Runs that skip it do not extend freshness."""
+    context = {
+        "refreshed_at": datetime.datetime.utcnow().isoformat(),
+        "filters": filters,
+    }
+    try:
+        job = catalog.get_job(_refresh_job_name(source))
+        job.context = context
+    except NoResultFound:
+        catalog.add_job(_refresh_job_name(source), source, context)
+
+
+def _watermark_job_name(source: CatSource) -> str:
+    return "piicatcher.watermarks.{}".format(source.name)
+
+
+def _load_watermarks(catalog: Catalog, source: CatSource) -> Dict[str, Any]:
+    """Per table watermarks of the last incremental data scan of source"""
+    try:
+        job = catalog.get_job(_watermark_job_name(source))
+    except NoResultFound:
+        return {}
+    return dict(job.context or {})
+
+
+def _save_watermarks(
+    catalog: Catalog, source: CatSource, watermarks: Dict[str, Any]
+) -> None:
+    try:
+        job = catalog.get_job(_watermark_job_name(source))
+        # Assign a new dict. Changes within the JSON column are not tracked.
+        job.context = dict(watermarks)
+    except NoResultFound:
+        catalog.add_job(_watermark_job_name(source), source, dict(watermarks))
 
 
 def scan_database(
@@ -38,7 +125,16 @@ def scan_database(
     include_table_regex: List[str] = None,
     exclude_table_regex: List[str] = None,
     sample_size: int = SMALL_TABLE_MAX,
-) -> Union[List[Any], Dict[Any, Any]]:
+    sample_method: SampleMethod = SampleMethod.row,
+    adaptive_sampling: bool = False,
+    max_sample_size: int = ADAPTIVE_SAMPLE_MAX,
+    regex_pushdown: bool = False,
+    incremental_data: bool = False,
+    detection_cache: Optional[Union[str, Path]] = None,
+    detection_cache_secret: Optional[str] = None,
+    metadata_freshness: Optional[int] = None,
+    output_stream: Optional[TextIO] = None,
+) -> Union[List[Any], Dict[Any, Any], None]:
     message = "Source: {source_name}, scan_type: {scan_type}, include_schema: {include_schema}, \
             exclude_schema: {exclude_schema}, include_table: {include_table}, exclude_schema: {exclude_table}".format(
         source_name=source.name,
@@ -60,100 +156,170 @@ def scan_database(
     status_message = "Success"
     exit_code = 0
 
-    with catalog.managed_session:
-        Stats().record_event("/pip/piicatcher", "scanning source")
-        scan_sources(
-            catalog=catalog,
-            source_names=[source.name],
-            include_schema_regex=include_schema_regex,
-            exclude_schema_regex=exclude_schema_regex,
-            include_table_regex=include_table_regex,
-            exclude_table_regex=exclude_table_regex,
-        )
+    with catalog.managed_session, metrics.collect() as scan_metrics:
+        record_event("/pip/piicatcher", "scanning source")
+        last_task = catalog.get_latest_task("piicatcher.{}".format(source.name))
 
         last_run: Optional[datetime.datetime] = None
         if incremental:
-            last_task = catalog.get_latest_task("piicatcher.{}".format(source.name))
             last_run = last_task.updated_at if last_task is not None else None
             if last_run is not None:
                 LOGGER.debug("Last Run at {}", last_run)
             else:
                 LOGGER.debug("No last run found")
 
+        # Metadata refreshed with other filters may miss schemata or tables
+        refresh_filters = {
+            name: list(regex) if regex is not None else None
+            for name, regex in [
+                ("include_schema_regex", include_schema_regex),
+                ("exclude_schema_regex", exclude_schema_regex),
+                ("include_table_regex", include_table_regex),
+                ("exclude_table_regex", exclude_table_regex),
+            ]
+        }
         try:
-            scan_sources(
-                catalog=catalog,
-                source_names=[source.name],
-                include_schema_regex=include_schema_regex,
-                exclude_schema_regex=exclude_schema_regex,
-                include_table_regex=include_table_regex,
-                exclude_table_regex=exclude_table_regex,
-            )
+            if _is_metadata_fresh(
+                catalog, source, metadata_freshness, refresh_filters
+            ):
+                LOGGER.info(
+                    "Metadata of %s refreshed within %d seconds. Skipping scan_sources",
+                    source.name,
+                    metadata_freshness,
+                )
+            else:
+                from dbcat.api import scan_sources
+
+                with scan_metrics.phase("scan_sources"):
+                    scan_sources(
+                        catalog=catalog,
+                        source_names=[source.name],
+                        include_schema_regex=include_schema_regex,
+                        exclude_schema_regex=exclude_schema_regex,
+                        include_table_regex=include_table_regex,
+                        exclude_table_regex=exclude_table_regex,
+                    )
+                _save_metadata_refresh(catalog, source, refresh_filters)
 
-            Stats().record_event("/pip/piicatcher", "scan_type: {}".format(scan_type))
+            record_event("/pip/piicatcher", "scan_type: {}".format(scan_type))
             detector_list = [
                 detector()
                 for detector in detectors.detector_registry.get_all().values()
                 if issubclass(detector, MetadataDetector)
             ]
 
-            metadata_scan(
-                catalog=catalog,
-                detectors=detector_list,
-                work_generator=column_generator(
-                    catalog=catalog,
-                    source=source,
-                    last_run=last_run,
-                    exclude_schema_regex_str=exclude_schema_regex,
-                    include_schema_regex_str=include_schema_regex,
-                    exclude_table_regex_str=exclude_table_regex,
-                    include_table_regex_str=include_table_regex,
-                ),
-                generator=column_generator(
-                    catalog=catalog,
-                    source=source,
-                    last_run=last_run,
-                    exclude_schema_regex_str=exclude_schema_regex,
-                    include_schema_regex_str=include_schema_regex,
-                    exclude_table_regex_str=exclude_table_regex,
-                    include_table_regex_str=include_table_regex,
-                ),
-            )
+            with scan_metrics.phase("metadata_scan"):
+                columns = list(
+                    column_generator(
+                        catalog=catalog,
+                        source=source,
+                        last_run=last_run,
+                        exclude_schema_regex_str=exclude_schema_regex,
+                        include_schema_regex_str=include_schema_regex,
+                        exclude_table_regex_str=exclude_table_regex,
+                        include_table_regex_str=include_table_regex,
+                    )
+                )
+                metadata_scan(
+                    catalog=catalog, detectors=detector_list, generator=columns,
+                )
             if scan_type != ScanTypeEnum.metadata:
                 detector_list = [
                     detector()
                     for detector in detectors.detector_registry.get_all().values()
                     if issubclass(detector, DatumDetector)
                 ]
-                Stats().record_event(
+                record_event(
                     "/pip/piicatcher", "scan_type: {}".format(scan_type)
                 )
-                data_scan(
-                    catalog=catalog,
-                    detectors=detector_list,
-                    work_generator=column_generator(
-                        catalog=catalog,
-                        source=source,
-                        last_run=last_run,
-                        exclude_schema_regex_str=exclude_schema_regex,
-                        include_schema_regex_str=include_schema_regex,
-                        exclude_table_regex_str=exclude_table_regex,
-                        include_table_regex_str=include_table_regex,
-                    ),
-                    generator=data_generator(
-                        catalog=catalog,
-                        source=source,
-                        last_run=last_run,
-                        exclude_schema_regex_str=exclude_schema_regex,
-                        include_schema_regex_str=include_schema_regex,
-                        exclude_table_regex_str=exclude_table_regex,
-                        include_table_regex_str=include_table_regex,
-                        sample_size=sample_size,
-                    ),
-                    sample_size=sample_size,
+                labeled_columns: Set[int] = set()
+                if regex_pushdown and supports_regex_pushdown(source.source_type):
+                    # Count regex matches in the database. Only detectors
+                    # without pushdown patterns need the sampled values.
+                    pushdown_detectors = [
+                        d for d in detector_list if d.pushdown_patterns is not None
+                    ]
+                    detector_list = [
+                        d for d in detector_list if d.pushdown_patterns is None
+                    ]
+                    with scan_metrics.phase("pushdown_scan"):
+                        pushdown_scan(
+                            catalog=catalog,
+                            detectors=pushdown_detectors,
+                            generator=regex_count_generator(
+                                catalog=catalog,
+                                source=source,
+                                patterns=[
+                                    pattern
+                                    for d in pushdown_detectors
+                                    for pattern in (d.pushdown_patterns or {}).values()
+                                ],
+                                last_run=last_run,
+                                exclude_schema_regex_str=exclude_schema_regex,
+                                include_schema_regex_str=include_schema_regex,
+                                exclude_table_regex_str=exclude_table_regex,
+                                include_table_regex_str=include_table_regex,
+                                sample_size=sample_size,
+                                sample_method=sample_method,
+                            ),
+                            labeled_columns=labeled_columns,
+                        )
+                elif regex_pushdown:
+                    LOGGER.warning(
+                        "Regex pushdown is not supported for %s", source.source_type
+                    )
+
+                # An incremental data scan samples every column of tables with
+                # new rows.
+                watermarks = (
+                    _load_watermarks(catalog, source) if incremental_data else None
+                )
+                # Results of detectors are cached by a keyed hash of the value
+                cache = (
+                    DetectionCache(detection_cache, detection_cache_secret)
+                    if detection_cache is not None
+                    else None
                 )
+                with (
+                    cache if cache is not None else nullcontext()
+                ), scan_metrics.phase("data_scan"):
+                    if len(detector_list) > 0:
+                        data_scan(
+                            catalog=catalog,
+                            detectors=detector_list,
+                            columns=columns,
+                            generator=data_generator(
+                                catalog=catalog,
+                                source=source,
+                                last_run=last_run if watermarks is None else None,
+                                exclude_schema_regex_str=exclude_schema_regex,
+                                include_schema_regex_str=include_schema_regex,
+                                exclude_table_regex_str=exclude_table_regex,
+                                include_table_regex_str=include_table_regex,
+                                sample_size=sample_size,
+                                sample_method=sample_method,
+                                adaptive=adaptive_sampling,
+                                max_sample_size=max_sample_size,
+                                labeled_columns=labeled_columns,
+                                watermarks=watermarks,
+                            ),
+                            sample_size=sample_size,
+                            labeled_columns=labeled_columns,
+                            cache=cache,
+                        )
+                        if watermarks is not None:
+                            _save_watermarks(catalog, source, watermarks)
 
-            if output_format == OutputFormat.tabular:
+            if output_format in STREAMING_OUTPUT_FORMATS:
+                STREAMING_OUTPUT_FORMATS[output_format](
+                    catalog=catalog,
+                    source=source,
+                    stream=output_stream if output_stream is not None else sys.stdout,
+                    list_all=list_all,
+                    last_run=last_run,
+                )
+                return None
+            elif output_format == OutputFormat.tabular:
                 return output_tabular(
                     catalog=catalog, source=source, list_all=list_all, last_run=last_run
                 )
@@ -166,6 +332,10 @@ def scan_database(
             exit_code = 1
             raise e
         finally:
+            scan_logger.info(
+                "scan_metrics",
+                extra={"source": source.name, **scan_metrics.to_dict()},
+            )
             catalog.add_task(
                 "piicatcher.{}".format(source.name),
                 exit_code,
@@ -174,7 +344,7 @@ def scan_database(
 
 
 def list_detectors() -> List[str]:
-    Stats().record_event("/pip/piicatcher", "list detectors")
+    record_event("/pip/piicatcher", "list detectors")
     return list(detector_registry.get_all().keys())
 
 
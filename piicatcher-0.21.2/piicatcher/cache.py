@@ -0,0 +1,196 @@
+"""Cache DatumDetector results by a fingerprint of the value"""
+import hashlib
+import hmac
+import logging
+import sqlite3
+from collections import OrderedDict
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Optional, Set, Tuple, Union
+
+from dbcat.catalog.pii_types import PiiType
+
+from piicatcher.detectors import DatumDetector
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_MAX_ENTRIES = 100000
+# Seconds to wait for a lock on the cache held by another scan
+CACHE_TIMEOUT = 60.0
+
+
+class DetectionCache:
+    """On-disk LRU cache of DatumDetector results.
+
+    Results are keyed by an HMAC-SHA256 of the value with ``secret``, so
+    sampled values are never written to disk and fingerprints cannot be
+    matched against guessed values without the secret. The secret is not
+    stored in the cache; the entries of a cache opened with another secret
+    are dropped. Only detectors that set ``version`` are cached and the
+    entries of older versions are dropped. The entries of a detector are
+    loaded into memory on first use and ``close`` writes back the entries
+    that were added or used. A failed write back is logged and does not
+    raise. Each detector keeps at most ``max_entries`` recently used entries.
+    """
+
+    _schema = (
+        "CREATE TABLE IF NOT EXISTS detections ("
+        "detector TEXT NOT NULL, version TEXT NOT NULL, "
+        "fingerprint BLOB NOT NULL, pii_type TEXT, seq INTEGER NOT NULL, "
+        "PRIMARY KEY (detector, fingerprint))"
+    )
+    _key_schema = "CREATE TABLE IF NOT EXISTS secret_check (digest BLOB NOT NULL)"
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        secret: Optional[str],
+        max_entries: int = CACHE_MAX_ENTRIES,
+    ) -> None:
+        if not secret:
+            raise ValueError("A secret is required to fingerprint cached values")
+        self._path = path
+        self._key = secret.encode("utf-8")
+        self._max_entries = max_entries
+        self._connection = sqlite3.connect(str(path), timeout=CACHE_TIMEOUT)
+        with self._connection:
+            self._connection.execute(self._schema)
+            self._connection.execute(self._key_schema)
+            self._check_secret()
+        self._entries: Dict[str, "OrderedDict[bytes, Optional[PiiType]]"] = {}
+        self._versions: Dict[str, str] = {}
+        # Entries to write back and to delete by close, and the last seq
+        # written for each detector
+        self._touched: Dict[str, Set[bytes]] = {}
+        self._evicted: Dict[str, Set[bytes]] = {}
+        self._last_seq: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self) -> "DetectionCache":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _check_secret(self) -> None:
+        # Fingerprints of another secret (or of older unkeyed versions of
+        # the cache) never match and are dropped.
+        digest = self.fingerprint("piicatcher.cache.secret_check")
+        row = self._connection.execute("SELECT digest FROM secret_check").fetchone()
+        if row is None or row[0] != digest:
+            if row is not None:
+                LOGGER.info("Detection cache secret changed. Dropping all entries")
+            self._connection.execute("DELETE FROM detections")
+            self._connection.execute("DELETE FROM secret_check")
+            self._connection.execute(
+                "INSERT INTO secret_check VALUES (?)", (digest,)
+            )
+
+    def fingerprint(self, datum: Any) -> bytes:
+        return hmac.new(
+            self._key, str(datum).encode("utf-8"), hashlib.sha256
+        ).digest()
+
+    def _load(
+        self, detector: DatumDetector
+    ) -> "OrderedDict[bytes, Optional[PiiType]]":
+        if detector.name in self._entries:
+            return self._entries[detector.name]
+
+        version = str(detector.version)
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM detections WHERE detector = ? AND version != ?",
+                (detector.name, version),
+            )
+        entries: "OrderedDict[bytes, Optional[PiiType]]" = OrderedDict()
+        last_seq = 0
+        for fingerprint, pii_type, seq in self._connection.execute(
+            "SELECT fingerprint, pii_type, seq FROM detections "
+            "WHERE detector = ? ORDER BY seq",
+            (detector.name,),
+        ):
+            entries[fingerprint] = (
+                PiiType.parse_raw(pii_type) if pii_type is not None else None
+            )
+            last_seq = seq
+        LOGGER.debug("Loaded %d cached results of %s", len(entries), detector.name)
+
+        self._entries[detector.name] = entries
+        self._versions[detector.name] = version
+        self._touched[detector.name] = set()
+        self._evicted[detector.name] = set()
+        self._last_seq[detector.name] = last_seq
+        return entries
+
+    def get(
+        self, detector: DatumDetector, fingerprint: bytes
+    ) -> Tuple[bool, Optional[PiiType]]:
+        """Return (True, result) on a hit and (False, None) on a miss"""
+        entries = self._load(detector)
+        if fingerprint in entries:
+            entries.move_to_end(fingerprint)
+            self._touched[detector.name].add(fingerprint)
+            self.hits += 1
+            return True, entries[fingerprint]
+
+        self.misses += 1
+        return False, None
+
+    def put(
+        self, detector: DatumDetector, fingerprint: bytes, pii_type: Optional[PiiType]
+    ) -> None:
+        entries = self._load(detector)
+        entries[fingerprint] = pii_type
+        entries.move_to_end(fingerprint)
+        self._touched[detector.name].add(fingerprint)
+        if len(entries) > self._max_entries:
+            evicted, _ = entries.popitem(last=False)
+            self._touched[detector.name].discard(evicted)
+            self._evicted[detector.name].add(evicted)
+
+    def close(self) -> None:
+        try:
+            self._write_back()
+        except sqlite3.Error as e:
+            LOGGER.warning(
+                "Could not write back the detection cache %s: %s", self._path, e
+            )
+        finally:
+            self._connection.close()
+        LOGGER.info(
+            "Detection cache hits: %d, misses: %d", self.hits, self.misses,
+        )
+
+    def _write_back(self) -> None:
+        with self._connection:
+            for name, entries in self._entries.items():
+                self._connection.executemany(
+                    "DELETE FROM detections WHERE detector = ? AND fingerprint = ?",
+                    ((name, fingerprint) for fingerprint in self._evicted[name]),
+                )
+                # Every entry is moved to the end when it is touched, so the
+                # touched entries are the most recent ones in LRU order.
+                touched = len(self._touched[name])
+                recent = list(islice(reversed(entries.items()), touched))[::-1]
+                last_seq = self._last_seq[name]
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (
+                            name,
+                            self._versions[name],
+                            fingerprint,
+                            pii_type.json() if pii_type is not None else None,
+                            last_seq + seq,
+                        )
+                        for seq, (fingerprint, pii_type) in enumerate(recent, 1)
+                    ),
+                )
+                LOGGER.debug(
+                    "Wrote %d and deleted %d cached results of %s",
+                    touched,
+                    len(self._evicted[name]),
+                    name,
+                )
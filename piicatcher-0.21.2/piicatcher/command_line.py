@@ -5,37 +5,74 @@ from contextlib import closing
 from pathlib import Path
 from typing import List, Optional
 
+import click
 import dbcat.settings
-from sqlalchemy.orm.exc import NoResultFound
 import typer
-from dbcat.api import init_db, open_catalog
-from dbcat.cli import app as catalog_app
-from dbcat.cli import (
-    exclude_schema_help_text,
-    exclude_table_help_text,
-    schema_help_text,
-    table_help_text,
-)
-from dbcat.generators import NoMatchesError
 from pythonjsonlogger import jsonlogger
-from tabulate import tabulate
-
-from piicatcher import __version__, __google_analytics_tid__
-from piicatcher.api import (
+from sqlalchemy.orm.exc import NoResultFound
+from typer.core import TyperGroup
+from typer.main import get_group
+
+from piicatcher import __google_analytics_tid__, __version__
+from piicatcher.analytics import record_event
+from piicatcher.dbinfo import SampleMethod
+from piicatcher.options import (
+    ADAPTIVE_SAMPLE_MAX,
+    SMALL_TABLE_MAX,
     OutputFormat,
     ScanTypeEnum,
-    list_detector_entry_points,
-    list_detectors,
-    scan_database,
 )
-from piicatcher.generators import SMALL_TABLE_MAX
-from piicatcher.scanner import data_logger, scan_logger
-from goog_stats import Stats
 
-app = typer.Typer()
+# dbcat.cli and dbcat.api import the metadata extractors of every supported
+# warehouse, and piicatcher.api imports the scanners. They are imported by the
+# commands that use them so that commands which do not scan, like
+# `detectors list`, start without loading them. The help texts are kept here.
+schema_help_text = """
+Scan only schemas matching schema. The schema parameter is interpreted as a
+regular expression. Multiple schemas can be selected by writing multiple
+--include-schema switches.
+"""
+exclude_schema_help_text = """
+Do not scan any schemas matching the schema pattern. The pattern is interpreted
+according to the same rules as for --include-schema. --exclude-schema can be
+given more than once.
+"""
+table_help_text = """
+Scan only tables matching table. The table parameter is interpreted as a
+regular expression. Multiple tables can be selected by writing multiple
+--include-table switches.
+"""
+exclude_table_help_text = """
+Do not scan any tables matching the table pattern. The pattern is interpreted
+according to the same rules as for --include-table. --exclude-table can be
+given more than once.
+"""
+
+
+class LazyCatalogGroup(TyperGroup):
+    """Load the dbcat `catalog` sub commands only when they are invoked"""
+
+    catalog_command_name = "catalog"
+
+    def list_commands(self, ctx: click.Context) -> List[str]:
+        return sorted(super().list_commands(ctx) + [self.catalog_command_name])
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> Optional[click.Command]:
+        if cmd_name != self.catalog_command_name:
+            return super().get_command(ctx, cmd_name)
+
+        from dbcat.cli import app as catalog_app
+
+        group = get_group(catalog_app)
+        group.name = self.catalog_command_name
+        return group
+
+
+app = typer.Typer(cls=LazyCatalogGroup)
 
 LOGGER = logging.getLogger(__name__)
-analytics = Stats(__google_analytics_tid__)
+
+DETECTION_CACHE_FILE = "detection_cache.sqlite"
 
 
 class TyperLoggerHandler(logging.Handler):
@@ -83,7 +120,7 @@ def log_config(log_level: str):
 
 
 def version_callback(value: bool):
-    analytics.record_event("/pip/piicatcher", "version evaluation")
+    record_event("/pip/piicatcher", "version evaluation")
     if value:
         print("{}".format(__version__))
         typer.Exit()
@@ -91,13 +128,17 @@ def version_callback(value: bool):
 
 def stats_callback(value: bool):
     if value:
-        analytics.disable_stat()
+        from goog_stats import Stats
+
+        Stats(__google_analytics_tid__).disable_stat()
         typer.Exit()
 
 
 def enable_stats_callback(value: bool):
     if value:
-        analytics.enable_stat()
+        from goog_stats import Stats
+
+        Stats(__google_analytics_tid__).enable_stat()
         typer.Exit()
 
 
@@ -147,18 +188,19 @@ def cli(
 ):
     logging.config.dictConfig(log_config(log_level=log_level.upper()))
 
+    # Same loggers as piicatcher.scanner.scan_logger and data_logger
     if log_scan:
         handler = logging.StreamHandler()
         handler.setFormatter(jsonlogger.JsonFormatter())
         handler.setLevel(logging.INFO)
-        scan_logger.addHandler(handler)
+        logging.getLogger("piicatcher.scan").addHandler(handler)
         LOGGER.debug("SCAN LOG setup")
 
     if log_data:
         handler = logging.StreamHandler()
         handler.setFormatter(jsonlogger.JsonFormatter())
         handler.setLevel(logging.INFO)
-        data_logger.addHandler(handler)
+        logging.getLogger("piicatcher.data").addHandler(handler)
         LOGGER.debug("DATA LOG setup")
 
     app_dir_path = Path(config_path)
@@ -173,7 +215,7 @@ def cli(
     dbcat.settings.CATALOG_SECRET = catalog_secret
     dbcat.settings.APP_DIR = app_dir_path
     dbcat.settings.OUTPUT_FORMAT = output_format
-    analytics.record_event("/pip/piicatcher", "piicatcher initiated")
+    record_event("/pip/piicatcher", "piicatcher initiated")
 
 
 @app.command()
@@ -201,7 +243,50 @@ def detect(
         sample_size: int = typer.Option(
             SMALL_TABLE_MAX, help="Sample size for large tables when running deep scan."
         ),
+        sample_method: SampleMethod = typer.Option(
+            SampleMethod.row,
+            help="Sample random rows (row) or random blocks of large tables (block). Block sampling reads less data.",
+        ),
+        adaptive_sampling: bool = typer.Option(
+            False,
+            help="Sample in growing rounds and stop sampling a column once it is labeled or likely free of PII.",
+        ),
+        max_sample_size: int = typer.Option(
+            ADAPTIVE_SAMPLE_MAX,
+            help="Maximum rows sampled for a column that is not decided with adaptive sampling.",
+        ),
+        regex_pushdown: bool = typer.Option(
+            False,
+            help="Count regex matches in the database instead of fetching sampled values. Supported for postgresql, redshift, snowflake, athena and bigquery.",
+        ),
+        incremental_data: bool = typer.Option(
+            False,
+            help="Only sample rows added since the last deep scan. Uses the max of an updated_at or id column, or the row count of each table.",
+        ),
+        detection_cache: bool = typer.Option(
+            False,
+            help="Cache detector results by a keyed hash of each sampled value in the app directory.",
+        ),
+        detection_cache_secret: Optional[str] = typer.Option(
+            None,
+            envvar="PIICATCHER_DETECTION_CACHE_SECRET",
+            help="Secret to key the hashes in the detection cache. Required with --detection-cache. Do not store it in the app directory.",
+        ),
+        metadata_freshness: Optional[int] = typer.Option(
+            None,
+            help="Skip refreshing the catalog if it was refreshed with the same filters within these many seconds.",
+        ),
 ):
+    from dbcat.api import init_db, open_catalog
+    from dbcat.generators import NoMatchesError
+
+    from piicatcher import api
+
+    if detection_cache and not detection_cache_secret:
+        raise typer.BadParameter(
+            "--detection-cache-secret is required with --detection-cache"
+        )
+
     catalog = open_catalog(
         app_dir=dbcat.settings.APP_DIR,
         secret=dbcat.settings.CATALOG_SECRET,
@@ -218,8 +303,8 @@ def detect(
         with catalog.managed_session:
             try:
                 source = catalog.get_source(source_name)
-                analytics.record_event("/pip/piicatcher", "scan initiated for {}".format(source))
-                op = scan_database(
+                record_event("/pip/piicatcher", "scan initiated for {}".format(source))
+                op = api.scan_database(
                     catalog=catalog,
                     source=source,
                     scan_type=scan_type,
@@ -231,8 +316,19 @@ def detect(
                     include_table_regex=include_table,
                     exclude_table_regex=exclude_table,
                     sample_size=sample_size,
+                    sample_method=sample_method,
+                    adaptive_sampling=adaptive_sampling,
+                    max_sample_size=max_sample_size,
+                    regex_pushdown=regex_pushdown,
+                    incremental_data=incremental_data,
+                    detection_cache=Path(dbcat.settings.APP_DIR) / DETECTION_CACHE_FILE
+                    if detection_cache
+                    else None,
+                    detection_cache_secret=detection_cache_secret,
+                    metadata_freshness=metadata_freshness,
                 )
-                typer.echo(message=str_output(op, dbcat.settings.OUTPUT_FORMAT))
+                if dbcat.settings.OUTPUT_FORMAT not in api.STREAMING_OUTPUT_FORMATS:
+                    typer.echo(message=str_output(op, dbcat.settings.OUTPUT_FORMAT))
             except NoMatchesError:
                 typer.echo(message=NoMatchesError.message)
                 typer.Exit(1)
@@ -246,6 +342,10 @@ detector_app = typer.Typer()
 
 @detector_app.command(name="list")
 def cli_list_detectors():
+    from tabulate import tabulate
+
+    from piicatcher.api import list_detectors
+
     typer.echo(
         message=tabulate(
             tabular_data=[(d,) for d in list_detectors()], headers=("detectors",)
@@ -255,6 +355,10 @@ def cli_list_detectors():
 
 @detector_app.command(name="entry-points")
 def cli_list_entry_points():
+    from tabulate import tabulate
+
+    from piicatcher.api import list_detector_entry_points
+
     typer.echo(
         message=tabulate(
             tabular_data=[(e,) for e in list_detector_entry_points()],
@@ -264,11 +368,12 @@ def cli_list_entry_points():
 
 
 app.add_typer(detector_app, name="detectors")
-app.add_typer(catalog_app, name="catalog")
 
 
 def str_output(op, output_format: OutputFormat):
     if output_format == OutputFormat.tabular:
+        from tabulate import tabulate
+
         return tabulate(
             tabular_data=op,
             headers=("schema", "table", "column", "PII Type", "Scanner"),
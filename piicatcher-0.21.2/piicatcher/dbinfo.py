@@ -1,13 +1,195 @@
+import re
 from abc import ABC, abstractmethod
-from typing import List
+from enum import Enum
+from typing import Dict, List, Optional, Type
 
 from dbcat.catalog import CatSchema, CatTable
 
+# Block samples are clustered. Ask for more rows than needed so that LIMIT is
+# usually reached.
+BLOCK_SAMPLE_OVERSAMPLING = 4
+
+
+class SampleMethod(str, Enum):
+    # Random rows. Scans (or sorts) a large part of the table on most engines.
+    row = "row"
+    # Random blocks, pages or a rowid range. Reads only the sampled blocks.
+    block = "block"
+
+
+# Expansions of the Python re character class escapes to ASCII bracket
+# expression bodies. Whitespace is spelled out as literal characters, which
+# every dialect accepts inside a bracket expression.
+_CLASS_ESCAPES = {
+    "\\d": "0-9",
+    "\\s": " \t\n\r\x0b\x0c",
+    "\\w": "a-zA-Z0-9_",
+}
+
+
+def _group_end(pattern: str, start: int) -> int:
+    """Index of the parenthesis that closes the group opened at start"""
+    depth = 0
+    i = start
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 1
+        elif c == "[":
+            i = _bracket_end(pattern, i)
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise ValueError("Unbalanced parenthesis in {}".format(pattern))
+
+
+def _bracket_end(pattern: str, start: int) -> int:
+    """Index of the ] that closes the bracket expression opened at start"""
+    i = start + 1
+    if pattern[i : i + 1] == "^":
+        i += 1
+    if pattern[i : i + 1] == "]":
+        i += 1
+    while pattern[i] != "]":
+        i += 2 if pattern[i] == "\\" else 1
+    return i
+
+
+def _portable_bracket(body: str, ignore_case: bool) -> str:
+    negated = body.startswith("^")
+    if negated:
+        body = body[1:]
+
+    out = ""
+    i = 0
+    while i < len(body):
+        if body[i] == "\\":
+            escape = body[i : i + 2]
+            if escape in _CLASS_ESCAPES:
+                out += _CLASS_ESCAPES[escape]
+            elif escape[1] in "]\\^-":
+                out += escape
+            else:
+                out += escape[1]
+            i += 2
+        else:
+            out += body[i]
+            i += 1
+
+    if ignore_case:
+        # Add the other case of every letter and letter range. A trailing -
+        # has to stay last to remain a literal.
+        trailing = "-" if out.endswith("-") and len(out) > 1 else ""
+        if trailing:
+            out = out[:-1]
+        out += "".join(
+            letters.swapcase()
+            for letters in re.findall(r"[a-zA-Z]-[a-zA-Z]|[a-zA-Z]", out)
+        )
+        out += trailing
+
+    return "[{}{}]".format("^" if negated else "", out)
+
+
+def portable_regex(pattern: str) -> str:
+    """Translate a Python re pattern into the subset shared by POSIX ERE, RE2
+    and Java regexes, so that a database can evaluate the expressions of a
+    DatumDetector.
+
+    Character class escapes become ASCII bracket expressions, a leading (?i)
+    becomes bracket expressions with both cases and non-capturing groups
+    become plain groups. Lookarounds and \\b are rewritten to consume the
+    neighbouring character (or an anchor). That keeps whether a value matches
+    only when they sit at the edges of the match, as in the CommonRegex
+    expressions. Raises ValueError for other constructs without an equivalent.
+    """
+    ignore_case = pattern.startswith("(?i)")
+    if ignore_case:
+        pattern = pattern[len("(?i)") :]
+    return _portable_regex(pattern, ignore_case)
+
+
+def _portable_regex(pattern: str, ignore_case: bool) -> str:
+    out = ""
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            escape = pattern[i : i + 2]
+            if escape in _CLASS_ESCAPES:
+                out += "[{}]".format(_CLASS_ESCAPES[escape])
+            elif escape == "\\W":
+                out += "[^{}]".format(_CLASS_ESCAPES["\\w"])
+            elif escape == "\\b":
+                word = _CLASS_ESCAPES["\\w"]
+                if i == 0:
+                    out += "(^|[^{}])".format(word)
+                else:
+                    out += "([^{}]|$)".format(word)
+            elif escape[1].isalnum():
+                raise ValueError("Unsupported escape {} in {}".format(escape, pattern))
+            else:
+                out += escape
+            i += 2
+        elif c == "[":
+            end = _bracket_end(pattern, i)
+            out += _portable_bracket(pattern[i + 1 : end], ignore_case)
+            i = end + 1
+        elif pattern.startswith("(?", i):
+            end = _group_end(pattern, i)
+            if pattern.startswith(("(?:", "(?="), i):
+                out += "(" + _portable_regex(pattern[i + 3 : end], ignore_case) + ")"
+            elif pattern.startswith(("(?!", "(?<!"), i):
+                inner = pattern[pattern.index("!", i) + 1 : end]
+                negated = _portable_regex(inner, ignore_case)
+                if not (negated.startswith("[") and negated.endswith("]")):
+                    raise ValueError(
+                        "Unsupported lookaround {} in {}".format(inner, pattern)
+                    )
+                if negated.startswith("[^"):
+                    negated = "[" + negated[2:]
+                else:
+                    negated = "[^" + negated[1:]
+                if pattern.startswith("(?!", i):
+                    out += "({}|$)".format(negated)
+                else:
+                    out += "(^|{})".format(negated)
+            else:
+                raise ValueError(
+                    "Unsupported group {} in {}".format(pattern[i : end + 1], pattern)
+                )
+            i = end + 1
+        elif ignore_case and c.isalpha():
+            out += "[{}{}]".format(c.lower(), c.upper())
+            i += 1
+        else:
+            out += c
+            i += 1
+    return out
+
+
+def _sample_percent(num_rows: int, table_count: int) -> str:
+    percent = min(
+        100.0, 100.0 * num_rows * BLOCK_SAMPLE_OVERSAMPLING / max(table_count, 1)
+    )
+    return "{:.10f}".format(percent).rstrip("0").rstrip(".")
+
 
 class DbInfo(ABC):
     _query_template = "select {column_list} from {schema_name}.{table_name}"
     _count_query = "select count(*) from {schema_name}.{table_name}"
+    _max_query = "select max({column}) from {schema_name}.{table_name}"
+    _incremental_condition = " where {column} > :watermark limit {num_rows}"
+    _page_condition = " limit {num_rows} offset {offset}"
     _column_escape = '"'
+    # Boolean SQL expression that matches a column against a regex. Dialects
+    # that set it can count regex matches in the database.
+    _regex_match_template: Optional[str] = None
+    _regex_count_template = "SELECT {counts} FROM ({query}) sample"
 
     def __init__(self, schema: CatSchema, table: CatTable) -> None:
         super().__init__()
@@ -19,6 +201,13 @@ class DbInfo(ABC):
             schema_name=self.schema_name, table_name=self.table_name
         )
 
+    def get_max_query(self, column: str) -> str:
+        return self._max_query.format(
+            column=self._quote_column(column),
+            schema_name=self.schema_name,
+            table_name=self.table_name,
+        )
+
     def get_select_query(self, column_list: List[str]) -> str:
         return self._query_template.format(
             column_list="{col_list}".format(
@@ -37,10 +226,69 @@ class DbInfo(ABC):
     def get_sample_query(self, column_list, num_rows) -> str:
         pass
 
+    def get_block_sample_query(
+        self, column_list: List[str], num_rows: int, table_count: int
+    ) -> str:
+        """Sample num_rows rows of a table with table_count rows by reading a
+        random subset of its blocks"""
+        raise NotImplementedError
+
+    def get_incremental_query(
+        self, column_list: List[str], watermark_column: str, num_rows: int
+    ) -> str:
+        """Select at most num_rows rows with watermark_column greater than the
+        :watermark bind parameter"""
+        condition = self._incremental_condition.format(
+            column=self._quote_column(watermark_column), num_rows=num_rows
+        )
+        return self.get_select_query(column_list) + condition
+
+    def get_page_query(
+        self, column_list: List[str], num_rows: int, offset: int
+    ) -> str:
+        """Select at most num_rows rows after skipping the first offset rows"""
+        condition = self._page_condition.format(num_rows=num_rows, offset=offset)
+        return self.get_select_query(column_list) + condition
+
+    def _quote_column(self, column: str) -> str:
+        return "{escape}{name}{escape}".format(name=column, escape=self._column_escape)
+
+    def _regex_column(self, column: str) -> str:
+        return self._quote_column(column)
+
+    def _regex_literal(self, pattern: str) -> str:
+        return "'{}'".format(pattern.replace("'", "''"))
+
+    def get_regex_count_query(
+        self, column_list: List[str], patterns: List[str], query: str
+    ) -> str:
+        """Count the rows of query that match each pattern in each column.
+
+        The result is one row with len(column_list) * len(patterns) counts,
+        ordered by column and then by pattern. patterns use Python re syntax
+        and are translated with portable_regex. query is a select or sample
+        query of column_list.
+        """
+        if self._regex_match_template is None:
+            raise NotImplementedError
+
+        counts = ",".join(
+            "SUM(CASE WHEN {match} THEN 1 ELSE 0 END)".format(
+                match=self._regex_match_template.format(
+                    column=self._regex_column(column),
+                    pattern=self._regex_literal(portable_regex(pattern)),
+                )
+            )
+            for column in column_list
+            for pattern in patterns
+        )
+        return self._regex_count_template.format(counts=counts, query=query)
+
 
 class Sqlite(DbInfo):
     _query_template = "select {column_list} from {table_name}"
     _count_query = "select count(*) from {table_name}"
+    _max_query = "select max({column}) from {table_name}"
 
     def get_select_query(self, column_list: List[str]) -> str:
         return self._query_template.format(
@@ -48,9 +296,25 @@ class Sqlite(DbInfo):
             table_name=self.table_name,
         )
 
+    _block_sample_query_template = (
+        "select {column_list} from {table_name} where rowid > "
+        "(select abs(random()) % max(max(rowid) - {num_rows}, 1) from {table_name}) "
+        "limit {num_rows}"
+    )
+
     def get_sample_query(self, column_list, num_rows) -> str:
         raise NotImplementedError
 
+    def get_block_sample_query(
+        self, column_list: List[str], num_rows: int, table_count: int
+    ) -> str:
+        # A range of rowids that starts at a random rowid
+        return self._block_sample_query_template.format(
+            column_list='"{0}"'.format('","'.join(col for col in column_list)),
+            table_name=self.table_name,
+            num_rows=num_rows,
+        )
+
 
 class MySQL(DbInfo):
     _sample_query_template = (
@@ -69,6 +333,8 @@ class MySQL(DbInfo):
 
 class Postgres(DbInfo):
     _sample_query_template = "SELECT {column_list} FROM {schema_name}.{table_name} TABLESAMPLE BERNOULLI (10) LIMIT {num_rows}"
+    _block_sample_query_template = "SELECT {column_list} FROM {schema_name}.{table_name} TABLESAMPLE SYSTEM ({percent}) LIMIT {num_rows}"
+    _regex_match_template = "{column} ~ {pattern}"
 
     def get_sample_query(self, column_list: List[str], num_rows) -> str:
         return self._sample_query_template.format(
@@ -78,22 +344,54 @@ class Postgres(DbInfo):
             num_rows=num_rows,
         )
 
+    def get_block_sample_query(
+        self, column_list: List[str], num_rows: int, table_count: int
+    ) -> str:
+        return self._block_sample_query_template.format(
+            column_list='"{0}"'.format('","'.join(col for col in column_list)),
+            schema_name=self.schema_name,
+            table_name=self.table_name,
+            num_rows=num_rows,
+            percent=_sample_percent(num_rows, table_count),
+        )
+
 
 class Redshift(Postgres):
     _sample_query_template = "SELECT {column_list} FROM {schema_name}.{table_name} ORDER BY RANDOM() LIMIT {num_rows}"
+    # Redshift has no TABLESAMPLE. Filtering on RANDOM() avoids the sort and
+    # the scan stops once LIMIT is reached.
+    _block_sample_query_template = "SELECT {column_list} FROM {schema_name}.{table_name} WHERE RANDOM() < {percent} / 100.0 LIMIT {num_rows}"
 
 
 class BigQuery(DbInfo):
     _count_query = "select count(*) from {project_id}.{schema_name}.{table_name}"
+    _max_query = "select max({column}) from {project_id}.{schema_name}.{table_name}"
     _query_template = (
         "SELECT {column_list} FROM {project_id}.{schema_name}.{table_name}"
     )
     _sample_query_template = "SELECT {column_list} FROM {project_id}.{schema_name}.{table_name} ORDER BY RAND() LIMIT {num_rows}"
+    _block_sample_query_template = "SELECT {column_list} FROM {project_id}.{schema_name}.{table_name} TABLESAMPLE SYSTEM ({percent} PERCENT) LIMIT {num_rows}"
+    _regex_match_template = "REGEXP_CONTAINS({column}, {pattern})"
 
     def __init__(self, schema: CatSchema, table: CatTable, project_id: str) -> None:
         super().__init__(schema, table)
         self.project_id = project_id
 
+    def get_max_query(self, column: str) -> str:
+        return self._max_query.format(
+            column=column,
+            project_id=self.project_id,
+            schema_name=self.schema_name,
+            table_name=self.table_name,
+        )
+
+    def _quote_column(self, column: str) -> str:
+        return column
+
+    def _regex_literal(self, pattern: str) -> str:
+        # Raw string so that backslashes reach RE2 unchanged
+        return "r'{}'".format(pattern.replace("'", "\\x27"))
+
     def get_count_query(self) -> str:
         return self._count_query.format(
             project_id=self.project_id,
@@ -125,9 +423,42 @@ class BigQuery(DbInfo):
             project_id=self.project_id,
         )
 
+    def get_block_sample_query(
+        self, column_list: List[str], num_rows: int, table_count: int
+    ) -> str:
+        return self._block_sample_query_template.format(
+            column_list=",".join(column_list),
+            schema_name=self.schema_name,
+            table_name=self.table_name,
+            num_rows=num_rows,
+            project_id=self.project_id,
+            percent=_sample_percent(num_rows, table_count),
+        )
+
 
 class Snowflake(DbInfo):
     _sample_query_template = "SELECT {column_list} FROM {schema_name}.{table_name} TABLESAMPLE BERNOULLI ({num_rows} ROWS)"
+    _block_sample_query_template = "SELECT {column_list} FROM {schema_name}.{table_name} SAMPLE BLOCK ({percent}) LIMIT {num_rows}"
+    # REGEXP_LIKE matches the whole value
+    _regex_match_template = "REGEXP_LIKE({column}, {pattern}, 's')"
+
+    def get_block_sample_query(
+        self, column_list: List[str], num_rows: int, table_count: int
+    ) -> str:
+        return self._block_sample_query_template.format(
+            column_list=",".join(column_list),
+            schema_name=self.schema_name,
+            table_name=self.table_name,
+            num_rows=num_rows,
+            percent=_sample_percent(num_rows, table_count),
+        )
+
+    def _regex_column(self, column: str) -> str:
+        return column
+
+    def _regex_literal(self, pattern: str) -> str:
+        # Dollar quoted so that backslashes are not treated as escapes
+        return "$$.*({}).*$$".format(pattern)
 
     def get_sample_query(
         self,
@@ -144,21 +475,29 @@ class Snowflake(DbInfo):
 
 class Athena(Postgres):
     _sample_query_template = "SELECT {column_list} FROM {schema_name}.{table_name} ORDER BY RAND() LIMIT {num_rows}"
+    _regex_match_template = "REGEXP_LIKE({column}, {pattern})"
+
+
+_dbinfo_classes: Dict[str, Type[DbInfo]] = {
+    "sqlite": Sqlite,
+    "mysql": MySQL,
+    "postgresql": Postgres,
+    "redshift": Redshift,
+    "snowflake": Snowflake,
+    "athena": Athena,
+    "bigquery": BigQuery,
+}
 
 
 def get_dbinfo(source_type: str, *args, **kwargs) -> DbInfo:
-    if source_type == "sqlite":
-        return Sqlite(*args, **kwargs)
-    elif source_type == "mysql":
-        return MySQL(*args, **kwargs)
-    elif source_type == "postgresql":
-        return Postgres(*args, **kwargs)
-    elif source_type == "redshift":
-        return Redshift(*args, **kwargs)
-    elif source_type == "snowflake":
-        return Snowflake(*args, **kwargs)
-    elif source_type == "athena":
-        return Athena(*args, **kwargs)
-    elif source_type == "bigquery":
-        return BigQuery(*args, **kwargs)
-    raise AttributeError
+    if source_type not in _dbinfo_classes:
+        raise AttributeError
+    return _dbinfo_classes[source_type](*args, **kwargs)
+
+
+def supports_regex_pushdown(source_type: str) -> bool:
+    """True if regex matches can be counted in a database of source_type"""
+    return (
+        source_type in _dbinfo_classes
+        and _dbinfo_classes[source_type]._regex_match_template is not None
+    )
@@ -1,6 +1,6 @@
 import inspect
 from abc import ABC, abstractmethod
-from typing import Optional, Type
+from typing import Dict, Optional, Type
 
 import catalogue
 from dbcat.catalog.models import CatColumn
@@ -22,6 +22,22 @@ class MetadataDetector(Detector):
 
 
 class DatumDetector(Detector):
+    # Set to True to run the detector in a pool of worker processes during a
+    # data scan. The detector is created once per worker and receives a
+    # piicatcher.parallel.ColumnInfo instead of a CatColumn.
+    run_in_pool: bool = False
+
+    # Regexes per PiiType that the database can evaluate instead of detect()
+    # when a data scan runs with regex pushdown. Patterns use Python re syntax,
+    # are translated by piicatcher.dbinfo.portable_regex and are checked in
+    # order.
+    pushdown_patterns: Optional[Dict[Type[PiiType], str]] = None
+
+    # Detectors whose result depends only on the datum can set a version to
+    # have results cached by piicatcher.cache.DetectionCache. Change the
+    # version whenever the detection logic changes.
+    version: Optional[str] = None
+
     @abstractmethod
     def detect(self, column: CatColumn, datum: str) -> Optional[PiiType]:
         """Scan the text and return an array of PiiTypes that are found"""
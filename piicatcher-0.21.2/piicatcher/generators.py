@@ -1,17 +1,37 @@
 import datetime
 import logging
+import math
+import numbers
 import re
-from typing import Generator, List, Optional, Tuple
+import time
+from typing import Any, Dict, Generator, List, Optional, Set, Tuple
 
 from dbcat.catalog import Catalog, CatColumn, CatSchema, CatSource, CatTable
 from dbcat.generators import NoMatchesError, table_generator
-from sqlalchemy import create_engine, exc
+from sqlalchemy import create_engine, exc, text
 
-from piicatcher.dbinfo import DbInfo, get_dbinfo
+from piicatcher import metrics
+from piicatcher.dbinfo import DbInfo, SampleMethod, get_dbinfo
+from piicatcher.options import ADAPTIVE_SAMPLE_MAX, SMALL_TABLE_MAX
 
 LOGGER = logging.getLogger(__name__)
 
-SMALL_TABLE_MAX = 100
+FETCH_SIZE = 1000
+
+# Adaptive sampling fetches enough rows to decide a column without nulls in
+# the first round and grows every following round by SAMPLE_ROUND_GROWTH.
+SAMPLE_ROUND_GROWTH = 3
+PII_RATE_THRESHOLD = 0.05
+
+# Columns that are used as a watermark by an incremental data scan, in order of
+# preference. Tables without any of them fall back to the row count.
+WATERMARK_COLUMN_NAMES = [
+    "updated_at",
+    "modified_at",
+    "last_modified",
+    "last_updated",
+    "id",
+]
 
 
 def column_generator(
@@ -41,6 +61,29 @@ def column_generator(
         raise NoMatchesError
 
 
+def _table_key(schema: CatSchema, table: CatTable) -> str:
+    return "{}.{}".format(schema.name, table.name)
+
+
+def _fetch_rows(result, table_key: str, size: int = FETCH_SIZE) -> List[Any]:
+    """fetchmany that records the rows fetched in the scan metrics"""
+    scan_metrics = metrics.current()
+    if scan_metrics is None:
+        return result.fetchmany(size)
+
+    start = time.perf_counter()
+    rows = result.fetchmany(size)
+    scan_metrics.add_rows(table_key, rows, time.perf_counter() - start)
+    return rows
+
+
+def _iter_rows(result, table_key: str) -> Generator[Any, None, None]:
+    rows = _fetch_rows(result, table_key)
+    while len(rows) > 0:
+        yield from rows
+        rows = _fetch_rows(result, table_key)
+
+
 def _get_table_count(
     schema: CatSchema,
     table: CatTable,
@@ -51,12 +94,34 @@ def _get_table_count(
     count = dbinfo.get_count_query()
     logging.debug("Count Query: %s" % count)
 
-    result = connection.execute(count)
+    result = metrics.execute(connection, count, "count", _table_key(schema, table))
     row = result.fetchone()
 
     return int(row[0])
 
 
+def _get_sample_query(
+    dbinfo: DbInfo,
+    column_name_list: List[str],
+    num_rows: int,
+    table_count: int,
+    sample_method: SampleMethod = SampleMethod.row,
+) -> str:
+    """Return a sample query. Falls back to row sampling if the database does
+    not support sample_method. Raises NotImplementedError if it does not
+    support sampling at all."""
+    if sample_method == SampleMethod.block:
+        try:
+            return dbinfo.get_block_sample_query(
+                column_name_list, num_rows, table_count
+            )
+        except NotImplementedError:
+            LOGGER.debug(
+                "Block sampling is not implemented for %s", dbinfo.__class__.__name__
+            )
+    return dbinfo.get_sample_query(column_name_list, num_rows)
+
+
 def _get_query(
     schema: CatSchema,
     table: CatTable,
@@ -65,6 +130,7 @@ def _get_query(
     connection,
     source: CatSource,
     sample_size: int = SMALL_TABLE_MAX,
+    sample_method: SampleMethod = SampleMethod.row,
 ) -> str:
     count = _get_table_count(schema, table, dbinfo, connection, source)
     LOGGER.debug("No. of rows in {}.{} is {}".format(schema.name, table.name, count))
@@ -73,9 +139,8 @@ def _get_query(
 
     if count > sample_size:
         try:
-            query = dbinfo.get_sample_query(
-                column_name_list,
-                sample_size,
+            query = _get_sample_query(
+                dbinfo, column_name_list, sample_size, count, sample_method
             )
             LOGGER.debug("Choosing a SAMPLE query as table size is big")
         except NotImplementedError:
@@ -85,22 +150,29 @@ def _get_query(
     return query
 
 
+def _create_engine(source: CatSource):
+    if source.source_type == "bigquery":
+        return create_engine(source.conn_string, credentials_path=source.key_path)
+    return create_engine(source.conn_string)
+
+
+def _get_dbinfo(source: CatSource, schema: CatSchema, table: CatTable) -> DbInfo:
+    if source.source_type == "bigquery":
+        return get_dbinfo(source.source_type, schema, table, source.project_id)
+    return get_dbinfo(source.source_type, schema, table)
+
+
 def _row_generator(
     source: CatSource,
     schema: CatSchema,
     table: CatTable,
     column_list: List[CatColumn],
     sample_size=SMALL_TABLE_MAX,
+    sample_method: SampleMethod = SampleMethod.row,
 ):
-    if source.source_type == "bigquery":
-        engine = create_engine(source.conn_string, credentials_path=source.key_path)
-    else:
-        engine = create_engine(source.conn_string)
+    engine = _create_engine(source)
     with engine.connect() as conn:
-        if source.source_type == "bigquery":
-            dbinfo = get_dbinfo(source.source_type, schema, table, source.project_id)
-        else:
-            dbinfo = get_dbinfo(source.source_type, schema, table)
+        dbinfo = _get_dbinfo(source, schema, table)
         query = _get_query(
             schema=schema,
             table=table,
@@ -109,13 +181,188 @@ def _row_generator(
             connection=conn,
             source=source,
             sample_size=sample_size,
+            sample_method=sample_method,
         )
         LOGGER.debug(query)
-        result = conn.execute(query)
-        row = result.fetchone()
-        while row is not None:
-            yield row
-            row = result.fetchone()
+        result = metrics.execute(conn, query, "rows", _table_key(schema, table))
+        yield from _iter_rows(result, _table_key(schema, table))
+
+
+def _min_clean_values(pii_rate_threshold: float) -> int:
+    """Number of non-null values without a match after which the PII rate of a
+    column is below pii_rate_threshold with 95% confidence (rule of three)."""
+    return math.ceil(3 / pii_rate_threshold)
+
+
+def _adaptive_row_generator(
+    source: CatSource,
+    schema: CatSchema,
+    table: CatTable,
+    column_list: List[CatColumn],
+    labeled_columns: Set[int],
+    max_sample_size: int = ADAPTIVE_SAMPLE_MAX,
+    pii_rate_threshold: float = PII_RATE_THRESHOLD,
+    sample_method: SampleMethod = SampleMethod.row,
+) -> Generator[Tuple[CatColumn, Any], None, None]:
+    """Sample a table in growing rounds with one LIMIT bounded query per round.
+
+    A column is dropped from the following rounds once it is in
+    labeled_columns or once enough non-null values have been sampled without
+    a label to bound its PII rate below pii_rate_threshold. The first round
+    has enough rows to decide a column without nulls. Sampling stops when no
+    column is left or max_sample_size rows have been requested.
+
+    Tables with at most max_sample_size rows are read page by page. Every
+    round of a larger table is a new sample query.
+    """
+    key = _table_key(schema, table)
+    min_values = _min_clean_values(pii_rate_threshold)
+    non_null: Dict[int, int] = {column.id: 0 for column in column_list}
+
+    def pending() -> List[CatColumn]:
+        return [
+            column
+            for column in column_list
+            if column.id not in labeled_columns and non_null[column.id] < min_values
+        ]
+
+    def emit(rows) -> Generator[Tuple[CatColumn, Any], None, None]:
+        # Columns decided in an earlier round are skipped for the whole round.
+        columns = {column.id for column in pending()}
+        for row in rows:
+            for column, val in zip(column_list, row):
+                if column.id not in columns or column.id in labeled_columns:
+                    continue
+                if val is not None:
+                    non_null[column.id] += 1
+                yield column, val
+
+    engine = _create_engine(source)
+    with engine.connect() as conn:
+        dbinfo = _get_dbinfo(source, schema, table)
+        count = _get_table_count(schema, table, dbinfo, conn, source)
+        LOGGER.debug("No. of rows in %s.%s is %d", schema.name, table.name, count)
+
+        column_names = [column.name for column in column_list]
+        sampled = count > max_sample_size
+        requested = 0
+        fetched = 0
+        round_size = min_values
+        while requested < max_sample_size and len(pending()) > 0:
+            num_rows = min(round_size, max_sample_size - requested)
+            query = None
+            if sampled:
+                try:
+                    query = _get_sample_query(
+                        dbinfo, column_names, num_rows, count, sample_method
+                    )
+                except NotImplementedError:
+                    LOGGER.warning(
+                        "Sample Row is not implemented for %s"
+                        % dbinfo.__class__.__name__
+                    )
+                    sampled = False
+            if query is None:
+                query = dbinfo.get_page_query(column_names, num_rows, requested)
+            LOGGER.debug(query)
+            result = metrics.execute(conn, query, "rows", key)
+            try:
+                rows = _fetch_rows(result, key, num_rows)
+            finally:
+                result.close()
+
+            yield from emit(rows)
+            requested += num_rows
+            fetched += len(rows)
+            round_size *= SAMPLE_ROUND_GROWTH
+            # A short page is the end of the table
+            if len(rows) == 0 or (not sampled and len(rows) < num_rows):
+                break
+
+        LOGGER.debug(
+            "Sampled %d rows of %s.%s adaptively", fetched, schema.name, table.name
+        )
+
+
+def _get_watermark_column(column_list: List[CatColumn]) -> Optional[CatColumn]:
+    columns = {column.name.lower(): column for column in column_list}
+    for name in WATERMARK_COLUMN_NAMES:
+        if name in columns:
+            return columns[name]
+    return None
+
+
+def _watermark_value(value: Any) -> Any:
+    """Convert a watermark to a value that can be stored as JSON"""
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, numbers.Number):
+        return int(value) if value == int(value) else float(value)
+    # str() of a datetime compares correctly with the values of a timestamp
+    # column in SQL
+    return str(value)
+
+
+def _incremental_row_generator(
+    source: CatSource,
+    schema: CatSchema,
+    table: CatTable,
+    column_list: List[CatColumn],
+    watermark_column: Optional[CatColumn],
+    watermarks: Dict[str, Dict[str, Any]],
+    sample_size: int = SMALL_TABLE_MAX,
+    sample_method: SampleMethod = SampleMethod.row,
+):
+    """Sample the rows added since the watermark of the table in watermarks.
+
+    With a watermark column, only rows with a greater value are sampled. With
+    the row count as watermark, an unchanged table is skipped and a changed
+    one is sampled like _row_generator does. The new watermark is stored in
+    watermarks once all rows have been yielded.
+    """
+    key = _table_key(schema, table)
+    column_name = watermark_column.name if watermark_column is not None else None
+    engine = _create_engine(source)
+    with engine.connect() as conn:
+        dbinfo = _get_dbinfo(source, schema, table)
+        if column_name is not None:
+            current = _watermark_value(
+                metrics.execute(
+                    conn, dbinfo.get_max_query(column_name), "watermark", key
+                ).scalar()
+            )
+        else:
+            current = _get_table_count(schema, table, dbinfo, conn, source)
+
+        previous = watermarks.get(key)
+        query = None
+        if previous is not None and previous["column"] == column_name:
+            if previous["value"] == current:
+                LOGGER.debug("No new rows in %s since the last scan", key)
+                return
+            if column_name is not None and previous["value"] is not None:
+                query = text(
+                    dbinfo.get_incremental_query(
+                        [col.name for col in column_list], column_name, sample_size
+                    )
+                ).bindparams(watermark=previous["value"])
+
+        if query is None:
+            query = _get_query(
+                schema=schema,
+                table=table,
+                column_list=column_list,
+                dbinfo=dbinfo,
+                connection=conn,
+                source=source,
+                sample_size=sample_size,
+                sample_method=sample_method,
+            )
+        LOGGER.debug(query)
+        result = metrics.execute(conn, query, "rows", key)
+        yield from _iter_rows(result, key)
+
+    watermarks[key] = {"column": column_name, "value": current}
 
 
 def _filter_text_columns(column_list: List[CatColumn]) -> List[CatColumn]:
@@ -148,7 +395,28 @@ def data_generator(
     include_table_regex_str: List[str] = None,
     exclude_table_regex_str: List[str] = None,
     sample_size=SMALL_TABLE_MAX,
+    adaptive: bool = False,
+    max_sample_size: int = ADAPTIVE_SAMPLE_MAX,
+    labeled_columns: Optional[Set[int]] = None,
+    pii_rate_threshold: float = PII_RATE_THRESHOLD,
+    sample_method: SampleMethod = SampleMethod.row,
+    watermarks: Optional[Dict[str, Dict[str, Any]]] = None,
 ) -> Generator[Tuple[CatSchema, CatTable, CatColumn, str], None, None]:
+    """Yield sampled values of text columns.
+
+    By default every table is sampled with one query of sample_size rows. With
+    adaptive set, rows are fetched in growing rounds of at most max_sample_size
+    rows in total and a column stops being sampled once its id is added to
+    labeled_columns (see data_scan) or its PII rate is bound below
+    pii_rate_threshold.
+
+    With watermarks set, only rows added since the watermark of a table are
+    sampled and watermarks is updated in place (see
+    _incremental_row_generator). Adaptive sampling is not used then.
+    """
+    if labeled_columns is None:
+        labeled_columns = set()
+
     for schema, table in table_generator(
         catalog=catalog,
         source=source,
@@ -161,13 +429,41 @@ def data_generator(
             columns = catalog.get_columns_for_table(table=table, newer_than=last_run)
             columns = _filter_text_columns(columns)
 
-            if len(columns) > 0:
+            if len(columns) > 0 and watermarks is not None:
+                for row in _incremental_row_generator(
+                    source=source,
+                    schema=schema,
+                    table=table,
+                    column_list=columns,
+                    watermark_column=_get_watermark_column(
+                        catalog.get_columns_for_table(table=table)
+                    ),
+                    watermarks=watermarks,
+                    sample_size=sample_size,
+                    sample_method=sample_method,
+                ):
+                    for col, val in zip(columns, row):
+                        yield schema, table, col, val
+            elif len(columns) > 0 and adaptive:
+                for col, val in _adaptive_row_generator(
+                    source=source,
+                    schema=schema,
+                    table=table,
+                    column_list=columns,
+                    labeled_columns=labeled_columns,
+                    max_sample_size=max_sample_size,
+                    pii_rate_threshold=pii_rate_threshold,
+                    sample_method=sample_method,
+                ):
+                    yield schema, table, col, val
+            elif len(columns) > 0:
                 for row in _row_generator(
                     column_list=columns,
                     schema=schema,
                     table=table,
                     source=source,
                     sample_size=sample_size,
+                    sample_method=sample_method,
                 ):
                     for col, val in zip(columns, row):
                         yield schema, table, col, val
@@ -177,3 +473,66 @@ def data_generator(
             LOGGER.warning(
                 f"Exception when getting data for {schema.name}.{table.name}. Code: {e.code}"
             )
+
+
+def regex_count_generator(
+    catalog: Catalog,
+    source: CatSource,
+    patterns: List[str],
+    last_run: Optional[datetime.datetime] = None,
+    include_schema_regex_str: List[str] = None,
+    exclude_schema_regex_str: List[str] = None,
+    include_table_regex_str: List[str] = None,
+    exclude_table_regex_str: List[str] = None,
+    sample_size=SMALL_TABLE_MAX,
+    sample_method: SampleMethod = SampleMethod.row,
+) -> Generator[Tuple[CatSchema, CatTable, CatColumn, List[int]], None, None]:
+    """Yield the number of sampled values of each text column that match each
+    of patterns. The matches are counted by one query per table in the
+    database and sampled values are not fetched."""
+    for schema, table in table_generator(
+        catalog=catalog,
+        source=source,
+        include_schema_regex_str=include_schema_regex_str,
+        exclude_schema_regex_str=exclude_schema_regex_str,
+        include_table_regex_str=include_table_regex_str,
+        exclude_table_regex_str=exclude_table_regex_str,
+    ):
+        try:
+            columns = catalog.get_columns_for_table(table=table, newer_than=last_run)
+            columns = _filter_text_columns(columns)
+            if len(columns) == 0:
+                continue
+
+            engine = _create_engine(source)
+            with engine.connect() as conn:
+                dbinfo = _get_dbinfo(source, schema, table)
+                query = dbinfo.get_regex_count_query(
+                    [col.name for col in columns],
+                    patterns,
+                    _get_query(
+                        schema=schema,
+                        table=table,
+                        column_list=columns,
+                        dbinfo=dbinfo,
+                        connection=conn,
+                        source=source,
+                        sample_size=sample_size,
+                        sample_method=sample_method,
+                    ),
+                )
+                LOGGER.debug(query)
+                row = metrics.execute(
+                    conn, query, "regex_count", _table_key(schema, table)
+                ).fetchone()
+
+            for i, col in enumerate(columns):
+                counts = row[i * len(patterns) : (i + 1) * len(patterns)]
+                # SUM over an empty table is NULL
+                yield schema, table, col, [int(c or 0) for c in counts]
+        except StopIteration:
+            raise NoMatchesError
+        except exc.SQLAlchemyError as e:
+            LOGGER.warning(
+                f"Exception when counting matches for {schema.name}.{table.name}. Code: {e.code}"
+            )
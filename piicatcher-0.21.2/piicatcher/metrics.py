@@ -0,0 +1,158 @@
+"""Collect timings and throughput of a scan"""
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Upper bounds in milliseconds of the query latency histogram buckets. The
+# last bucket counts slower queries.
+LATENCY_BUCKETS_MS = [1, 5, 10, 50, 100, 500, 1000, 5000, 10000]
+
+
+class _Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        buckets = {
+            "le_{}ms".format(bound): count
+            for bound, count in zip(LATENCY_BUCKETS_MS, self.counts)
+        }
+        buckets["gt_{}ms".format(LATENCY_BUCKETS_MS[-1])] = self.counts[-1]
+        return {
+            "count": self.count,
+            "seconds": round(self.total, 6),
+            "max_seconds": round(self.max, 6),
+            "buckets": buckets,
+        }
+
+
+class _Counter:
+    def __init__(self) -> None:
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.calls = 0
+
+
+class ScanMetrics:
+    """Timers and counters of one scan.
+
+    Phases (scan_sources, metadata_scan, data_scan, catalog writes, ...) and
+    queries are timed per kind. Tables record the time spent in queries and
+    fetching rows, and the rows and bytes fetched. Detectors record the time
+    spent in detect and the number of calls. Phases may nest: catalog_write
+    is also part of the scan phase that issued the writes.
+    """
+
+    def __init__(self) -> None:
+        self._started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.queries: Dict[str, _Histogram] = {}
+        self.tables: Dict[str, _Counter] = {}
+        self.detectors: Dict[str, _Counter] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_query(self, kind: str, table: str, seconds: float) -> None:
+        self.queries.setdefault(kind, _Histogram()).add(seconds)
+        self.tables.setdefault(table, _Counter()).seconds += seconds
+
+    def add_rows(self, table: str, rows: List[Any], seconds: float) -> None:
+        counter = self.tables.setdefault(table, _Counter())
+        counter.seconds += seconds
+        counter.rows += len(rows)
+        for row in rows:
+            for val in row:
+                if val is not None:
+                    counter.bytes += (
+                        len(val) if isinstance(val, (str, bytes)) else len(str(val))
+                    )
+
+    def add_detector(self, name: str, seconds: float) -> None:
+        counter = self.detectors.setdefault(name, _Counter())
+        counter.seconds += seconds
+        counter.calls += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "seconds": round(time.perf_counter() - self._started, 6),
+            "phases": {name: round(sec, 6) for name, sec in self.phases.items()},
+            "queries": {kind: hist.to_dict() for kind, hist in self.queries.items()},
+            "tables": {
+                name: {
+                    "seconds": round(counter.seconds, 6),
+                    "rows": counter.rows,
+                    "bytes": counter.bytes,
+                    "rows_per_second": round(counter.rows / counter.seconds, 2)
+                    if counter.seconds > 0
+                    else None,
+                }
+                for name, counter in self.tables.items()
+            },
+            "detectors": {
+                name: {
+                    "seconds": round(counter.seconds, 6),
+                    "calls": counter.calls,
+                }
+                for name, counter in self.detectors.items()
+            },
+        }
+
+
+# Metrics of the running scan. Instrumented code records into it only while
+# collect() is active.
+_current: Optional[ScanMetrics] = None
+
+
+@contextmanager
+def collect() -> Iterator[ScanMetrics]:
+    global _current
+    previous = _current
+    _current = ScanMetrics()
+    try:
+        yield _current
+    finally:
+        _current = previous
+
+
+def current() -> Optional[ScanMetrics]:
+    return _current
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    if _current is None:
+        yield
+    else:
+        with _current.phase(name):
+            yield
+
+
+def execute(connection, query, kind: str, table: str):
+    """Execute query on connection and record its latency"""
+    if _current is None:
+        return connection.execute(query)
+
+    start = time.perf_counter()
+    result = connection.execute(query)
+    _current.add_query(kind, table, time.perf_counter() - start)
+    return result
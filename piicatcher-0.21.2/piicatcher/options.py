@@ -0,0 +1,24 @@
+"""Options shared by the command line and the api.
+
+command_line declares its options with these types and defaults. Keep this
+module free of imports of the scanners and dbcat so that commands which do
+not scan start quickly.
+"""
+from enum import Enum
+
+SMALL_TABLE_MAX = 100
+# Rows sampled by adaptive sampling for a column that is not decided yet.
+ADAPTIVE_SAMPLE_MAX = 1000
+
+
+class ScanTypeEnum(str, Enum):
+    metadata = "metadata"
+    data = "data"
+
+
+class OutputFormat(str, Enum):
+    tabular = "tabular"
+    json = "json"
+    ndjson = "ndjson"
+    csv = "csv"
+    json_stream = "json_stream"
@@ -1,5 +1,7 @@
+import csv
 import datetime
-from typing import Any, Dict, List, Optional
+import json
+from typing import Any, Dict, List, Optional, TextIO
 
 from dbcat.catalog import Catalog, CatSchema, CatSource, CatTable
 
@@ -101,3 +103,191 @@ def output_tabular(
             )
 
     return tabular
+
+
+def _column_dict(column) -> Dict[str, Any]:
+    return {
+        "name": column.name,
+        "data_type": column.data_type,
+        "sort_order": column.sort_order,
+        "pii_type": column.pii_type.name if column.pii_type is not None else None,
+        "pii_plugin": column.pii_plugin,
+    }
+
+
+def output_ndjson(
+    catalog: Catalog,
+    source: CatSource,
+    stream: TextIO,
+    list_all: bool = False,
+    last_run: datetime.datetime = None,
+    include_schema_regex: List[str] = None,
+    exclude_schema_regex: List[str] = None,
+    include_table_regex: List[str] = None,
+    exclude_table_regex: List[str] = None,
+) -> None:
+    """Write one JSON object per column as column_generator yields them"""
+    for schema, table, column in column_generator(
+        catalog=catalog,
+        source=source,
+        last_run=last_run,
+        exclude_schema_regex_str=exclude_schema_regex,
+        include_schema_regex_str=include_schema_regex,
+        exclude_table_regex_str=exclude_table_regex,
+        include_table_regex_str=include_table_regex,
+    ):
+        if list_all or column.pii_type is not None:
+            row = {"schema": schema.name, "table": table.name}
+            row.update(_column_dict(column))
+            stream.write(json.dumps(row, sort_keys=True))
+            stream.write("\n")
+
+
+def output_csv(
+    catalog: Catalog,
+    source: CatSource,
+    stream: TextIO,
+    list_all: bool = False,
+    last_run: datetime.datetime = None,
+    include_schema_regex: List[str] = None,
+    exclude_schema_regex: List[str] = None,
+    include_table_regex: List[str] = None,
+    exclude_table_regex: List[str] = None,
+) -> None:
+    """Write the rows of output_tabular as CSV without buffering them"""
+    writer = csv.writer(stream)
+    writer.writerow(("schema", "table", "column", "PII Type", "Scanner"))
+    for schema, table, column in column_generator(
+        catalog=catalog,
+        source=source,
+        last_run=last_run,
+        exclude_schema_regex_str=exclude_schema_regex,
+        include_schema_regex_str=include_schema_regex,
+        exclude_table_regex_str=exclude_table_regex,
+        include_table_regex_str=include_table_regex,
+    ):
+        if list_all or column.pii_type is not None:
+            writer.writerow(
+                (
+                    schema.name,
+                    table.name,
+                    column.name,
+                    column.pii_type.name if column.pii_type is not None else None,
+                    column.pii_plugin,
+                )
+            )
+
+
+class _JsonStreamWriter:
+    """Write the nested document of output_dict piece by piece"""
+
+    def __init__(self, stream: TextIO, source_name: str) -> None:
+        self._stream = stream
+        self._source_name = source_name
+        self._schema_count = 0
+        self._table_count = 0
+        self._column_count = 0
+        self.in_schema = False
+        self.in_table = False
+
+    def begin_schema(self, name: str) -> None:
+        self.end_schema()
+        if self._schema_count == 0:
+            self._stream.write(
+                '{"name": %s, "schemata": [' % json.dumps(self._source_name)
+            )
+        else:
+            self._stream.write(",")
+        self._stream.write('\n{"name": %s, "tables": [' % json.dumps(name))
+        self._schema_count += 1
+        self._table_count = 0
+        self.in_schema = True
+
+    def end_schema(self) -> None:
+        if self.in_schema:
+            self.end_table()
+            self._stream.write("]}")
+            self.in_schema = False
+
+    def begin_table(self, name: str) -> None:
+        self.end_table()
+        if self._table_count > 0:
+            self._stream.write(",")
+        self._stream.write('\n{"name": %s, "columns": [' % json.dumps(name))
+        self._table_count += 1
+        self._column_count = 0
+        self.in_table = True
+
+    def end_table(self) -> None:
+        if self.in_table:
+            self._stream.write("]}")
+            self.in_table = False
+
+    def write_column(self, column: Dict[str, Any]) -> None:
+        if self._column_count > 0:
+            self._stream.write(",")
+        self._stream.write("\n" + json.dumps(column, sort_keys=True))
+        self._column_count += 1
+
+    def close(self, list_all: bool) -> None:
+        self.end_schema()
+        if self._schema_count > 0:
+            self._stream.write("]}\n")
+        elif list_all:
+            self._stream.write(
+                '{"name": %s, "schemata": []}\n' % json.dumps(self._source_name)
+            )
+        else:
+            self._stream.write("{}\n")
+
+
+def output_json_stream(
+    catalog: Catalog,
+    source: CatSource,
+    stream: TextIO,
+    list_all: bool = False,
+    last_run: datetime.datetime = None,
+    include_schema_regex: List[str] = None,
+    exclude_schema_regex: List[str] = None,
+    include_table_regex: List[str] = None,
+    exclude_table_regex: List[str] = None,
+) -> None:
+    """Write the same document as output_dict while columns are generated.
+
+    Schemata and tables are opened when their first reported column is seen,
+    so memory does not grow with the size of the catalog.
+    """
+    current_schema: Optional[CatSchema] = None
+    current_table: Optional[CatTable] = None
+
+    writer = _JsonStreamWriter(stream=stream, source_name=source.name)
+    for schema, table, column in column_generator(
+        catalog=catalog,
+        source=source,
+        last_run=last_run,
+        exclude_schema_regex_str=exclude_schema_regex,
+        include_schema_regex_str=include_schema_regex,
+        exclude_table_regex_str=exclude_table_regex,
+        include_table_regex_str=include_table_regex,
+    ):
+        if current_schema is None or schema != current_schema:
+            writer.end_schema()
+            current_schema = schema
+            current_table = None
+            if list_all:
+                writer.begin_schema(schema.name)
+
+        if current_table is None or table != current_table:
+            writer.end_table()
+            current_table = table
+            if list_all:
+                writer.begin_table(table.name)
+
+        if column.pii_type is not None or list_all:
+            if not writer.in_schema:
+                writer.begin_schema(schema.name)
+            if not writer.in_table:
+                writer.begin_table(table.name)
+            writer.write_column(_column_dict(column))
+
+    writer.close(list_all)
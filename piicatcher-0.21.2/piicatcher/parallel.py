@@ -0,0 +1,116 @@
+"""Run CPU heavy DatumDetectors in a pool of worker processes"""
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Type
+
+from dbcat.catalog.pii_types import PiiType
+
+from piicatcher.detectors import DatumDetector
+
+LOGGER = logging.getLogger(__name__)
+
+POOL_BATCH_SIZE = 1000
+
+
+class ColumnInfo(NamedTuple):
+    """Picklable stand-in for CatColumn passed to detectors in worker processes"""
+
+    name: str
+    data_type: Optional[str]
+    fqdn: Tuple[str, ...]
+
+
+# Detector instances of a worker process. They are created once by the pool
+# initializer and reused for every batch.
+_worker_detectors: List[DatumDetector] = []
+
+
+def _init_worker(detector_classes: List[Type[DatumDetector]]) -> None:
+    global _worker_detectors
+    _worker_detectors = [detector() for detector in detector_classes]
+
+
+def _detect_batch(
+    batch: List[Tuple[int, ColumnInfo, List[str]]]
+) -> List[Tuple[int, PiiType, str, str]]:
+    results: List[Tuple[int, PiiType, str, str]] = []
+    for key, column, values in batch:
+        found = _detect_column(column, values)
+        if found is not None:
+            results.append((key,) + found)
+    return results
+
+
+def _detect_column(
+    column: ColumnInfo, values: List[str]
+) -> Optional[Tuple[PiiType, str, str]]:
+    for val in values:
+        for detector in _worker_detectors:
+            pii_type = detector.detect(column=column, datum=val)  # type: ignore
+            if pii_type is not None:
+                return pii_type, detector.name, val
+    return None
+
+
+class DetectorPool:
+    """Ship batches of column samples to warm detector instances.
+
+    Values are buffered per column and sent to the pool every ``batch_size``
+    values. Each worker returns at most one (key, PiiType, plugin) result per
+    column and batch along with the value that matched.
+    """
+
+    def __init__(
+        self,
+        detector_classes: List[Type[DatumDetector]],
+        max_workers: Optional[int] = None,
+        batch_size: int = POOL_BATCH_SIZE,
+    ) -> None:
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(detector_classes,),
+        )
+        self._batch_size = batch_size
+        self._columns: Dict[int, ColumnInfo] = {}
+        self._values: Dict[int, List[str]] = {}
+        self._buffered = 0
+        self._futures: List[Future] = []
+
+    def __enter__(self) -> "DetectorPool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=exc_type is None)
+
+    def add(self, key: int, column: ColumnInfo, val: str) -> None:
+        self._columns[key] = column
+        self._values.setdefault(key, []).append(val)
+        self._buffered += 1
+        if self._buffered >= self._batch_size:
+            self.submit()
+
+    def discard(self, key: int) -> None:
+        """Drop buffered values of a column that has been labeled"""
+        self._buffered -= len(self._values.pop(key, []))
+
+    def submit(self) -> None:
+        if self._buffered == 0:
+            return
+
+        batch = [
+            (key, self._columns[key], values) for key, values in self._values.items()
+        ]
+        LOGGER.debug("Submitting %d values of %d columns", self._buffered, len(batch))
+        self._futures.append(self._executor.submit(_detect_batch, batch))
+        self._values = {}
+        self._buffered = 0
+
+    def results(self) -> Iterator[Tuple[int, PiiType, str, str]]:
+        """Submit the remaining values and yield results of all batches"""
+        self.submit()
+        for future in self._futures:
+            yield from future.result()
+        self._futures = []
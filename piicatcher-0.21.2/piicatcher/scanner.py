@@ -1,12 +1,15 @@
 """Different types of scanners for PII data"""
 import logging
 import re
-from typing import Generator, List, Optional, Tuple
+import time
+from contextlib import nullcontext
+from typing import Dict, Generator, Iterable, List, Optional, Set, Tuple, Type
 
 import crim as CommonRegex
 from dbcat.catalog import Catalog
 from dbcat.catalog.models import CatColumn, CatSchema, CatTable
 from dbcat.catalog.pii_types import PiiType
+from sqlalchemy import bindparam, update
 from tqdm import tqdm
 
 from piicatcher import (
@@ -24,8 +27,11 @@ from piicatcher import (
     UserName,
     ZipCode,
 )
+from piicatcher import metrics
+from piicatcher.cache import DetectionCache
 from piicatcher.detectors import DatumDetector, MetadataDetector, register_detector
 from piicatcher.generators import SMALL_TABLE_MAX, _filter_text_columns
+from piicatcher.parallel import ColumnInfo, DetectorPool
 
 LOGGER = logging.getLogger(__name__)
 
@@ -40,84 +46,181 @@ scan_logger.propagate = False
 scan_logger.setLevel(logging.INFO)
 scan_logger.addHandler(logging.NullHandler())
 
+LABEL_FLUSH_SIZE = 1000
+
+
+class LabelWriter:
+    """Buffer PII labels and write them to the catalog in bulk.
+
+    ``Catalog.set_column_pii_type`` issues an update, a flush and a refresh
+    per column. LabelWriter collects (column, pii_type, plugin) tuples and
+    writes them with one executemany UPDATE every ``flush_size`` labels and
+    when the context exits.
+
+    The UPDATE runs in the open session of the catalog and does not commit,
+    so a scan stays a single transaction and loaded objects are not expired.
+    Only the labels of the written columns are expired.
+    """
+
+    _update_stmt = (
+        update(CatColumn)
+        .where(CatColumn.id == bindparam("column_id"))
+        .values(
+            pii_type=bindparam(
+                "new_pii_type", type_=CatColumn.__table__.c.pii_type.type
+            ),
+            pii_plugin=bindparam("new_pii_plugin"),
+        )
+    )
+
+    def __init__(self, catalog: Catalog, flush_size: int = LABEL_FLUSH_SIZE) -> None:
+        self._catalog = catalog
+        self._flush_size = flush_size
+        self._buffer: List[Tuple[CatColumn, PiiType, str]] = []
+
+    def __enter__(self) -> "LabelWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is None:
+            self.flush()
+
+    def add(self, column: CatColumn, pii_type: PiiType, pii_plugin: str) -> None:
+        self._buffer.append((column, pii_type, pii_plugin))
+        if len(self._buffer) >= self._flush_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self._buffer) == 0:
+            return
+
+        session = self._catalog._current_session
+        if session is None:
+            with self._catalog.managed_session:
+                self.flush()
+            return
+
+        with metrics.phase("catalog_write"):
+            session.execute(
+                self._update_stmt,
+                [
+                    {
+                        "column_id": column.id,
+                        "new_pii_type": pii_type,
+                        "new_pii_plugin": pii_plugin,
+                    }
+                    for column, pii_type, pii_plugin in self._buffer
+                ],
+            )
+            # The UPDATE bypasses the ORM. Expire the labels so that the next
+            # access reloads them from the catalog.
+            for column, _, _ in self._buffer:
+                session.expire(column, ["pii_type", "pii_plugin"])
+
+        LOGGER.debug("Wrote %d PII labels to the catalog", len(self._buffer))
+        self._buffer = []
+
 
 @register_detector
 class ColumnNameRegexDetector(MetadataDetector):
-    regex = {
-        Person: re.compile(
-            "^.*(firstname|fname|lastname|lname|"
-            "fullname|maidenname|_name|"
-            "nickname|name_suffix|name|person).*$",
-            re.IGNORECASE,
-        ),
-        Email: re.compile("^.*(email|e-mail|mail).*$", re.IGNORECASE),
-        BirthDate: re.compile(
-            "^.*(date_of_birth|dateofbirth|dob|"
-            "birthday|date_of_death|dateofdeath|birthdate).*$",
-            re.IGNORECASE,
-        ),
-        Gender: re.compile("^.*(gender).*$", re.IGNORECASE),
-        Nationality: re.compile("^.*(nationality).*$", re.IGNORECASE),
-        Address: re.compile(
-            "^.*(address|city|state|county|country|zone|borough).*$",
-            re.IGNORECASE,
-        ),
-        ZipCode: re.compile(
-            "^.*(zipcode|zip_code|postal|postal_code|zip).*$",
-            re.IGNORECASE,
-        ),
-        UserName: re.compile("^.*user(id|name|).*$", re.IGNORECASE),
-        Password: re.compile("^.*pass.*$", re.IGNORECASE),
-        SSN: re.compile(
-            "^.*(ssn|social_number|social_security|"
-            "social_security_number|social_security_no).*$",
-            re.IGNORECASE,
-        ),
-        PoBox: re.compile("^.*(po_box|pobox).*$", re.IGNORECASE),
-        CreditCard: re.compile(
-            "^.*(credit_card|cc_number|cc_num|creditcard|"
-            "credit_card_num|creditcardnumber).*$",
-            re.IGNORECASE,
-        ),
-        Phone: re.compile(
-            "^.*(phone|phone_number|phone_no|phone_num|"
-            "telephone|telephone_num|telephone_no).*$",
-            re.IGNORECASE,
-        ),
+    """Detect PII from column names.
+
+    All patterns are folded into one regex with a named group per PiiType.
+    Every alternative is a lookahead, so a single pass over the name reports
+    the highest priority type that starts at each position. Patterns earlier
+    in ``patterns`` win, as with the old per-type loop.
+    """
+
+    patterns = {
+        Person: "firstname|fname|lastname|lname|"
+        "fullname|maidenname|_name|"
+        "nickname|name_suffix|name|person",
+        Email: "email|e-mail|mail",
+        BirthDate: "date_of_birth|dateofbirth|dob|"
+        "birthday|date_of_death|dateofdeath|birthdate",
+        Gender: "gender",
+        Nationality: "nationality",
+        Address: "address|city|state|county|country|zone|borough",
+        ZipCode: "zipcode|zip_code|postal|postal_code|zip",
+        UserName: "user(?:id|name|)",
+        Password: "pass",
+        SSN: "ssn|social_number|social_security|"
+        "social_security_number|social_security_no",
+        PoBox: "po_box|pobox",
+        CreditCard: "credit_card|cc_number|cc_num|creditcard|"
+        "credit_card_num|creditcardnumber",
+        Phone: "phone|phone_number|phone_no|phone_num|"
+        "telephone|telephone_num|telephone_no",
     }
 
+    regex = re.compile(
+        "|".join(
+            "(?=(?P<{name}>{pattern}))".format(name=pii_type.__name__, pattern=pattern)
+            for pii_type, pattern in patterns.items()
+        ),
+        re.IGNORECASE,
+    )
+
+    _priority = {pii_type.__name__: i for i, pii_type in enumerate(patterns)}
+    _types = list(patterns)
+
     name = "ColumnNameRegexDetector"
 
+    def __init__(self) -> None:
+        # Warehouse schemas repeat the same column names heavily.
+        self._cache: Dict[str, Optional[Type[PiiType]]] = {}
+
+    def _match(self, column_name: str) -> Optional[Type[PiiType]]:
+        best: Optional[int] = None
+        for match in self.regex.finditer(column_name):
+            priority = self._priority[match.lastgroup]
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+
+        return self._types[best] if best is not None else None
+
     def detect(self, column: CatColumn) -> Optional[PiiType]:
-        for pii_type, ex in self.regex.items():
-            if ex.match(column.name) is not None:
-                return pii_type()
+        column_name = column.name
+        if column_name not in self._cache:
+            self._cache[column_name] = self._match(column_name)
 
-        return None
+        pii_type = self._cache[column_name]
+        return pii_type() if pii_type is not None else None
 
 
 def metadata_scan(
     catalog: Catalog,
     detectors: List[MetadataDetector],
-    work_generator: Generator[Tuple[CatSchema, CatTable, CatColumn], None, None],
-    generator: Generator[Tuple[CatSchema, CatTable, CatColumn], None, None],
+    generator: Iterable[Tuple[CatSchema, CatTable, CatColumn]],
+    flush_size: int = LABEL_FLUSH_SIZE,
 ):
-    total_columns = len([c for s, t, c in work_generator])
+    # Materialize the columns once so that the progress bar total and the scan
+    # loop share a single traversal of the catalog.
+    columns = list(generator)
     counter = 0
     set_number = 0
-    for schema, table, column in tqdm(
-        generator, total=total_columns, desc="columns", unit="columns"
-    ):
-        counter += 1
-        LOGGER.debug("Scanning column name %s", column.fqdn)
-        for detector in detectors:
-            type = detector.detect(column)
-            if type is not None:
-                set_number += 1
-                catalog.set_column_pii_type(
-                    column=column, pii_type=type, pii_plugin=detector.name
-                )
-                break
+    scan_metrics = metrics.current()
+    with LabelWriter(catalog, flush_size=flush_size) as writer:
+        for schema, table, column in tqdm(
+            columns, total=len(columns), desc="columns", unit="columns"
+        ):
+            counter += 1
+            LOGGER.debug("Scanning column name %s", column.fqdn)
+            for detector in detectors:
+                if scan_metrics is None:
+                    type = detector.detect(column)
+                else:
+                    start = time.perf_counter()
+                    type = detector.detect(column)
+                    scan_metrics.add_detector(
+                        detector.name, time.perf_counter() - start
+                    )
+                if type is not None:
+                    set_number += 1
+                    writer.add(column=column, pii_type=type, pii_plugin=detector.name)
+                    break
 
     LOGGER.info("Columns Scanned: %d, Columns Labeled: %d", counter, set_number)
 
@@ -127,64 +230,224 @@ class DatumRegexDetector(DatumDetector):
     """A scanner that uses common regular expressions to find PII"""
 
     name = "DatumRegexDetector"
+    version = "1"
+
+    # The CommonRegex expressions in the order they are checked. They are
+    # also used for regex pushdown and translated to the database dialect by
+    # piicatcher.dbinfo.portable_regex.
+    pushdown_patterns = {
+        Phone: CommonRegex.regex_map["phones"],
+        Email: CommonRegex.regex_map["emails"],
+        CreditCard: CommonRegex.regex_map["credit_cards"],
+        Address: CommonRegex.regex_map["street_addresses"],
+        SSN: CommonRegex.regex_map["ssn_number"],
+        ZipCode: CommonRegex.regex_map["zip_codes"],
+        PoBox: CommonRegex.regex_map["po_boxes"],
+    }
 
     def detect(self, column: CatColumn, datum: str) -> Optional[PiiType]:
         """Scan the text and return an array of PiiTypes that are found"""
         data = str(datum)
 
-        if CommonRegex.phones(data):  # pylint: disable=no-member
-            return Phone()
-        if CommonRegex.emails(data):  # pylint: disable=no-member
-            return Email()
-        if CommonRegex.credit_cards(data):  # pylint: disable=no-member
-            return CreditCard()
-        if CommonRegex.street_addresses(data):  # pylint: disable=no-member
-            return Address()
-        if CommonRegex.ssn_numbers(data):  # pylint: disable=no-member
-            return SSN()
-        if CommonRegex.zip_codes(data):  # pylint: disable=no-member
-            return ZipCode()
-        if CommonRegex.po_boxes(data):  # pylint: disable=no-member
-            return PoBox()
+        for pii_type, pattern in self.pushdown_patterns.items():
+            if CommonRegex.match(data, pattern):
+                return pii_type()
 
         return None
 
 
+def _timed_detect(
+    detector: DatumDetector,
+    column: CatColumn,
+    val,
+    scan_metrics: Optional[metrics.ScanMetrics],
+) -> Optional[PiiType]:
+    if scan_metrics is None:
+        return detector.detect(column=column, datum=val)
+
+    start = time.perf_counter()
+    type = detector.detect(column=column, datum=val)
+    scan_metrics.add_detector(detector.name, time.perf_counter() - start)
+    return type
+
+
+def _detect(
+    detectors: List[DatumDetector],
+    column: CatColumn,
+    val,
+    cache: Optional[DetectionCache],
+    scan_metrics: Optional[metrics.ScanMetrics],
+) -> Optional[Tuple[PiiType, str]]:
+    """The first PiiType found by detectors and the name of the detector.
+    Results of detectors that set a version are looked up in cache."""
+    fingerprint = cache.fingerprint(val) if cache is not None else None
+    for detector in detectors:
+        if cache is None or fingerprint is None or detector.version is None:
+            type = _timed_detect(detector, column, val, scan_metrics)
+        else:
+            found, type = cache.get(detector, fingerprint)
+            if not found:
+                type = _timed_detect(detector, column, val, scan_metrics)
+                cache.put(detector, fingerprint, type)
+        if type is not None:
+            return type, detector.name
+    return None
+
+
+def _add_to_pool(
+    pool: DetectorPool,
+    pooled_columns: Dict[int, Tuple[CatColumn, ColumnInfo]],
+    column: CatColumn,
+    val,
+) -> None:
+    if column.id not in pooled_columns:
+        pooled_columns[column.id] = (
+            column,
+            ColumnInfo(name=column.name, data_type=column.data_type, fqdn=column.fqdn),
+        )
+    pool.add(column.id, pooled_columns[column.id][1], val)
+
+
 def data_scan(
     catalog: Catalog,
     detectors: List[DatumDetector],
-    work_generator: Generator[Tuple[CatSchema, CatTable, CatColumn], None, None],
+    columns: Iterable[Tuple[CatSchema, CatTable, CatColumn]],
     generator: Generator[Tuple[CatSchema, CatTable, CatColumn, str], None, None],
     sample_size: int = SMALL_TABLE_MAX,
+    flush_size: int = LABEL_FLUSH_SIZE,
+    pool_size: Optional[int] = None,
+    labeled_columns: Optional[Set[int]] = None,
+    cache: Optional[DetectionCache] = None,
 ):
-    total_columns = _filter_text_columns([c for s, t, c in work_generator])
+    """Run DatumDetectors over sampled values and label matching columns.
+
+    Detectors with ``run_in_pool`` set are evaluated in a DetectorPool of
+    ``pool_size`` processes. The other detectors run inline and take
+    precedence: a pooled result only labels a column that is still unlabeled
+    when the results are collected at the end of the scan.
+
+    Ids of labeled columns are added to ``labeled_columns``. Pass the same set
+    to an adaptive data_generator to stop sampling labeled columns.
+
+    With a ``cache``, results of inline detectors that set a version are
+    looked up by the fingerprint of the value before calling detect.
+    """
+    total_columns = _filter_text_columns([c for s, t, c in columns])
     total_work = len(total_columns) * sample_size
 
+    inline_detectors = [d for d in detectors if not d.run_in_pool]
+    pool_detectors = [d for d in detectors if d.run_in_pool]
+
     counter = 0
     set_number = 0
+    skipped = 0
+    # Columns are labeled on the first match. Remaining sampled values of a
+    # labeled column are not run through the detectors again.
+    if labeled_columns is None:
+        labeled_columns = set()
+    pooled_columns: Dict[int, Tuple[CatColumn, ColumnInfo]] = {}
+
+    def label(writer: LabelWriter, column: CatColumn, type: PiiType, plugin: str, val):
+        nonlocal set_number
+        set_number += 1
+        labeled_columns.add(column.id)
+
+        writer.add(column=column, pii_type=type, pii_plugin=plugin)
+        LOGGER.debug("{} has {}".format(column.fqdn, type))
+
+        scan_logger.info("deep_scan", extra={"column": column.fqdn, "pii_types": type})
+        data_logger.info(
+            "deep_scan", extra={"column": column.fqdn, "data": val, "pii_types": type},
+        )
 
-    for schema, table, column, val in tqdm(
-        generator, total=total_work, desc="datum", unit="datum"
+    scan_metrics = metrics.current()
+
+    pool = (
+        DetectorPool([d.__class__ for d in pool_detectors], max_workers=pool_size)
+        if len(pool_detectors) > 0
+        else None
+    )
+    with LabelWriter(catalog, flush_size=flush_size) as writer, (
+        pool if pool is not None else nullcontext()
     ):
-        counter += 1
-        LOGGER.debug("Scanning column name %s", column.fqdn)
-        if val is not None:
-            for detector in detectors:
-                type = detector.detect(column=column, datum=val)
-                if type is not None:
-                    set_number += 1
+        for schema, table, column, val in tqdm(
+            generator, total=total_work, desc="datum", unit="datum"
+        ):
+            counter += 1
+            if column.id in labeled_columns:
+                skipped += 1
+                continue
+            LOGGER.debug("Scanning column name %s", column.fqdn)
+            if val is None:
+                continue
+            found = _detect(inline_detectors, column, val, cache, scan_metrics)
+            if found is not None:
+                label(writer, column, found[0], found[1], val)
+                if pool is not None:
+                    pool.discard(column.id)
+            elif pool is not None:
+                _add_to_pool(pool, pooled_columns, column, val)
 
-                    catalog.set_column_pii_type(
-                        column=column, pii_type=type, pii_plugin=detector.name
-                    )
-                    LOGGER.debug("{} has {}".format(column.fqdn, type))
+        if pool is not None:
+            for column_id, type, plugin, val in pool.results():
+                if column_id not in labeled_columns:
+                    label(writer, pooled_columns[column_id][0], type, plugin, val)
 
-                    scan_logger.info(
-                        "deep_scan", extra={"column": column.fqdn, "pii_types": type}
+    LOGGER.info(
+        "Columns Scanned: %d, Columns Labeled: %d, Rows Skipped: %d",
+        counter,
+        set_number,
+        skipped,
+    )
+    if cache is not None:
+        scan_logger.info(
+            "detection_cache", extra={"hits": cache.hits, "misses": cache.misses}
+        )
+
+
+def pushdown_scan(
+    catalog: Catalog,
+    detectors: List[DatumDetector],
+    generator: Iterable[Tuple[CatSchema, CatTable, CatColumn, List[int]]],
+    flush_size: int = LABEL_FLUSH_SIZE,
+    labeled_columns: Optional[Set[int]] = None,
+):
+    """Label columns from regex match counts computed in the database.
+
+    generator yields the counts of the ``pushdown_patterns`` of all detectors
+    in order (see regex_count_generator). A column is labeled with the first
+    PiiType that has a match. Ids of labeled columns are added to
+    ``labeled_columns``.
+    """
+    patterns = [
+        (detector, pii_type)
+        for detector in detectors
+        for pii_type in (detector.pushdown_patterns or {})
+    ]
+    if labeled_columns is None:
+        labeled_columns = set()
+
+    counter = 0
+    set_number = 0
+    with LabelWriter(catalog, flush_size=flush_size) as writer:
+        for schema, table, column, counts in tqdm(
+            generator, desc="columns", unit="columns"
+        ):
+            counter += 1
+            if column.id in labeled_columns:
+                continue
+            for (detector, pii_type), count in zip(patterns, counts):
+                if count > 0:
+                    set_number += 1
+                    labeled_columns.add(column.id)
+                    writer.add(
+                        column=column, pii_type=pii_type(), pii_plugin=detector.name
                     )
-                    data_logger.info(
+                    LOGGER.debug("{} has {}".format(column.fqdn, pii_type))
+                    scan_logger.info(
                         "deep_scan",
-                        extra={"column": column.fqdn, "data": val, "pii_types": type},
+                        extra={"column": column.fqdn, "pii_types": pii_type()},
                     )
                     break
+
     LOGGER.info("Columns Scanned: %d, Columns Labeled: %d", counter, set_number)
@@ -0,0 +1,50 @@
+import threading
+import time
+
+from piicatcher.analytics import AnalyticsQueue
+
+
+class RecordingQueue(AnalyticsQueue):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.sent = []
+        self.release = threading.Event()
+
+    def _send(self, category, particulars):
+        self.release.wait()
+        self.sent.append((category, particulars))
+
+
+class FailingQueue(AnalyticsQueue):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.attempts = 0
+
+    def _send(self, category, particulars):
+        self.attempts += 1
+        raise ConnectionError("no route to host")
+
+
+def test_record_event_does_not_block():
+    analytics = RecordingQueue(max_size=2)
+    start = time.monotonic()
+    for i in range(10):
+        analytics.record_event("/pip/piicatcher", "event {}".format(i))
+    assert time.monotonic() - start < 1
+
+    analytics.release.set()
+    analytics.flush(timeout=5)
+    # One event may be in flight while the queue holds two more.
+    assert 2 <= len(analytics.sent) <= 3
+    assert analytics.sent[0] == ("/pip/piicatcher", "event 0")
+
+
+def test_failed_transport_drops_events():
+    analytics = FailingQueue()
+    analytics.record_event("/pip/piicatcher", "first")
+    analytics.flush(timeout=5)
+    assert analytics.disabled
+
+    analytics.record_event("/pip/piicatcher", "second")
+    analytics.flush(timeout=5)
+    assert analytics.attempts == 1
@@ -1,3 +1,5 @@
+import sqlite3
+
 import pytest
 
 import piicatcher
@@ -40,6 +42,82 @@ def test_scan_database_shallow(load_sample_data_and_pull):
         assert latest_task.updated_at is not None
 
 
+def test_scan_database_metrics(mocker, load_sample_data_and_pull):
+    catalog, source_id = load_sample_data_and_pull
+    mocked = mocker.patch.object(piicatcher.api.scan_logger, "info")
+    with catalog.managed_session:
+        source = catalog.get_source_by_id(source_id)
+        # Not incremental: an earlier scan in this module has seen all columns
+        scan_database(
+            catalog=catalog,
+            source=source,
+            incremental=False,
+            include_table_regex=["sample"],
+        )
+
+    mocked.assert_called_once()
+    assert mocked.call_args[0] == ("scan_metrics",)
+    scan_metrics = mocked.call_args[1]["extra"]
+    assert scan_metrics["source"] == source.name
+    assert "scan_sources" in scan_metrics["phases"]
+    assert "metadata_scan" in scan_metrics["phases"]
+    assert "ColumnNameRegexDetector" in scan_metrics["detectors"]
+
+
+def test_scan_database_metadata_freshness(mocker, load_sample_data_and_pull):
+    catalog, source_id = load_sample_data_and_pull
+    mocked = mocker.patch("dbcat.api.scan_sources")
+    with catalog.managed_session:
+        source = catalog.get_source_by_id(source_id)
+        scan_database(catalog=catalog, source=source, include_table_regex=["sample"])
+        assert mocked.call_count == 1
+
+        scan_database(
+            catalog=catalog,
+            source=source,
+            include_table_regex=["sample"],
+            metadata_freshness=3600,
+        )
+        assert mocked.call_count == 1
+
+        # Different filters may have refreshed a different set of tables
+        scan_database(
+            catalog=catalog,
+            source=source,
+            include_table_regex=["full_pii"],
+            metadata_freshness=3600,
+        )
+        assert mocked.call_count == 2
+
+
+def test_scan_database_skipped_refresh_is_not_fresh(mocker, load_sample_data_and_pull):
+    catalog, source_id = load_sample_data_and_pull
+    mocked = mocker.patch("dbcat.api.scan_sources")
+    with catalog.managed_session:
+        source = catalog.get_source_by_id(source_id)
+        scan_database(catalog=catalog, source=source, include_table_regex=["sample"])
+        refresh_job = catalog.get_job("piicatcher.metadata_refresh.{}".format(source.name))
+        refreshed_at = refresh_job.context["refreshed_at"]
+
+        scan_database(
+            catalog=catalog,
+            source=source,
+            include_table_regex=["sample"],
+            metadata_freshness=3600,
+        )
+        assert mocked.call_count == 1
+        # Only runs of scan_sources move the refresh time
+        assert refresh_job.context["refreshed_at"] == refreshed_at
+
+        scan_database(
+            catalog=catalog,
+            source=source,
+            include_table_regex=["sample"],
+            metadata_freshness=0,
+        )
+        assert mocked.call_count == 2
+
+
 @pytest.mark.skip
 def test_scan_database_deep(load_sample_data_and_pull):
     catalog, source_id = load_sample_data_and_pull
@@ -62,3 +140,44 @@ def test_scan_database_deep(load_sample_data_and_pull):
                 column_name=column_name,
             )
             assert column.pii_type == pii_type
+
+
+def test_scan_database_cache_write_back_fails(
+    mocker, load_sample_data_and_pull, tmp_path
+):
+    mocker.patch(
+        "piicatcher.cache.DetectionCache._write_back",
+        side_effect=sqlite3.OperationalError("database is locked"),
+    )
+    catalog, source_id = load_sample_data_and_pull
+    with catalog.managed_session:
+        source = catalog.get_source_by_id(source_id)
+        schemata = catalog.search_schema(source_like=source.name, schema_like="%")
+        column = catalog.get_column(
+            source_name=source.name,
+            schema_name=schemata[0].name,
+            table_name="sample",
+            column_name="id",
+        )
+        catalog.set_column_pii_type(column=column, pii_type=None, pii_plugin=None)
+
+    with catalog.managed_session:
+        source = catalog.get_source_by_id(source_id)
+        scan_database(
+            catalog=catalog,
+            source=source,
+            incremental=False,
+            include_table_regex=["sample"],
+            scan_type=ScanTypeEnum.data,
+            detection_cache=tmp_path / "cache.sqlite",
+            detection_cache_secret="s3cret",
+        )
+
+    with catalog.managed_session:
+        column = catalog.get_column(
+            source_name=source.name,
+            schema_name=schemata[0].name,
+            table_name="sample",
+            column_name="id",
+        )
+        assert column.pii_type is not None
@@ -0,0 +1,136 @@
+import hashlib
+import sqlite3
+
+import pytest
+
+from piicatcher import Email, Phone
+from piicatcher.cache import DetectionCache
+from piicatcher.scanner import DatumRegexDetector
+
+
+SECRET = "s3cret"
+
+
+class NewRegexDetector(DatumRegexDetector):
+    version = "2"
+
+
+def test_cache_hit_and_miss(tmp_path):
+    detector = DatumRegexDetector()
+    with DetectionCache(tmp_path / "cache.sqlite", SECRET) as cache:
+        fingerprint = cache.fingerprint("234-567-8900")
+
+        assert cache.get(detector, fingerprint) == (False, None)
+        cache.put(detector, fingerprint, Phone())
+        assert cache.get(detector, fingerprint) == (True, Phone())
+
+        fingerprint = cache.fingerprint("abc")
+        cache.put(detector, fingerprint, None)
+        assert cache.get(detector, fingerprint) == (True, None)
+
+        assert cache.hits == 2
+        assert cache.misses == 1
+
+
+def test_cache_persists(tmp_path):
+    detector = DatumRegexDetector()
+    with DetectionCache(tmp_path / "cache.sqlite", SECRET) as cache:
+        cache.put(detector, cache.fingerprint("john@example.net"), Email())
+
+    with DetectionCache(tmp_path / "cache.sqlite", SECRET) as cache:
+        assert cache.get(detector, cache.fingerprint("john@example.net")) == (
+            True,
+            Email(),
+        )
+
+    # Values are not stored
+    assert b"john@example.net" not in (tmp_path / "cache.sqlite").read_bytes()
+
+
+def test_cache_drops_old_versions(tmp_path):
+    with DetectionCache(tmp_path / "cache.sqlite", SECRET) as cache:
+        cache.put(DatumRegexDetector(), cache.fingerprint("abc"), Email())
+
+    with DetectionCache(tmp_path / "cache.sqlite", SECRET) as cache:
+        assert cache.get(NewRegexDetector(), cache.fingerprint("abc")) == (False, None)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    detector = DatumRegexDetector()
+    with DetectionCache(tmp_path / "cache.sqlite", SECRET, max_entries=2) as cache:
+        cache.put(detector, cache.fingerprint("a"), None)
+        cache.put(detector, cache.fingerprint("b"), None)
+        cache.get(detector, cache.fingerprint("a"))
+        cache.put(detector, cache.fingerprint("c"), None)
+
+        assert cache.get(detector, cache.fingerprint("a")) == (True, None)
+        assert cache.get(detector, cache.fingerprint("b")) == (False, None)
+        assert cache.get(detector, cache.fingerprint("c")) == (True, None)
+
+
+def test_cache_fingerprint_is_keyed(tmp_path):
+    with DetectionCache(tmp_path / "cache.sqlite", SECRET) as cache:
+        fingerprint = cache.fingerprint("234-567-8900")
+    with DetectionCache(tmp_path / "other.sqlite", "other") as cache:
+        assert cache.fingerprint("234-567-8900") != fingerprint
+
+    assert fingerprint != hashlib.sha256(b"234-567-8900").digest()
+
+    with pytest.raises(ValueError):
+        DetectionCache(tmp_path / "cache.sqlite", None)
+
+
+def test_cache_drops_entries_of_other_secret(tmp_path):
+    detector = DatumRegexDetector()
+    with DetectionCache(tmp_path / "cache.sqlite", SECRET) as cache:
+        cache.put(detector, cache.fingerprint("abc"), Email())
+
+    with DetectionCache(tmp_path / "cache.sqlite", "other") as cache:
+        pass
+
+    with DetectionCache(tmp_path / "cache.sqlite", SECRET) as cache:
+        assert cache.get(detector, cache.fingerprint("abc")) == (False, None)
+
+
+def test_cache_writes_only_touched_entries(tmp_path):
+    detector = DatumRegexDetector()
+    with DetectionCache(tmp_path / "cache.sqlite", SECRET, max_entries=3) as cache:
+        for value in ["a", "b", "c"]:
+            cache.put(detector, cache.fingerprint(value), None)
+
+    with DetectionCache(tmp_path / "cache.sqlite", SECRET, max_entries=3) as cache:
+        statements = []
+        cache._connection.set_trace_callback(statements.append)
+        cache.get(detector, cache.fingerprint("a"))
+        cache.put(detector, cache.fingerprint("d"), Email())
+
+    # "a" and "d" are written, "b" is evicted and "c" is not written again
+    inserts = [sql for sql in statements if sql.startswith("INSERT")]
+    deletes = [sql for sql in statements if sql.startswith("DELETE")]
+    assert len(inserts) == 2
+    assert len(deletes) == 2
+    assert "version !=" in deletes[0]
+    assert "fingerprint =" in deletes[1]
+
+    with DetectionCache(tmp_path / "cache.sqlite", SECRET, max_entries=3) as cache:
+        # LRU order is kept across runs: c, a, d
+        cache.put(detector, cache.fingerprint("e"), None)
+        assert cache.get(detector, cache.fingerprint("c")) == (False, None)
+        assert cache.get(detector, cache.fingerprint("a")) == (True, None)
+        assert cache.get(detector, cache.fingerprint("d")) == (True, Email())
+
+
+def test_cache_write_back_failure_is_logged(mocker, tmp_path):
+    detector = DatumRegexDetector()
+    cache = DetectionCache(tmp_path / "cache.sqlite", SECRET)
+    cache.put(detector, cache.fingerprint("abc"), Email())
+    mocker.patch.object(
+        cache, "_write_back", side_effect=sqlite3.OperationalError("database is locked")
+    )
+    warning = mocker.patch("piicatcher.cache.LOGGER.warning")
+
+    cache.close()
+
+    warning.assert_called_once()
+    with pytest.raises(sqlite3.ProgrammingError):
+        cache._connection.execute("SELECT 1")
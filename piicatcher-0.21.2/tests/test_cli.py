@@ -1,3 +1,5 @@
+import subprocess
+import sys
 from unittest.mock import ANY
 
 from dbcat.catalog import Catalog
@@ -8,7 +10,8 @@ import piicatcher
 import piicatcher.command_line
 from piicatcher.api import OutputFormat, ScanTypeEnum
 from piicatcher.command_line import app
-from piicatcher.generators import SMALL_TABLE_MAX
+from piicatcher.dbinfo import SampleMethod
+from piicatcher.generators import ADAPTIVE_SAMPLE_MAX, SMALL_TABLE_MAX
 
 
 def case_sqlite_cli():
@@ -17,7 +20,7 @@ def case_sqlite_cli():
 
 @parametrize_with_cases("args", cases=".")
 def test_cli(mocker, temp_sqlite_path, args):
-    mocker.patch("piicatcher.command_line.scan_database")
+    mocker.patch("piicatcher.api.scan_database")
     mocker.patch.object(Catalog, "get_source")
     mocker.patch("piicatcher.command_line.str_output")
 
@@ -26,14 +29,14 @@ def test_cli(mocker, temp_sqlite_path, args):
     result = runner.invoke(app, catalog_args + args)
     print(result.stdout)
     assert result.exit_code == 0
-    piicatcher.command_line.scan_database.assert_called_once()
+    piicatcher.api.scan_database.assert_called_once()
     piicatcher.command_line.str_output.assert_called_once()
     Catalog.get_source.assert_called_once_with("db_cli")
 
 
 @parametrize_with_cases("args", cases=".")
 def test_include_exclude(mocker, temp_sqlite_path, args):
-    mocker.patch("piicatcher.command_line.scan_database")
+    mocker.patch("piicatcher.api.scan_database")
     mocker.patch.object(Catalog, "get_source")
     mocker.patch("piicatcher.command_line.str_output")
 
@@ -54,7 +57,7 @@ def test_include_exclude(mocker, temp_sqlite_path, args):
 
     print(result.stdout)
     assert result.exit_code == 0
-    piicatcher.command_line.scan_database.assert_called_once_with(
+    piicatcher.api.scan_database.assert_called_once_with(
         catalog=ANY,
         source=ANY,
         scan_type=ScanTypeEnum.metadata,
@@ -66,6 +69,14 @@ def test_include_exclude(mocker, temp_sqlite_path, args):
         include_schema_regex=["ischema",],
         include_table_regex=["itable",],
         sample_size=SMALL_TABLE_MAX,
+        sample_method=SampleMethod.row,
+        adaptive_sampling=False,
+        max_sample_size=ADAPTIVE_SAMPLE_MAX,
+        regex_pushdown=False,
+        incremental_data=False,
+        detection_cache=None,
+        detection_cache_secret=None,
+        metadata_freshness=None,
     )
     piicatcher.command_line.str_output.assert_called_once()
     Catalog.get_source.assert_called_once_with("db_cli")
@@ -73,7 +84,7 @@ def test_include_exclude(mocker, temp_sqlite_path, args):
 
 @parametrize_with_cases("args", cases=".")
 def test_multiple_include_exclude(mocker, temp_sqlite_path, args):
-    mocker.patch("piicatcher.command_line.scan_database")
+    mocker.patch("piicatcher.api.scan_database")
     mocker.patch.object(Catalog, "get_source")
     mocker.patch("piicatcher.command_line.str_output")
 
@@ -102,7 +113,7 @@ def test_multiple_include_exclude(mocker, temp_sqlite_path, args):
 
     print(result.stdout)
     assert result.exit_code == 0
-    piicatcher.command_line.scan_database.assert_called_once_with(
+    piicatcher.api.scan_database.assert_called_once_with(
         catalog=ANY,
         source=ANY,
         scan_type=ScanTypeEnum.metadata,
@@ -114,6 +125,14 @@ def test_multiple_include_exclude(mocker, temp_sqlite_path, args):
         include_schema_regex=["ischema_1", "ischema_2"],
         include_table_regex=["itable_1", "itable_2"],
         sample_size=SMALL_TABLE_MAX,
+        sample_method=SampleMethod.row,
+        adaptive_sampling=False,
+        max_sample_size=ADAPTIVE_SAMPLE_MAX,
+        regex_pushdown=False,
+        incremental_data=False,
+        detection_cache=None,
+        detection_cache_secret=None,
+        metadata_freshness=None,
     )
     piicatcher.command_line.str_output.assert_called_once()
     Catalog.get_source.assert_called_once_with("db_cli")
@@ -121,7 +140,7 @@ def test_multiple_include_exclude(mocker, temp_sqlite_path, args):
 
 @parametrize_with_cases("args", cases=".")
 def test_sample_size(mocker, temp_sqlite_path, args):
-    mocker.patch("piicatcher.command_line.scan_database")
+    mocker.patch("piicatcher.api.scan_database")
     mocker.patch.object(Catalog, "get_source")
     mocker.patch("piicatcher.command_line.str_output")
 
@@ -136,7 +155,7 @@ def test_sample_size(mocker, temp_sqlite_path, args):
 
     print(result.stdout)
     assert result.exit_code == 0
-    piicatcher.command_line.scan_database.assert_called_once_with(
+    piicatcher.api.scan_database.assert_called_once_with(
         catalog=ANY,
         source=ANY,
         scan_type=ScanTypeEnum.metadata,
@@ -148,6 +167,116 @@ def test_sample_size(mocker, temp_sqlite_path, args):
         include_schema_regex=[],
         include_table_regex=[],
         sample_size=10,
+        sample_method=SampleMethod.row,
+        adaptive_sampling=False,
+        max_sample_size=ADAPTIVE_SAMPLE_MAX,
+        regex_pushdown=False,
+        incremental_data=False,
+        detection_cache=None,
+        detection_cache_secret=None,
+        metadata_freshness=None,
     )
     piicatcher.command_line.str_output.assert_called_once()
     Catalog.get_source.assert_called_once_with("db_cli")
+
+
+@parametrize_with_cases("args", cases=".")
+def test_metadata_freshness(mocker, temp_sqlite_path, args):
+    mocker.patch("piicatcher.api.scan_database")
+    mocker.patch.object(Catalog, "get_source")
+    mocker.patch("piicatcher.command_line.str_output")
+
+    extended_args = args + [
+        "--metadata-freshness",
+        "3600",
+    ]
+
+    catalog_args = ["--catalog-path", temp_sqlite_path]
+    runner = CliRunner()
+    result = runner.invoke(app, catalog_args + extended_args)
+
+    print(result.stdout)
+    assert result.exit_code == 0
+    piicatcher.api.scan_database.assert_called_once_with(
+        catalog=ANY,
+        source=ANY,
+        scan_type=ScanTypeEnum.metadata,
+        incremental=True,
+        output_format=OutputFormat.tabular,
+        list_all=False,
+        exclude_schema_regex=[],
+        exclude_table_regex=[],
+        include_schema_regex=[],
+        include_table_regex=[],
+        sample_size=SMALL_TABLE_MAX,
+        sample_method=SampleMethod.row,
+        adaptive_sampling=False,
+        max_sample_size=ADAPTIVE_SAMPLE_MAX,
+        regex_pushdown=False,
+        incremental_data=False,
+        detection_cache=None,
+        detection_cache_secret=None,
+        metadata_freshness=3600,
+    )
+
+
+@parametrize_with_cases("args", cases=".")
+def test_detection_cache_requires_secret(mocker, temp_sqlite_path, args):
+    mocker.patch("piicatcher.api.scan_database")
+    mocker.patch.object(Catalog, "get_source")
+    mocker.patch("piicatcher.command_line.str_output")
+
+    catalog_args = ["--catalog-path", temp_sqlite_path]
+    runner = CliRunner()
+    result = runner.invoke(app, catalog_args + args + ["--detection-cache"])
+    assert result.exit_code != 0
+    piicatcher.api.scan_database.assert_not_called()
+
+    result = runner.invoke(
+        app,
+        catalog_args + args + ["--detection-cache"],
+        env={"PIICATCHER_DETECTION_CACHE_SECRET": "s3cret"},
+    )
+    assert result.exit_code == 0
+    _, kwargs = piicatcher.api.scan_database.call_args
+    assert kwargs["detection_cache"].name == "detection_cache.sqlite"
+    assert kwargs["detection_cache_secret"] == "s3cret"
+
+
+def test_startup_imports():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, piicatcher.command_line; print('\\n'.join(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = set(result.stdout.splitlines())
+
+    assert "piicatcher.command_line" in modules
+    for module in [
+        "dbcat.api",
+        "dbcat.cli",
+        "dbcat.generators",
+        "piicatcher.api",
+        "piicatcher.cache",
+        "piicatcher.generators",
+        "piicatcher.scanner",
+        "tqdm",
+        "tabulate",
+    ]:
+        assert module not in modules
+
+
+def test_catalog_commands():
+    runner = CliRunner()
+    result = runner.invoke(app, ["--help"])
+    assert result.exit_code == 0
+    assert "catalog" in result.stdout
+
+    result = runner.invoke(app, ["catalog", "--help"])
+    assert result.exit_code == 0
+    assert "scan" in result.stdout
@@ -4,8 +4,16 @@ import pytest
 from dbcat.catalog import Catalog, CatColumn, CatSchema, CatSource, CatTable
 from sqlalchemy import create_engine
 
-from piicatcher.dbinfo import get_dbinfo
+from piicatcher import metrics
+from piicatcher.dbinfo import (
+    SampleMethod,
+    get_dbinfo,
+    portable_regex,
+    supports_regex_pushdown,
+)
 from piicatcher.generators import (
+    _adaptive_row_generator,
+    _get_dbinfo,
     _get_query,
     _get_table_count,
     _row_generator,
@@ -282,6 +290,151 @@ def test_get_sample_query_athena(mocker, source_type, expected_query):
     assert query == expected_query
 
 
+@pytest.mark.parametrize(
+    ("source_type", "expected_query"),
+    [
+        (
+            "postgresql",
+            'SELECT "column" FROM public.table TABLESAMPLE SYSTEM (4) LIMIT 10',
+        ),
+        (
+            "redshift",
+            'SELECT "column" FROM public.table WHERE RANDOM() < 4 / 100.0 LIMIT 10',
+        ),
+        (
+            "athena",
+            'SELECT "column" FROM public.table TABLESAMPLE SYSTEM (4) LIMIT 10',
+        ),
+        ("snowflake", "SELECT column FROM public.table SAMPLE BLOCK (4) LIMIT 10"),
+        (
+            "bigquery",
+            "SELECT column FROM project.public.table TABLESAMPLE SYSTEM (4 PERCENT) LIMIT 10",
+        ),
+        (
+            "sqlite",
+            'select "column" from table where rowid > '
+            "(select abs(random()) % max(max(rowid) - 10, 1) from table) limit 10",
+        ),
+        ("mysql", "select `column` from public.table limit 10"),
+    ],
+)
+def test_get_block_sample_query(mocker, source_type, expected_query):
+    source = CatSource(name="src", project_id="project", source_type=source_type)
+    schema = CatSchema(source=source, name="public")
+    table = CatTable(schema=schema, name="table")
+    column = CatColumn(table=table, name="column")
+
+    mocker.patch("piicatcher.generators._get_table_count", return_value=1000)
+    query = _get_query(
+        schema=schema,
+        table=table,
+        column_list=[column],
+        dbinfo=_get_dbinfo(source, schema, table),
+        connection=None,
+        sample_size=10,
+        source=source,
+        sample_method=SampleMethod.block,
+    )
+
+    assert query == expected_query
+
+
+def test_block_sample_sqlite(sqlalchemy_engine):
+    catalog, source, conn = sqlalchemy_engine
+    if source.source_type != "sqlite":
+        pytest.skip("rowid sampling is specific to sqlite")
+
+    schemata = catalog.search_schema(source_like=source.name, schema_like="%")
+    table = catalog.get_table(
+        source_name=source.name, schema_name=schemata[0].name, table_name="full_pii"
+    )
+    dbinfo = get_dbinfo(source.source_type, schemata[0], table)
+    rows = conn.execute(
+        dbinfo.get_block_sample_query(["name", "state"], 1, 2)
+    ).fetchall()
+
+    assert len(rows) == 1
+
+
+@pytest.mark.parametrize(
+    ("source_type", "expected_query"),
+    [
+        (
+            "postgresql",
+            "SELECT SUM(CASE WHEN \"column\" ~ '[0-9]{5}' THEN 1 ELSE 0 END),"
+            "SUM(CASE WHEN \"column\" ~ 'it''s' THEN 1 ELSE 0 END) "
+            "FROM (select \"column\" from public.table) sample",
+        ),
+        (
+            "snowflake",
+            "SELECT SUM(CASE WHEN REGEXP_LIKE(column, $$.*([0-9]{5}).*$$, 's') THEN 1 ELSE 0 END),"
+            "SUM(CASE WHEN REGEXP_LIKE(column, $$.*(it's).*$$, 's') THEN 1 ELSE 0 END) "
+            "FROM (select \"column\" from public.table) sample",
+        ),
+    ],
+)
+def test_get_regex_count_query(source_type, expected_query):
+    source = CatSource(name="src", source_type=source_type)
+    schema = CatSchema(source=source, name="public")
+    table = CatTable(schema=schema, name="table")
+
+    dbinfo = get_dbinfo(source.source_type, schema, table)
+    query = dbinfo.get_regex_count_query(
+        ["column"], ["[0-9]{5}", "it's"], dbinfo.get_select_query(["column"])
+    )
+
+    assert query == expected_query
+
+
+def test_get_regex_count_query_bigquery():
+    source = CatSource(name="src", source_type="bigquery")
+    schema = CatSchema(source=source, name="dataset")
+    table = CatTable(schema=schema, name="table")
+
+    dbinfo = get_dbinfo(source.source_type, schema, table, project_id="project")
+    query = dbinfo.get_regex_count_query(
+        ["column"], ["[0-9]{5}"], dbinfo.get_sample_query(["column"], 10)
+    )
+
+    assert query == (
+        "SELECT SUM(CASE WHEN REGEXP_CONTAINS(column, r'[0-9]{5}') THEN 1 ELSE 0 END) "
+        "FROM (SELECT column FROM project.dataset.table ORDER BY RAND() LIMIT 10) sample"
+    )
+
+
+def test_get_regex_count_query_sqlite():
+    source = CatSource(name="src", source_type="sqlite")
+    schema = CatSchema(source=source, name="main")
+    table = CatTable(schema=schema, name="table")
+
+    dbinfo = get_dbinfo(source.source_type, schema, table)
+    assert not supports_regex_pushdown(source.source_type)
+    with pytest.raises(NotImplementedError):
+        dbinfo.get_regex_count_query(["column"], ["[0-9]{5}"], "select 1")
+
+
+@pytest.mark.parametrize(
+    ("pattern", "expected"),
+    [
+        (r"\d{3}-\d{4}", "[0-9]{3}-[0-9]{4}"),
+        (r"(?:ab|cd)\.", r"(ab|cd)\."),
+        (r"(?i)P\.? ?O\.? Box", r"[pP]\.? ?[oO]\.? [bB][oO][xX]"),
+        (r"(?i)[a-z]+@x", "[a-zA-Z]+@[xX]"),
+        (r"(?<![\d-])\d{4}(?![\d-])", "(^|[^0-9-])[0-9]{4}([^0-9-]|$)"),
+        (r"\bx\b", "(^|[^a-zA-Z0-9_])x([^a-zA-Z0-9_]|$)"),
+        (r"st(?=\s|$)", "st([ \t\n\r\x0b\x0c]|$)"),
+    ],
+)
+def test_portable_regex(pattern, expected):
+    assert portable_regex(pattern) == expected
+
+
+@pytest.mark.parametrize("pattern", [r"(?<=a)b", r"a(?!bc)", r"(?P<x>a)", r"\Ba"])
+def test_portable_regex_unsupported(pattern):
+    with pytest.raises(ValueError):
+        portable_regex(pattern)
+
+
 def test_row_generator(sqlalchemy_engine):
     catalog, source, conn = sqlalchemy_engine
     schemata = catalog.search_schema(source_like=source.name, schema_like="%")
@@ -313,6 +466,125 @@ def test_data_generator(sqlalchemy_engine):
     assert count == 14
 
 
+def test_data_generator_adaptive(sqlalchemy_engine):
+    catalog, source, conn = sqlalchemy_engine
+
+    count = 0
+    for tpl in data_generator(catalog=catalog, source=source, adaptive=True):
+        count += 1
+
+    assert count == 14
+
+
+def test_data_generator_adaptive_labeled(sqlalchemy_engine):
+    catalog, source, conn = sqlalchemy_engine
+
+    labeled_columns = set()
+    count = 0
+    for schema, table, column, val in data_generator(
+        catalog=catalog, source=source, adaptive=True, labeled_columns=labeled_columns
+    ):
+        count += 1
+        labeled_columns.add(column.id)
+
+    # Every column is labeled after its first value and is not sampled again
+    assert count == 7
+
+
+def test_adaptive_row_generator_sample_query(mocker, sqlalchemy_engine):
+    catalog, source, conn = sqlalchemy_engine
+    schemata = catalog.search_schema(source_like=source.name, schema_like="%")
+    table = catalog.get_table(
+        source_name=source.name, schema_name=schemata[0].name, table_name="full_pii"
+    )
+    execute = mocker.spy(metrics, "execute")
+
+    values = list(
+        _adaptive_row_generator(
+            source=source,
+            schema=schemata[0],
+            table=table,
+            column_list=catalog.get_columns_for_table(table),
+            labeled_columns=set(),
+            max_sample_size=1,
+            sample_method=SampleMethod.block,
+        )
+    )
+
+    assert len(values) == 2
+    row_queries = [call for call in execute.call_args_list if call.args[2] == "rows"]
+    assert len(row_queries) == 1
+    assert "limit 1" in row_queries[0].args[1]
+
+
+@pytest.fixture
+def adaptive_table(tmp_path):
+    def create(values):
+        path = tmp_path / "adaptive.db"
+        engine = create_engine("sqlite:///{}".format(path))
+        with engine.begin() as conn:
+            conn.execute("create table adaptive (value text)")
+            conn.execute(
+                "insert into adaptive (value) values (?)", [(v,) for v in values]
+            )
+
+        source = CatSource(name="adaptive", source_type="sqlite", uri=str(path))
+        schema = CatSchema(source=source, name="main")
+        table = CatTable(schema=schema, name="adaptive")
+        column = CatColumn(id=1, table=table, name="value")
+        return source, schema, table, column
+
+    return create
+
+
+def test_adaptive_row_generator_clean_table(mocker, adaptive_table):
+    source, schema, table, column = adaptive_table(["clean"] * 500)
+    execute = mocker.spy(metrics, "execute")
+
+    values = list(
+        _adaptive_row_generator(
+            source=source,
+            schema=schema,
+            table=table,
+            column_list=[column],
+            labeled_columns=set(),
+        )
+    )
+
+    # 60 values bound the PII rate below 5% and are fetched in the first round
+    assert len(values) == 60
+    row_queries = [call for call in execute.call_args_list if call.args[2] == "rows"]
+    assert len(row_queries) == 1
+    assert "limit 60 offset 0" in row_queries[0].args[1]
+
+
+def test_adaptive_row_generator_sparse_column(mocker, adaptive_table):
+    source, schema, table, column = adaptive_table(
+        ["clean" if i % 10 == 0 else None for i in range(500)]
+    )
+    execute = mocker.spy(metrics, "execute")
+
+    values = list(
+        _adaptive_row_generator(
+            source=source,
+            schema=schema,
+            table=table,
+            column_list=[column],
+            labeled_columns=set(),
+        )
+    )
+
+    # 50 non-null values in the table are not enough to decide the column
+    assert len(values) == 500
+    assert len([val for col, val in values if val is not None]) == 50
+    row_queries = [call for call in execute.call_args_list if call.args[2] == "rows"]
+    assert [call.args[1] for call in row_queries] == [
+        'select "value" from adaptive limit 60 offset 0',
+        'select "value" from adaptive limit 180 offset 60',
+        'select "value" from adaptive limit 540 offset 240',
+    ]
+
+
 def test_data_generator_include_schema(load_source):
     catalog, source = load_source
     schemata = catalog.search_schema(source_like=source.name, schema_like="%")
@@ -373,3 +645,56 @@ def test_data_generator_include_int_table(load_source):
         count += 1
 
     assert count == 2
+
+
+def test_data_generator_incremental(load_source):
+    catalog, source = load_source
+
+    watermarks = {}
+    count = 0
+    for tpl in data_generator(
+        catalog=catalog,
+        source=source,
+        include_table_regex_str=["partial_data_type"],
+        watermarks=watermarks,
+    ):
+        count += 1
+
+    assert count == 2
+    assert list(watermarks.values()) == [{"column": "id", "value": 2}]
+
+    count = 0
+    for tpl in data_generator(
+        catalog=catalog,
+        source=source,
+        include_table_regex_str=["partial_data_type"],
+        watermarks=watermarks,
+    ):
+        count += 1
+
+    # No new rows since the last scan
+    assert count == 0
+
+
+@pytest.mark.parametrize(
+    ("source_type", "expected_query"),
+    [
+        (
+            "postgresql",
+            'select "column" from public.table where "id" > :watermark limit 10',
+        ),
+        ("mysql", "select `column` from public.table where `id` > :watermark limit 10"),
+        ("sqlite", 'select "column" from table where "id" > :watermark limit 10'),
+        (
+            "bigquery",
+            "SELECT column FROM project.public.table where id > :watermark limit 10",
+        ),
+    ],
+)
+def test_get_incremental_query(source_type, expected_query):
+    source = CatSource(name="src", project_id="project", source_type=source_type)
+    schema = CatSchema(source=source, name="public")
+    table = CatTable(schema=schema, name="table")
+
+    dbinfo = _get_dbinfo(source, schema, table)
+    assert dbinfo.get_incremental_query(["column"], "id", 10) == expected_query
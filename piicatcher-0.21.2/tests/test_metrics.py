@@ -0,0 +1,52 @@
+from piicatcher import metrics
+
+
+class FakeConnection:
+    def execute(self, query):
+        return query
+
+
+def test_collect():
+    assert metrics.current() is None
+    with metrics.collect() as scan_metrics:
+        assert metrics.current() is scan_metrics
+        with metrics.phase("data_scan"):
+            assert metrics.execute(FakeConnection(), "select 1", "count", "s.t") == (
+                "select 1"
+            )
+        scan_metrics.add_rows("s.t", [("abc", None), ("de", 12)], 0.5)
+        scan_metrics.add_detector("DatumRegexDetector", 0.25)
+        scan_metrics.add_detector("DatumRegexDetector", 0.25)
+
+    assert metrics.current() is None
+
+    result = scan_metrics.to_dict()
+    assert "data_scan" in result["phases"]
+    assert result["queries"]["count"]["count"] == 1
+    assert sum(result["queries"]["count"]["buckets"].values()) == 1
+    assert result["tables"]["s.t"]["rows"] == 2
+    assert result["tables"]["s.t"]["bytes"] == 7
+    assert result["tables"]["s.t"]["rows_per_second"] > 0
+    assert result["detectors"] == {
+        "DatumRegexDetector": {"seconds": 0.5, "calls": 2}
+    }
+
+
+def test_latency_histogram():
+    scan_metrics = metrics.ScanMetrics()
+    for seconds in [0.0005, 0.002, 0.002, 20]:
+        scan_metrics.add_query("rows", "s.t", seconds)
+
+    histogram = scan_metrics.to_dict()["queries"]["rows"]
+    assert histogram["count"] == 4
+    assert histogram["max_seconds"] == 20
+    assert histogram["buckets"]["le_1ms"] == 1
+    assert histogram["buckets"]["le_5ms"] == 2
+    assert histogram["buckets"]["gt_10000ms"] == 1
+
+
+def test_no_collector():
+    with metrics.phase("data_scan"):
+        assert metrics.execute(FakeConnection(), "select 1", "count", "s.t") == (
+            "select 1"
+        )
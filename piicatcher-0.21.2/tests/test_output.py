@@ -1,5 +1,15 @@
-from piicatcher.api import scan_database
-from piicatcher.output import output_dict, output_tabular
+import csv
+import io
+import json
+
+from piicatcher.api import OutputFormat, scan_database
+from piicatcher.output import (
+    output_csv,
+    output_dict,
+    output_json_stream,
+    output_ndjson,
+    output_tabular,
+)
 
 mysql_output_all = {
     "name": "mysql_src",
@@ -507,3 +517,65 @@ def test_output_tabular_all(load_data_and_pull):
             assert result == pg_output_tabular_all
         elif source.source_type == "sqlite":
             assert result == sqlite_output_tabular_all
+
+
+def test_output_json_stream(load_data_and_pull):
+    catalog, source_id = load_data_and_pull
+    with catalog.managed_session:
+        source = catalog.get_source_by_id(source_id)
+        scan_database(catalog=catalog, source=source)
+
+        for list_all in [True, False]:
+            stream = io.StringIO()
+            output_json_stream(
+                catalog=catalog, source=source, stream=stream, list_all=list_all
+            )
+            assert json.loads(stream.getvalue()) == output_dict(
+                catalog=catalog, source=source, list_all=list_all
+            )
+
+
+def test_output_ndjson(load_data_and_pull):
+    catalog, source_id = load_data_and_pull
+    with catalog.managed_session:
+        source = catalog.get_source_by_id(source_id)
+        scan_database(catalog=catalog, source=source)
+
+        stream = io.StringIO()
+        output_ndjson(catalog=catalog, source=source, stream=stream, list_all=True)
+        rows = [json.loads(line) for line in stream.getvalue().splitlines()]
+
+        expected = output_tabular(catalog=catalog, source=source, list_all=True)
+        assert [
+            [r["schema"], r["table"], r["name"], r["pii_type"], r["pii_plugin"]]
+            for r in rows
+        ] == expected
+
+
+def test_output_csv(load_data_and_pull):
+    catalog, source_id = load_data_and_pull
+    with catalog.managed_session:
+        source = catalog.get_source_by_id(source_id)
+        stream = io.StringIO()
+        scan_database(
+            catalog=catalog,
+            source=source,
+            incremental=False,
+            output_format=OutputFormat.csv,
+            output_stream=stream,
+        )
+
+        rows = list(csv.reader(io.StringIO(stream.getvalue())))
+        assert rows[0] == ["schema", "table", "column", "PII Type", "Scanner"]
+        assert rows[1:] == [
+            [col if col is not None else "" for col in row]
+            for row in output_tabular(catalog=catalog, source=source)
+        ]
+
+        stream = io.StringIO()
+        output_csv(catalog=catalog, source=source, stream=stream, list_all=True)
+        rows = list(csv.reader(io.StringIO(stream.getvalue())))
+        assert rows[1:] == [
+            [col if col is not None else "" for col in row]
+            for row in output_tabular(catalog=catalog, source=source, list_all=True)
+        ]
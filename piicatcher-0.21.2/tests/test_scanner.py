@@ -1,6 +1,8 @@
+import re
 from unittest.mock import patch
 
 import pytest
+from sqlalchemy import inspect
 
 from piicatcher import (
     SSN,
@@ -17,15 +19,24 @@ from piicatcher import (
     UserName,
     ZipCode,
 )
+from piicatcher.cache import DetectionCache
+from piicatcher.dbinfo import portable_regex
 from piicatcher.generators import column_generator, data_generator
 from piicatcher.scanner import (
     ColumnNameRegexDetector,
     DatumRegexDetector,
+    LabelWriter,
     data_scan,
     metadata_scan,
+    pushdown_scan,
 )
 
 
+class PooledRegexDetector(DatumRegexDetector):
+    name = "PooledRegexDetector"
+    run_in_pool = True
+
+
 @pytest.mark.parametrize(
     "text",
     [
@@ -246,6 +257,34 @@ def test_column_name(name, expected):
         assert detector.detect(instance) == expected
 
 
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("username", Person()),
+        ("user_email", Email()),
+        ("home_phone_city", Address()),
+        ("mailing_zip", Email()),
+        ("created_at", None),
+    ],
+)
+def test_column_name_priority(name, expected):
+    with patch("piicatcher.scanner.CatColumn") as mocked:
+        instance = mocked.return_value
+        instance.name = name
+        detector = ColumnNameRegexDetector()
+        assert detector.detect(instance) == expected
+
+
+def test_column_name_cache():
+    with patch("piicatcher.scanner.CatColumn") as mocked:
+        instance = mocked.return_value
+        instance.name = "email"
+        detector = ColumnNameRegexDetector()
+        assert detector.detect(instance) == Email()
+        assert detector.detect(instance) == Email()
+        assert detector._cache == {"email": Email}
+
+
 def test_shallow_scan(load_data_and_pull):
     catalog, source_id = load_data_and_pull
     with catalog.managed_session:
@@ -253,7 +292,6 @@ def test_shallow_scan(load_data_and_pull):
         metadata_scan(
             catalog=catalog,
             detectors=[ColumnNameRegexDetector()],
-            work_generator=column_generator(catalog=catalog, source=source),
             generator=column_generator(catalog=catalog, source=source),
         )
 
@@ -282,7 +320,7 @@ def test_deep_scan(load_data_and_pull):
         data_scan(
             catalog=catalog,
             detectors=[DatumRegexDetector()],
-            work_generator=column_generator(catalog=catalog, source=source),
+            columns=column_generator(catalog=catalog, source=source),
             generator=data_generator(catalog=catalog, source=source),
         )
 
@@ -294,3 +332,216 @@ def test_deep_scan(load_data_and_pull):
             column_name="a",
         )
         assert state.pii_type == Phone()
+
+
+def test_deep_scan_skips_labeled_columns(load_data_and_pull):
+    class CountingDetector(DatumRegexDetector):
+        name = "CountingDetector"
+
+        def __init__(self):
+            self.columns = []
+
+        def detect(self, column, datum):
+            self.columns.append(column.fqdn)
+            return Phone()
+
+    detector = CountingDetector()
+    catalog, source_id = load_data_and_pull
+    with catalog.managed_session:
+        source = catalog.get_source_by_id(source_id)
+        data_scan(
+            catalog=catalog,
+            detectors=[detector],
+            columns=column_generator(catalog=catalog, source=source),
+            generator=data_generator(catalog=catalog, source=source),
+        )
+
+    assert len(detector.columns) > 0
+    assert len(detector.columns) == len(set(detector.columns))
+
+
+def test_label_writer(load_data_and_pull):
+    catalog, source_id = load_data_and_pull
+    with catalog.managed_session:
+        source = catalog.get_source_by_id(source_id)
+        columns = [
+            column
+            for schema, table, column in column_generator(
+                catalog=catalog, source=source, include_table_regex_str=["no_pii"]
+            )
+        ]
+
+        with LabelWriter(catalog, flush_size=1) as writer:
+            writer.add(column=columns[0], pii_type=Email(), pii_plugin="test")
+            assert columns[0].pii_type == Email()
+            writer.add(column=columns[1], pii_type=Phone(), pii_plugin="test")
+
+        assert columns[1].pii_type == Phone()
+        assert columns[1].pii_plugin == "test"
+
+        with LabelWriter(catalog) as writer:
+            for column in columns:
+                writer.add(column=column, pii_type=None, pii_plugin=None)
+            assert columns[0].pii_type == Email()
+
+        assert columns[0].pii_type is None
+        assert columns[1].pii_type is None
+
+
+def test_label_writer_keeps_session_state(load_data_and_pull):
+    catalog, source_id = load_data_and_pull
+    with catalog.managed_session as session:
+        source = catalog.get_source_by_id(source_id)
+        columns = [
+            column
+            for schema, table, column in column_generator(
+                catalog=catalog, source=source, include_table_regex_str=["no_pii"]
+            )
+        ]
+
+        with patch.object(session, "commit") as commit:
+            with LabelWriter(catalog, flush_size=1) as writer:
+                writer.add(column=columns[0], pii_type=Email(), pii_plugin="test")
+            commit.assert_not_called()
+
+        assert inspect(columns[0]).expired_attributes == {"pii_type", "pii_plugin"}
+        assert inspect(columns[1]).expired_attributes == set()
+        assert columns[0].pii_type == Email()
+
+        with LabelWriter(catalog) as writer:
+            writer.add(column=columns[0], pii_type=None, pii_plugin=None)
+
+
+def test_deep_scan_pool(load_data_and_pull):
+    catalog, source_id = load_data_and_pull
+    with catalog.managed_session:
+        source = catalog.get_source_by_id(source_id)
+        data_scan(
+            catalog=catalog,
+            detectors=[PooledRegexDetector()],
+            columns=column_generator(catalog=catalog, source=source),
+            generator=data_generator(catalog=catalog, source=source),
+            pool_size=2,
+        )
+
+        schemata = catalog.search_schema(source_like=source.name, schema_like="%")
+        column = catalog.get_column(
+            source_name=source.name,
+            schema_name=schemata[0].name,
+            table_name="partial_pii",
+            column_name="a",
+        )
+        assert column.pii_type == Phone()
+        assert column.pii_plugin == "PooledRegexDetector"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "234-567-8900",
+        "2345678900",
+        "(123) 456 7890",
+        "+41 22 730 5989",
+        "1-234-567-8900",
+        "John.Smith@gmail.com",
+        "JOHN@EXAMPLE.NET",
+        "4111 1111 1111 1111",
+        "4111-1111-1111-1111",
+        "123 Main Street",
+        "504 parkwood drive",
+        "checkout the new place at 101 main st.",
+        "SSN 000-00-1111",
+        "Richmond, VA 23220",
+        "23220-1234",
+        "23220 1234",
+        "P.O. Box 123",
+        "PO Box 9",
+        "order 123456",
+        "no pii here",
+    ],
+)
+def test_datum_regex_pushdown_patterns(text):
+    # The database labels a value with the first pattern that matches, which
+    # has to be the label detect() returns for the same value.
+    found = None
+    for pii_type, pattern in DatumRegexDetector.pushdown_patterns.items():
+        if re.search(portable_regex(pattern), text):
+            found = pii_type()
+            break
+    assert found == DatumRegexDetector().detect(column=None, datum=text)
+
+
+def test_pushdown_scan(load_data_and_pull):
+    catalog, source_id = load_data_and_pull
+    detector = DatumRegexDetector()
+    with catalog.managed_session:
+        source = catalog.get_source_by_id(source_id)
+        columns = list(
+            column_generator(
+                catalog=catalog, source=source, include_table_regex_str=["partial_pii"]
+            )
+        )
+        num_patterns = len(detector.pushdown_patterns)
+        # Earlier tests in this module label the same columns
+        for schema, table, column in columns:
+            catalog.set_column_pii_type(column=column, pii_type=None, pii_plugin=None)
+
+        labeled_columns = set()
+        pushdown_scan(
+            catalog=catalog,
+            detectors=[detector],
+            generator=[
+                (
+                    schema,
+                    table,
+                    column,
+                    [2] + [0] * (num_patterns - 1)
+                    if column.name == "a"
+                    else [0] * num_patterns,
+                )
+                for schema, table, column in columns
+            ],
+            labeled_columns=labeled_columns,
+        )
+
+        for schema, table, column in columns:
+            if column.name == "a":
+                assert column.pii_type == Phone()
+                assert column.pii_plugin == "DatumRegexDetector"
+                assert labeled_columns == {column.id}
+            else:
+                assert column.pii_type is None
+
+
+def test_deep_scan_cache(load_data_and_pull, tmp_path):
+    class CountingDetector(DatumRegexDetector):
+        name = "CountingDetector"
+
+        def __init__(self):
+            self.calls = 0
+
+        def detect(self, column, datum):
+            self.calls += 1
+            return None
+
+    catalog, source_id = load_data_and_pull
+    for run in range(2):
+        detector = CountingDetector()
+        with catalog.managed_session, DetectionCache(
+            tmp_path / "cache.sqlite", "s3cret"
+        ) as cache:
+            source = catalog.get_source_by_id(source_id)
+            data_scan(
+                catalog=catalog,
+                detectors=[detector],
+                columns=column_generator(catalog=catalog, source=source),
+                generator=data_generator(catalog=catalog, source=source),
+                cache=cache,
+            )
+
+        if run == 0:
+            assert detector.calls > 0
+            assert cache.misses == detector.calls
+        else:
+            assert detector.calls == 0
+            assert cache.misses == 0
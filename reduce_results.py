@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+汇总各检测器的结果 json, 生成按 (文件, 批次, 实体类型) 展开的列式计数。
+
+使用示例：
+
+python reduce_results.py \
+  --result_dir presidio/results/c4 \
+  --workers 8
+
+结果写入 <result_dir>/summary.npz, 其中:
+  files / file_mtime / file_size / file_completed  每个结果文件一行
+  file_data / file_start / file_end                  结果所属的数据文件和 chunk 的批次区间 (start, end],
+                                                     没有拆分的文件为 -1
+  entities                                           实体类型名
+  file_idx / batch / entity_idx / count              每个 (结果文件, 批次, 实体) 一行
+
+被拆成 chunk 的数据文件有多个结果文件 (<filename>.chunk<start>-<end>.json), 批次号是数据文件内的全局批次号;
+统计文件数和完成情况时按数据文件合并, 所有 chunk 都完成的数据文件才算完成。
+
+再次运行时只重新解析新增或修改过 (mtime/size 变化) 的结果文件, 已删除的文件会被移除。
+"""
+from __future__ import annotations
+import json, os, argparse
+from typing import Dict, List, Tuple
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+from pii_harness.manifest import get_manifest
+from pii_harness.schedule import CHUNK_NAME, chunk_name
+
+SUMMARY_FILE = "summary.npz"
+
+
+def split_result_name(name: str) -> Tuple[str, int, int]:
+    """结果名 -> (数据文件名, chunk 起点, chunk 终点), 没有拆分的文件区间为 (-1, -1)"""
+    m = CHUNK_NAME.match(name)
+    if m is None:
+        return name, -1, -1
+    return m.group("filename"), int(m.group("start")), int(m.group("end"))
+
+
+def parse_result(path: str) -> Tuple[str, bool, List[Tuple[int, str, int]]]:
+    """读取一个结果 json, 返回 (路径, 是否完成, [(批次, 实体, 计数)])"""
+    rows: List[Tuple[int, str, int]] = []
+    try:
+        with open(path, "r", encoding="utf-8") as rf:
+            result_data = json.load(rf)
+    except Exception:
+        # 有时候出错中断后, 会出现json为空的情况
+        return path, False, rows
+    for batch_key, entity2cnt in result_data.get("batches", {}).items():
+        batch = int(batch_key[len("batch_") :])
+        for entity_type, cnt in entity2cnt.items():
+            rows.append((batch, entity_type, int(cnt)))
+    return path, bool(result_data.get("completed", False)), rows
+
+
+def empty_summary() -> Dict[str, np.ndarray]:
+    return {
+        "files": np.array([], dtype=str),
+        "file_mtime": np.array([], dtype=np.float64),
+        "file_size": np.array([], dtype=np.int64),
+        "file_completed": np.array([], dtype=bool),
+        "file_data": np.array([], dtype=str),
+        "file_start": np.array([], dtype=np.int32),
+        "file_end": np.array([], dtype=np.int32),
+        "entities": np.array([], dtype=str),
+        "file_idx": np.array([], dtype=np.int32),
+        "batch": np.array([], dtype=np.int32),
+        "entity_idx": np.array([], dtype=np.int32),
+        "count": np.array([], dtype=np.int64),
+    }
+
+
+def load_summary(path: str) -> Dict[str, np.ndarray]:
+    if not os.path.exists(path):
+        return empty_summary()
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def save_summary(path: str, summary: Dict[str, np.ndarray]) -> None:
+    # 先写临时文件再替换, 避免中断时留下损坏的汇总
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **summary)
+    os.replace(tmp_path, path)
+
+
+def reduce_results(result_dir: str, workers: int) -> Dict[str, np.ndarray]:
+    """增量更新 result_dir 下的汇总并返回"""
+    summary_path = os.path.join(result_dir, SUMMARY_FILE)
+    old = load_summary(summary_path)
+
+    # 当前结果文件的 mtime / size
+    stats: Dict[str, Tuple[float, int]] = {}
+    for file in os.listdir(result_dir):
+        if not file.endswith(".json"):
+            continue
+        st = os.stat(os.path.join(result_dir, file))
+        stats[file[: -len(".json")]] = (st.st_mtime, st.st_size)
+
+    # 未变化的文件直接沿用旧的行
+    keep = np.array(
+        [
+            name in stats and stats[name] == (mtime, size)
+            for name, mtime, size in zip(
+                old["files"], old["file_mtime"], old["file_size"]
+            )
+        ],
+        dtype=bool,
+    )
+    kept_files = old["files"][keep]
+    changed = sorted(set(stats) - set(kept_files.tolist()))
+
+    # 旧文件下标 -> 新文件下标, 丢弃的文件为 -1
+    remap = np.full(len(old["files"]), -1, dtype=np.int32)
+    remap[keep] = np.arange(len(kept_files), dtype=np.int32)
+    row_keep = keep[old["file_idx"]]
+
+    entities: List[str] = old["entities"].tolist()
+    entity2idx = {entity: i for i, entity in enumerate(entities)}
+    files = kept_files.tolist()
+    file_completed = old["file_completed"][keep].tolist()
+    new_file_idx: List[int] = []
+    new_batch: List[int] = []
+    new_entity_idx: List[int] = []
+    new_count: List[int] = []
+
+    if changed:
+        from tqdm import tqdm
+
+        paths = [os.path.join(result_dir, name + ".json") for name in changed]
+        with Pool(processes=workers) as pool:
+            for path, completed, rows in tqdm(
+                pool.imap_unordered(parse_result, paths, chunksize=16),
+                total=len(paths),
+                desc=f"Reducing {result_dir}",
+            ):
+                file_idx = len(files)
+                files.append(os.path.basename(path)[: -len(".json")])
+                file_completed.append(completed)
+                for batch, entity_type, cnt in rows:
+                    if entity_type not in entity2idx:
+                        entity2idx[entity_type] = len(entities)
+                        entities.append(entity_type)
+                    new_file_idx.append(file_idx)
+                    new_batch.append(batch)
+                    new_entity_idx.append(entity2idx[entity_type])
+                    new_count.append(cnt)
+
+    parts = [split_result_name(name) for name in files]
+    summary = {
+        "files": np.array(files, dtype=str),
+        "file_mtime": np.array([stats[name][0] for name in files], dtype=np.float64),
+        "file_size": np.array([stats[name][1] for name in files], dtype=np.int64),
+        "file_completed": np.array(file_completed, dtype=bool),
+        "file_data": np.array([data for data, _, _ in parts], dtype=str),
+        "file_start": np.array([start for _, start, _ in parts], dtype=np.int32),
+        "file_end": np.array([end for _, _, end in parts], dtype=np.int32),
+        "entities": np.array(entities, dtype=str),
+        "file_idx": np.concatenate(
+            [
+                remap[old["file_idx"][row_keep]],
+                np.array(new_file_idx, dtype=np.int32),
+            ]
+        ),
+        "batch": np.concatenate(
+            [old["batch"][row_keep], np.array(new_batch, dtype=np.int32)]
+        ),
+        "entity_idx": np.concatenate(
+            [old["entity_idx"][row_keep], np.array(new_entity_idx, dtype=np.int32)]
+        ),
+        "count": np.concatenate(
+            [old["count"][row_keep], np.array(new_count, dtype=np.int64)]
+        ),
+    }
+    if changed or not keep.all():
+        save_summary(summary_path, summary)
+    dropped = len(set(old["files"].tolist()) - set(stats))
+    print(f"Reused {len(kept_files)} files, parsed {len(changed)}, dropped {dropped}.")
+    return summary
+
+
+def entity_totals(summary: Dict[str, np.ndarray]) -> Dict[str, int]:
+    totals = np.bincount(
+        summary["entity_idx"],
+        weights=summary["count"],
+        minlength=len(summary["entities"]),
+    )
+    return {
+        entity: int(total) for entity, total in zip(summary["entities"], totals)
+    }
+
+
+def data_file_completed(summary: Dict[str, np.ndarray], result_dir: str) -> Dict[str, bool]:
+    """数据文件 -> 是否完成。拆分过的文件要求清单里 chunk 布局的每个 chunk 都已完成;
+    清单里没有布局的旧 chunk 结果只能要求已有的 chunk 都完成且从批次 0 起首尾相接。"""
+    layouts = get_manifest(result_dir).read_chunks()
+    completed = dict(zip(summary["files"].tolist(), summary["file_completed"].tolist()))
+    ranges: Dict[str, List[Tuple[int, int]]] = {}
+    status: Dict[str, bool] = {}
+    for name, data, start, end in zip(
+        summary["files"].tolist(),
+        summary["file_data"].tolist(),
+        summary["file_start"].tolist(),
+        summary["file_end"].tolist(),
+    ):
+        if start < 0:
+            status[data] = completed[name]
+        else:
+            ranges.setdefault(data, []).append((start, end))
+    for data, chunks in ranges.items():
+        if data in layouts:
+            chunks = [(start, end) for start, end, _ in layouts[data]]
+        chunks.sort()
+        contiguous = all(
+            prev[1] == chunk[0] for prev, chunk in zip([(0, 0)] + chunks, chunks)
+        )
+        status[data] = (
+            status.get(data, True)
+            and contiguous
+            and all(
+                completed.get(chunk_name(data, start, end), False)
+                for start, end in chunks
+            )
+        )
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--result_dir",
+        type=str,
+        required=True,
+        help="某个检测器某个数据集的结果目录, 如 presidio/results/c4",
+    )
+    parser.add_argument("--workers", type=int, default=max(cpu_count() - 1, 1))
+    args = parser.parse_args()
+
+    summary = reduce_results(args.result_dir, args.workers)
+
+    totals = entity_totals(summary)
+    status = data_file_completed(summary, args.result_dir)
+    # 同一数据文件的 chunk 共用全局批次号, (数据文件, 批次) 编码成一个 int64 再去重
+    _, data_idx = np.unique(summary["file_data"], return_inverse=True)
+    batch_keys = (data_idx[summary["file_idx"]].astype(np.int64) << 32) | summary["batch"]
+    n_batches = len(np.unique(batch_keys))
+    print(
+        f"Files: {len(status)} "
+        f"(completed {sum(status.values())}, result files {len(summary['files'])}), "
+        f"batches with entities: {n_batches}"
+    )
+    for entity_type, total in sorted(totals.items(), key=lambda kv: -kv[1]):
+        print(f"  {entity_type}: {total}")
+
+
+if __name__ == "__main__":
+    main()